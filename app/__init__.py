@@ -1,10 +1,24 @@
 from flask import Flask
 from app.extensions import db, login_manager, csrf
+from app.utils.sqlite_tuning import engine_options
+from app.utils.uploads import ChainPortRequest
 import os
+import time
 
 
 def create_app():
+    started = time.perf_counter()
+    timings = {}
+    mark = started
+
+    def phase(name):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[name] = round((now - mark) * 1000, 2)
+        mark = now
+
     app = Flask(__name__)
+    app.request_class = ChainPortRequest
 
     # Configuration
     debug_env = os.environ.get("FLASK_DEBUG") == "1"
@@ -20,33 +34,147 @@ def create_app():
         os.environ.get("DATABASE_URL") or "sqlite:///chainport.db"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Pragmas applied to every SQLite connection: "production" (WAL,
+    # synchronous=NORMAL, busy_timeout, mmap/cache sizes) or "default"
+    app.config["SQLITE_PROFILE"] = os.environ.get("SQLITE_PROFILE", "production")
+    # Connection pool per engine; size it to the worker's thread count
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 16))
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 16))
+    app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"],
+        app.config["DB_POOL_SIZE"],
+        app.config["DB_MAX_OVERFLOW"],
+        app.config["DB_POOL_TIMEOUT"],
+    )
+    # Comma-separated read replicas of DATABASE_URL; GET requests read from
+    # them (see app.utils.read_replicas)
+    app.config["SQLALCHEMY_REPLICA_URIS"] = [
+        uri.strip() for uri in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if uri.strip()
+    ]
+    app.config["REPLICA_STICKY_SECONDS"] = float(os.environ.get("REPLICA_STICKY_SECONDS", 10))
     app.config["UPLOAD_FOLDER"] = os.path.join(app.instance_path, "uploads")
     app.config["MESSAGE_UPLOAD_FOLDER"] = os.path.join(
         app.instance_path, "uploads", "messages"
     )
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
     app.config["MESSAGE_ATTACHMENT_LIMIT"] = 5
+    # Uploads stream into this folder before being renamed into place; keep
+    # it on the same filesystem as the upload folders.
+    app.config["UPLOAD_TMP_FOLDER"] = os.path.join(app.instance_path, "uploads", "tmp")
+    # Where uploaded files are kept: "local" (hash-sharded directories under
+    # STORAGE_ROOT, default UPLOAD_FOLDER) or "object" (object-store stand-in)
+    app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "local")
+    app.config["STORAGE_ROOT"] = os.environ.get("STORAGE_ROOT")
+    # Per-file size limits, enforced while the upload is being received
+    app.config["KYC_DOCUMENT_MAX_BYTES"] = 10 * 1024 * 1024
+    app.config["MESSAGE_ATTACHMENT_MAX_BYTES"] = 10 * 1024 * 1024
+    app.config["PRODUCT_IMAGE_MAX_BYTES"] = 2 * 1024 * 1024
     app.config["ALLOWED_EXTENSIONS"] = {"pdf", "png", "jpg", "jpeg", "doc", "docx"}
+    # Size limit for catalogue imports (overrides MAX_CONTENT_LENGTH)
+    app.config["PRODUCT_IMPORT_MAX_BYTES"] = 512 * 1024 * 1024
+    # Opt-in per-request SQL instrumentation (see /debug/perf)
+    app.config["SQL_PROFILING"] = os.environ.get("SQL_PROFILING") == "1"
+    # Bearer token for /debug/perf outside debug mode (unset: debug mode only)
+    app.config["SQL_PROFILING_TOKEN"] = os.environ.get("SQL_PROFILING_TOKEN")
+    # Prometheus-style /metrics, served only to "Authorization: Bearer
+    # METRICS_TOKEN"; set METRICS_MULTIPROC_DIR under gunicorn
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") != "0"
+    app.config["METRICS_MULTIPROC_DIR"] = os.environ.get("METRICS_MULTIPROC_DIR")
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    # FAST_START=1 skips schema work entirely (schema managed by the deploy);
+    # otherwise DDL only runs when the stored schema stamp is out of date.
+    app.config["FAST_START"] = os.environ.get("FAST_START") == "1"
+    # Algorithm and cost for new password hashes; older hashes are upgraded
+    # on the next successful login. Tune with `flask calibrate-password-hash`.
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    # Shard files for messages; `flask reshard-messages --shards N` moves
+    # messages out of the main database into N files here.
+    app.config["MESSAGE_SHARD_DIR"] = os.environ.get(
+        "MESSAGE_SHARD_DIR", os.path.join(app.instance_path, "message_shards")
+    )
+    # Anonymous views of /, /dashboard and /marketplace are cached for
+    # PAGE_CACHE_TTL seconds (0 disables), then served stale for up to
+    # PAGE_CACHE_STALE more while they re-render in the background.
+    # PAGE_CACHE_DIR shares the cache between the workers on a host.
+    app.config["PAGE_CACHE_TTL"] = float(os.environ.get("PAGE_CACHE_TTL", 30))
+    app.config["PAGE_CACHE_STALE"] = float(os.environ.get("PAGE_CACHE_STALE", 300))
+    app.config["PAGE_CACHE_DIR"] = os.environ.get("PAGE_CACHE_DIR")
+    # Seconds a user snapshot may serve the login loader (0 disables)
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 30))
+    # Seconds a user's escrow counterparty suggestions are cached (0 disables)
+    app.config["ESCROW_SUGGESTIONS_TTL"] = float(os.environ.get("ESCROW_SUGGESTIONS_TTL", 300))
+    # Compiled template bytecode shared across workers and restarts; fill it at
+    # build time with `flask precompile-templates` ("" disables the cache).
+    app.config["TEMPLATE_CACHE_DIR"] = os.environ.get(
+        "TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache")
+    )
+    app.config["PRELOAD_TEMPLATES"] = os.environ.get("PRELOAD_TEMPLATES") == "1"
+    # Webhook URLs must resolve to public addresses; set to 1 only where
+    # receivers legitimately live on a private network.
+    app.config["WEBHOOK_ALLOW_PRIVATE"] = os.environ.get("WEBHOOK_ALLOW_PRIVATE") == "1"
+    # gzip/brotli for HTML and JSON bodies of at least this many bytes
+    app.config["COMPRESS_ENABLED"] = os.environ.get("COMPRESS_ENABLED", "1") != "0"
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
 
     # Ensure upload folder exists
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
     os.makedirs(app.config["MESSAGE_UPLOAD_FOLDER"], exist_ok=True)
+    os.makedirs(app.config["UPLOAD_TMP_FOLDER"], exist_ok=True)
+
+    if app.config["TEMPLATE_CACHE_DIR"]:
+        from jinja2 import FileSystemBytecodeCache
+
+        os.makedirs(app.config["TEMPLATE_CACHE_DIR"], exist_ok=True)
+        app.jinja_options = dict(
+            app.jinja_options,
+            bytecode_cache=FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_DIR"]),
+        )
+    phase("config")
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    from app.utils import assets, metrics, read_replicas, sql_profiler, sqlite_tuning
+
+    sqlite_tuning.init_app(app)
+    read_replicas.init_app(app)
+    sql_profiler.init_app(app)
+    metrics.init_app(app)
+    assets.init_app(app)
+    phase("extensions")
+
     # Login manager configuration
     login_manager.login_view = "auth.login"
     login_manager.login_message = "Please log in to access this page."
     login_manager.login_message_category = "info"
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        from app.models import User
+    from app.auth import user_cache
+
+    user_cache.init_app(app)
+    login_manager.user_loader(user_cache.load_user)
 
-        return db.session.get(User, int(user_id))
+    from app.auth import signed_requests
+
+    signed_requests.init_app(app)
+
+    from app.catalog import listing_cache
+    from app.trades import events, suggestions, webhooks
+    from app.utils import page_cache
+
+    listing_cache.init_app(app)
+    page_cache.init_app(app)
+    suggestions.init_app(app)
+    events.init_app(app)
+    webhooks.init_app(app)
+
+    from app.utils import change_seq, db_doctor, message_shards
+
+    change_seq.init_app(app)
+    message_shards.init_app(app)
+    db_doctor.init_app(app)
 
     # Register blueprints
     from app.routes import main_bp
@@ -57,9 +185,18 @@ def create_app():
 
     app.register_blueprint(auth_bp)
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    from app import cli
+
+    cli.register_cli(app)
+    phase("blueprints")
+
+    # Create database tables when the schema stamp is missing or stale
+    if not app.config["FAST_START"]:
+        from app.utils.schema import ensure_schema
+
+        with app.app_context():
+            app.extensions["schema_upgraded"] = ensure_schema(db.engine)
+    phase("schema")
 
     # Make csrf_token available in templates
     @app.context_processor
@@ -71,4 +208,15 @@ def create_app():
 
         return dict(csrf_token=csrf_token)
 
+    if app.config["PRELOAD_TEMPLATES"]:
+        # Load every template into the environment's in-memory cache so a
+        # preforked worker inherits them already compiled.
+        cli.compile_templates(app)
+    phase("templates")
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    app.extensions["startup_timings"] = timings
+    app.logger.info(
+        "startup %s", " ".join(f"{name}={ms:.1f}ms" for name, ms in timings.items())
+    )
     return app
@@ -0,0 +1,371 @@
+"""ASGI serving mode.
+
+``create_asgi_app(app)`` wraps the Flask app for an ASGI server (see
+``asgi.py`` at the project root, e.g. ``uvicorn asgi:application``)::
+
+``GET /api/events``
+    Server-sent events for the current user (``message`` and ``wallet``),
+    with a comment heartbeat every ``PUSH_HEARTBEAT`` seconds.
+``GET /api/messages/thread/<id>?since_id=N&wait=S``, ``GET /api/escrow/wallet?since_id=N&wait=S``
+    Long-polls: when nothing newer than ``since_id`` exists yet, the request
+    is parked for up to ``wait`` seconds (capped at ``LONG_POLL_MAX_WAIT``)
+    until the push watcher reports a matching change, then answered by the
+    ordinary Flask view. Without ``wait`` these behave exactly as under WSGI.
+
+A parked connection is a coroutine and a queue: it holds no thread and no
+database connection, so one process can keep thousands of them open. All
+database work (the readiness checks, the watcher's poll and every Flask
+view) runs on a bounded pool of ``ASGI_THREADS`` threads; everything else,
+HTML pages included, is passed to the WSGI app unchanged.
+
+Request bodies are buffered (spilling to a temp file past 1 MiB) before the
+Flask view runs, so the size limit is enforced here: the matched view's
+``max_content_length`` or else ``MAX_CONTENT_LENGTH``. A larger declared
+``Content-Length`` is answered with 413 before anything is read, and a body
+that grows past the limit is dropped with 413 as soon as it does.
+"""
+
+import asyncio
+import json
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask import request
+from flask_login import current_user
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+from app.models import EscrowTransaction, db
+from app.utils import message_shards
+from app.utils.push import PushHub
+
+BODY_SPOOL_SIZE = 1024 * 1024
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _thread_ready(user_id, match, since_id):
+    return message_shards.has_newer(user_id, int(match.group(1)), since_id)
+
+
+def _thread_event(event, match):
+    other_id = int(match.group(1))
+    return event["type"] == "message" and other_id in (event["sender_id"], event["receiver_id"])
+
+
+def _wallet_ready(user_id, match, since_id):
+    return db.session.scalar(
+        select(EscrowTransaction.id)
+        .where(EscrowTransaction.user_id == user_id, EscrowTransaction.id > since_id)
+        .limit(1)
+    ) is not None
+
+
+def _wallet_event(event, match):
+    return event["type"] == "wallet"
+
+
+# (path pattern, "already has news?" check run in a thread, event filter)
+LONG_POLLS = [
+    (re.compile(r"^/api/messages/thread/(\d+)$"), _thread_ready, _thread_event),
+    (re.compile(r"^/api/escrow/wallet$"), _wallet_ready, _wallet_event),
+]
+
+
+def build_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP ``scope`` and its buffered ``body``."""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class ChainPortASGI:
+    def __init__(self, app):
+        app.config.setdefault("ASGI_THREADS", 32)
+        app.config.setdefault("PUSH_POLL_INTERVAL", 1.0)
+        app.config.setdefault("PUSH_HEARTBEAT", 15)
+        app.config.setdefault("LONG_POLL_MAX_WAIT", 30)
+        self.app = app
+        self.executor = ThreadPoolExecutor(app.config["ASGI_THREADS"], thread_name_prefix="asgi")
+        self.hub = app.extensions["push_hub"] = PushHub(app, self.executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            # No websocket routes; refuse the handshake.
+            await send({"type": "websocket.close", "code": 1000})
+            return
+
+        try:
+            await self._dispatch(scope, receive, send)
+        except BodyTooLarge:
+            await self._send_error(send, 413, "Request body too large")
+
+    async def _dispatch(self, scope, receive, send):
+        path = scope["path"]
+        if path == "/api/events" and scope["method"] == "GET":
+            await self._events(scope, receive, send)
+            return
+        if scope["method"] == "GET":
+            for pattern, ready, wanted in LONG_POLLS:
+                match = pattern.match(path)
+                if match:
+                    await self._long_poll(scope, receive, send, match, ready, wanted)
+                    return
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # -- WSGI bridge ----------------------------------------------------
+
+    async def _send_error(self, send, status, message):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": json.dumps({"error": message}).encode()})
+
+    def _body_limit(self, scope):
+        """The byte limit for this request: the view's own, else MAX_CONTENT_LENGTH."""
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            endpoint, _ = self.app.url_map.bind("localhost").match(path, method=scope["method"])
+        except HTTPException:
+            endpoint = None
+        limit = getattr(self.app.view_functions.get(endpoint), "max_content_length", None)
+        if callable(limit):
+            limit = limit(self.app.config)
+        return limit if limit is not None else self.app.config.get("MAX_CONTENT_LENGTH")
+
+    async def _read_body(self, scope, receive):
+        limit = self._body_limit(scope)
+        if limit is not None:
+            for name, value in scope.get("headers", []):
+                if name.lower() == b"content-length" and value.isdigit() and int(value) > limit:
+                    raise BodyTooLarge()
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if limit is not None and size > limit:
+                body.close()
+                raise BodyTooLarge()
+            body.write(chunk)
+            more_body = message.get("more_body", False)
+        body.seek(0)
+        return body
+
+    async def _wsgi(self, scope, receive, send, body=None):
+        if body is None:
+            body = await self._read_body(scope, receive)
+        environ = build_environ(scope, body)
+        try:
+            await self._run(self._call_wsgi, environ, asyncio.get_running_loop(), send)
+        finally:
+            body.close()
+
+    def _call_wsgi(self, environ, loop, send):
+        """Run the Flask app on a pool thread, handing each chunk to the loop."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+            }
+
+        def push(message):
+            # Waiting for the send gives the app the client's backpressure.
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        result = self.app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    push(response["start"])
+                    started = True
+                push({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                push(response["start"])
+            push({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    # -- native handlers ------------------------------------------------
+
+    def _current_user_id(self, environ, verify):
+        """The requesting user's id, or None.
+
+        A signed request is always checked in full before anyone is parked
+        on its owner's queue. With ``verify`` its nonce is consumed too;
+        without it the nonce is left for the Flask view that answers the
+        long-poll afterwards, which authenticates the request again.
+        """
+        from app.auth.signed_requests import KEY_HEADER, authenticate_signed_request
+
+        with self.app.request_context(environ):
+            if request.headers.get(KEY_HEADER):
+                try:
+                    user = authenticate_signed_request(use_nonce=verify)
+                except HTTPException:
+                    return None
+                return user.id if user else None
+            return current_user.id if current_user.is_authenticated else None
+
+    def _check(self, ready, user_id, match, since_id):
+        with self.app.app_context():
+            return ready(user_id, match, since_id)
+
+    async def _long_poll(self, scope, receive, send, match, ready, wanted):
+        body = await self._read_body(scope, receive)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        try:
+            wait = min(float(query["wait"][0]), self.app.config["LONG_POLL_MAX_WAIT"])
+            since_id = int(query["since_id"][0])
+        except (KeyError, ValueError):
+            wait = 0
+        user_id = None
+        if wait > 0:
+            user_id = await self._run(self._current_user_id, build_environ(scope, body), False)
+
+        if user_id is not None:
+            # Subscribe before checking so a change in between is not missed.
+            queue = self.hub.subscribe(user_id)
+            disconnected = asyncio.ensure_future(self._until_disconnect(receive))
+            try:
+                if not await self._run(self._check, ready, user_id, match, since_id):
+                    await self._wait_for(queue, lambda event: wanted(event, match), wait, disconnected)
+                if disconnected.done():
+                    body.close()
+                    return
+            finally:
+                self.hub.unsubscribe(user_id, queue)
+                disconnected.cancel()
+        await self._wsgi(scope, receive, send, body)
+
+    async def _wait_for(self, queue, predicate, timeout, disconnected):
+        """Wait for an event matching ``predicate``, the timeout or a disconnect."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not disconnected.done():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({get, disconnected}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if get not in done:
+                get.cancel()
+            elif predicate(get.result()):
+                return
+
+    async def _events(self, scope, receive, send):
+        body = await self._read_body(scope, receive)
+        user_id = await self._run(self._current_user_id, build_environ(scope, body), True)
+        body.close()
+        if user_id is None:
+            await self._send_error(send, 401, "Authentication required")
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+        queue = self.hub.subscribe(user_id)
+        disconnected = asyncio.ensure_future(self._until_disconnect(receive))
+        heartbeat = self.app.config["PUSH_HEARTBEAT"]
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {get, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    get.cancel()
+                    return
+                if get in done:
+                    event = get.result()
+                    chunk = f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    get.cancel()
+                    chunk = ": ping\n\n"
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        finally:
+            self.hub.unsubscribe(user_id, queue)
+            disconnected.cancel()
+
+    async def _until_disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+def create_asgi_app(app):
+    return ChainPortASGI(app)
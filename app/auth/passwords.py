@@ -0,0 +1,140 @@
+"""Password hashing policy.
+
+``PASSWORD_HASH_METHOD`` names the algorithm and its cost:
+
+* ``scrypt:<n>:<r>:<p>`` (default ``scrypt:32768:8:1``)
+* ``pbkdf2:<hash>:<iterations>``, e.g. ``pbkdf2:sha256:600000``
+* ``bcrypt:<rounds>``, e.g. ``bcrypt:12`` (needs the ``bcrypt`` package)
+
+scrypt and pbkdf2 hashes use Werkzeug's ``method$salt$hash`` format;
+bcrypt hashes are stored in their native ``$2b$...`` form. Any stored hash
+can be verified regardless of the current policy, and
+:func:`needs_rehash` reports hashes made with other parameters so login can
+upgrade them. ``flask calibrate-password-hash`` picks a cost that hits a
+target latency on the current host.
+"""
+
+import time
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import bcrypt
+except ImportError:  # optional; only needed for the bcrypt policy
+    bcrypt = None
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+ALGORITHMS = ("scrypt", "pbkdf2", "bcrypt")
+
+
+def normalize_method(method):
+    """Spell out defaulted parameters so policies compare reliably."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = (int(a) for a in args) if args else (2**15, 8, 1)
+        if n < 2 or n & (n - 1):
+            raise ValueError("scrypt n must be a power of two")
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else 600000
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == "bcrypt":
+        rounds = int(args[0]) if args else 12
+        if not 4 <= rounds <= 31:
+            raise ValueError("bcrypt rounds must be between 4 and 31")
+        return f"bcrypt:{rounds}"
+    raise ValueError(f"Unsupported password hash method: {method}")
+
+
+def current_method():
+    if has_app_context():
+        return normalize_method(current_app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_METHOD)
+    return DEFAULT_METHOD
+
+
+def _require_bcrypt():
+    if bcrypt is None:
+        raise RuntimeError("The bcrypt password policy needs the 'bcrypt' package installed")
+    return bcrypt
+
+
+def hash_password(password, method=None):
+    method = normalize_method(method) if method else current_method()
+    if method.startswith("bcrypt:"):
+        rounds = int(method.split(":")[1])
+        lib = _require_bcrypt()
+        return lib.hashpw(password.encode("utf-8"), lib.gensalt(rounds)).decode("ascii")
+    return generate_password_hash(password, method=method)
+
+
+def verify_password(stored_hash, password):
+    if not stored_hash:
+        return False
+    if stored_hash.startswith("$2"):
+        return _require_bcrypt().checkpw(password.encode("utf-8"), stored_hash.encode("ascii"))
+    return check_password_hash(stored_hash, password)
+
+
+def hash_method(stored_hash):
+    """The normalized policy a stored hash was made with."""
+    if stored_hash.startswith("$2"):
+        # $2b$<rounds>$<salt+hash>
+        return f"bcrypt:{int(stored_hash.split('$')[2])}"
+    return normalize_method(stored_hash.split("$", 1)[0])
+
+
+def needs_rehash(stored_hash, method=None):
+    method = normalize_method(method) if method else current_method()
+    try:
+        return hash_method(stored_hash) != method
+    except (ValueError, IndexError):
+        return True
+
+
+def time_hash(method, samples=3):
+    """Median seconds to hash one password with ``method``."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hash_password("calibration-password", method)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(algorithm, target_seconds, samples=3, progress=None):
+    """Return ``(method, seconds)`` for the cheapest cost reaching the target.
+
+    Costs only go up from each algorithm's current recommended default, so
+    a slow host never produces a weaker policy than the library's default.
+    """
+    if algorithm == "pbkdf2":
+        base = "pbkdf2:sha256:600000"
+        elapsed = time_hash(base, samples)
+        if progress:
+            progress(base, elapsed)
+        # Cost is linear in iterations; round up to a tidy 10k.
+        iterations = max(600000, -(-int(600000 * target_seconds / elapsed) // 10000) * 10000)
+        method = f"pbkdf2:sha256:{iterations}"
+        elapsed = time_hash(method, samples)
+        if progress:
+            progress(method, elapsed)
+        return method, elapsed
+
+    if algorithm == "scrypt":
+        candidates = (f"scrypt:{n}:8:1" for n in (2**k for k in range(15, 21)))
+    elif algorithm == "bcrypt":
+        _require_bcrypt()
+        candidates = (f"bcrypt:{rounds}" for rounds in range(12, 20))
+    else:
+        raise ValueError(f"algorithm must be one of {', '.join(ALGORITHMS)}")
+
+    # Cost doubles per step; stop at the first one that reaches the target.
+    for method in candidates:
+        elapsed = time_hash(method, samples)
+        if progress:
+            progress(method, elapsed)
+        if elapsed >= target_seconds:
+            break
+    return method, elapsed
@@ -1,8 +1,12 @@
-from flask import render_template, request, redirect, url_for, session, flash
+import base64
+import binascii
+from datetime import datetime, timezone
+
+from flask import render_template, request, redirect, url_for, session, flash, g, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from . import auth_bp
-from app.models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.auth.signed_requests import key_id_for
+from app.models import db, ApiClient, User
 
 
 @auth_bp.route("/login", methods=["GET", "POST"])
@@ -16,6 +20,11 @@ def login():
 
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                # The plaintext is only available here; bring the stored
+                # hash up to the current PASSWORD_HASH_METHOD.
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             session["user_id"] = user.id
             session["user_email"] = user.email
@@ -80,3 +89,60 @@ def logout():
     session.clear()
     flash("You have been logged out successfully.", "success")
     return redirect(url_for("main.index"))
+
+
+@auth_bp.route("/api/clients", methods=["GET", "POST"])
+@login_required
+def api_clients():
+    """List or register the current user's signed-request API keys."""
+    if request.method == "GET":
+        clients = ApiClient.query.filter_by(user_id=current_user.id).order_by(ApiClient.id).all()
+        return jsonify({"clients": [_serialize_client(c) for c in clients]})
+
+    # A leaked key must not be able to mint further keys.
+    if g.get("_signed_request_user") is not None:
+        return jsonify({"error": "Register API keys from a logged-in session"}), 403
+
+    data = request.get_json(silent=True) or {}
+    name = (data.get("name") or "").strip()
+    try:
+        public_key = base64.b64decode(data.get("public_key") or "", validate=True)
+    except (binascii.Error, ValueError):
+        public_key = b""
+    if not name or len(name) > 100:
+        return jsonify({"error": "name is required (max 100 characters)"}), 400
+    if len(public_key) != 32:
+        return jsonify({"error": "public_key must be a base64 ed25519 public key"}), 400
+
+    encoded = base64.b64encode(public_key).decode("ascii")
+    if ApiClient.query.filter_by(public_key=encoded).first():
+        return jsonify({"error": "This public key is already registered"}), 409
+    client = ApiClient(user_id=current_user.id, name=name, key_id=key_id_for(public_key), public_key=encoded)
+    db.session.add(client)
+    db.session.commit()
+    return jsonify(_serialize_client(client)), 201
+
+
+@auth_bp.route("/api/clients/<key_id>", methods=["DELETE"])
+@login_required
+def revoke_api_client(key_id):
+    if g.get("_signed_request_user") is not None:
+        return jsonify({"error": "Revoke API keys from a logged-in session"}), 403
+    client = ApiClient.query.filter_by(key_id=key_id, user_id=current_user.id).first()
+    if client is None:
+        return jsonify({"error": "Not found"}), 404
+    client.is_active = False
+    client.revoked_at = datetime.now(timezone.utc)
+    # Signed requests check is_active on every request, in every worker.
+    db.session.commit()
+    return jsonify({"success": True})
+
+
+def _serialize_client(client):
+    return {
+        "key_id": client.key_id,
+        "name": client.name,
+        "public_key": client.public_key,
+        "is_active": client.is_active,
+        "created_at": client.created_at.isoformat() if client.created_at else None,
+    }
@@ -0,0 +1,223 @@
+"""Ed25519 signed-request authentication for machine-to-machine API clients.
+
+A client registers a public key (``POST /api/clients``, from a normal
+logged-in session) and then signs every request instead of logging in::
+
+    X-ChainPort-Key:       <key id returned at registration>
+    X-ChainPort-Timestamp: <unix seconds>
+    X-ChainPort-Nonce:     <16-64 random url-safe characters>
+    X-ChainPort-Signature: base64(ed25519_sign(canonical))
+
+where ``canonical`` is, joined by ``\\n``: the upper-case method, the path
+plus ``?query`` if any, the hex SHA-256 of the body, the timestamp and the
+nonce. :func:`sign_request` builds these headers for Python clients.
+
+A verified request is authenticated as the key's owner for that request
+only: no session cookie, no password hash and no CSRF token. Parsed
+``VerifyKey`` objects are cached per key id, but whether the key is still
+active is read from the database on every request, so a revocation takes
+effect in every worker at once. Used nonces go into the shared
+``api_nonce`` table, whose unique ``(key_id, nonce)`` constraint turns a
+replay into an integrity error in any worker; rows older than twice the
+allowed clock skew are pruned, since their timestamps fail the window
+check anyway.
+"""
+
+import base64
+import hashlib
+import re
+import secrets
+import time
+
+from flask import abort, current_app, g, jsonify, make_response, request
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.utils import metrics
+from app.utils.cache import TTLCache
+
+KEY_HEADER = "X-ChainPort-Key"
+TIMESTAMP_HEADER = "X-ChainPort-Timestamp"
+NONCE_HEADER = "X-ChainPort-Nonce"
+SIGNATURE_HEADER = "X-ChainPort-Signature"
+
+NONCE_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+_NACL_SIGNING = None
+_LAST_PRUNE = 0.0
+
+
+def _nacl_signing():
+    global _NACL_SIGNING
+    if _NACL_SIGNING is None:
+        try:
+            import nacl.signing
+
+            _NACL_SIGNING = nacl.signing
+        except Exception:
+            _NACL_SIGNING = False
+    return _NACL_SIGNING or None
+
+
+def key_id_for(public_key_bytes):
+    return hashlib.sha256(public_key_bytes).hexdigest()[:16]
+
+
+def canonical_string(method, path, body, timestamp, nonce):
+    body_hash = hashlib.sha256(body or b"").hexdigest()
+    return "\n".join([method.upper(), path, body_hash, str(timestamp), nonce]).encode("utf-8")
+
+
+def sign_request(signing_key, key_id, method, path, body=b"", timestamp=None, nonce=None):
+    """Client helper: headers for a request signed with a ``nacl.signing.SigningKey``."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    nonce = nonce or secrets.token_urlsafe(24)
+    signature = signing_key.sign(canonical_string(method, path, body, timestamp, nonce)).signature
+    return {
+        KEY_HEADER: key_id,
+        TIMESTAMP_HEADER: str(timestamp),
+        NONCE_HEADER: nonce,
+        SIGNATURE_HEADER: base64.b64encode(signature).decode("ascii"),
+    }
+
+
+def _reject(reason, status=401):
+    metrics.inc("chainport_signed_auth_failures_total", {"reason": reason})
+    abort(make_response(jsonify({"error": f"Signed request rejected: {reason}"}), status))
+
+
+def _verify_key(key_id):
+    """Return ``(VerifyKey, user_id)`` for a registered client, cached per key id.
+
+    A key's public key and owner never change, so the entry is cached even
+    for revoked keys; :func:`_use_nonce` checks ``is_active``.
+    """
+    from app.models import ApiClient
+
+    keys = current_app.extensions["signed_auth_keys"]
+    entry = keys.get(key_id)
+    if entry is None:
+        client = ApiClient.query.filter_by(key_id=key_id).first()
+        if client is None:
+            return None
+        verify_key = _nacl_signing().VerifyKey(base64.b64decode(client.public_key))
+        entry = (verify_key, client.user_id)
+        keys.set(key_id, entry)
+    return entry
+
+
+def _use_nonce(key_id, nonce):
+    """Record ``nonce`` for an active key; return the reason to reject, if any.
+
+    Runs on its own primary connection so it neither commits nor reads
+    through the request's session.
+    """
+    global _LAST_PRUNE
+    from app.extensions import db
+    from app.models import ApiClient, ApiNonce
+
+    now = time.time()
+    window = 2 * current_app.config["API_SIGNATURE_MAX_SKEW"]
+    try:
+        with db.engine.begin() as conn:
+            active = conn.execute(select(ApiClient.is_active).where(ApiClient.key_id == key_id)).scalar()
+            if not active:
+                return "unknown or revoked key"
+            conn.execute(insert(ApiNonce).values(key_id=key_id, nonce=nonce, seen_at=int(now)))
+            if now - _LAST_PRUNE >= current_app.config["API_NONCE_PRUNE_INTERVAL"]:
+                conn.execute(delete(ApiNonce).where(ApiNonce.seen_at < int(now - window)))
+                _LAST_PRUNE = now
+    except IntegrityError:
+        return "nonce already used"
+    return None
+
+
+def _canonical_path():
+    query = request.query_string.decode("latin-1")
+    return f"{request.path}?{query}" if query else request.path
+
+
+def _key_is_active(key_id):
+    from app.models import ApiClient
+
+    return bool(ApiClient.query.with_entities(ApiClient.is_active).filter_by(key_id=key_id).scalar())
+
+
+def authenticate_signed_request(use_nonce=True):
+    """Authenticate the current request from its signature headers.
+
+    Returns the authenticated ``User``, or None when the request is not
+    signed. A signed request that fails verification is aborted with 401.
+    The result is memoised for the rest of the request.
+
+    With ``use_nonce=False`` everything but the nonce is checked and the
+    nonce is left unused, so the same request can still be authenticated
+    for real afterwards; nothing is memoised in that case.
+    """
+    if use_nonce and "_signed_request_user" in g:
+        return g._signed_request_user
+    if use_nonce:
+        g._signed_request_user = None
+    key_id = request.headers.get(KEY_HEADER)
+    if not key_id:
+        return None
+
+    config = current_app.config
+    timestamp = request.headers.get(TIMESTAMP_HEADER, "")
+    nonce = request.headers.get(NONCE_HEADER, "")
+    signature = request.headers.get(SIGNATURE_HEADER, "")
+    if not (timestamp.isdigit() and NONCE_RE.match(nonce) and signature):
+        _reject("missing or malformed signature headers")
+    if abs(time.time() - int(timestamp)) > config["API_SIGNATURE_MAX_SKEW"]:
+        _reject("timestamp outside the allowed window")
+    if _nacl_signing() is None:
+        _reject("server missing PyNaCl for signature verification", 501)
+    if (request.content_length or 0) > config["API_SIGNED_MAX_BODY"]:
+        _reject("body too large for a signed request", 413)
+
+    entry = _verify_key(key_id)
+    if entry is None:
+        _reject("unknown or revoked key")
+    verify_key, user_id = entry
+
+    body = request.get_data(cache=True)
+    try:
+        verify_key.verify(
+            canonical_string(request.method, _canonical_path(), body, timestamp, nonce),
+            base64.b64decode(signature, validate=True),
+        )
+    except Exception:
+        _reject("bad signature")
+
+    if use_nonce:
+        reason = _use_nonce(key_id, nonce)
+    else:
+        reason = None if _key_is_active(key_id) else "unknown or revoked key"
+    if reason:
+        _reject(reason)
+
+    from app.auth.user_cache import load_user
+
+    user = load_user(user_id)
+    if user is None or not user.is_active:
+        _reject("account disabled")
+    if not use_nonce:
+        return user
+    # Flask-Login reads the current user from here, so the key's owner
+    # wins over any session cookie sent along with the request.
+    g._login_user = user
+    g._signed_request_user = user
+    return user
+
+
+def init_app(app):
+    app.config.setdefault("API_SIGNATURE_MAX_SKEW", 300)
+    app.config.setdefault("API_SIGNED_MAX_BODY", 16 * 1024 * 1024)
+    app.config.setdefault("API_NONCE_PRUNE_INTERVAL", 60)
+    app.config.setdefault("API_KEY_CACHE_TTL", 300)
+    app.extensions["signed_auth_keys"] = TTLCache(maxsize=4096, ttl=app.config["API_KEY_CACHE_TTL"])
+    app.before_request(_authenticate_before_request)
+
+
+def _authenticate_before_request():
+    authenticate_signed_request()
@@ -0,0 +1,115 @@
+"""Per-process cache of ``User`` rows for the Flask-Login user loader.
+
+Every authenticated request (including each chat poll) loads the current
+user. Snapshots of the user's identity and auth columns (``CACHED_FIELDS``)
+are kept for ``USER_CACHE_TTL`` seconds and re-attached to the session with
+``merge(load=False)``, so the returned object behaves like a normally
+loaded, persistent ``User`` and changes to it are flushed as usual. Any
+flush that updates or deletes a ``User`` evicts it; other workers pick up
+the change once the TTL lapses.
+
+Everything else -- the escrow balance in particular -- is left unloaded and
+read from the database the first time the request touches it, so a stale
+snapshot can never be the base of a balance write.
+
+A cache miss always reads the primary, even in a GET request that is
+otherwise served by a read replica: a lagging replica's row would be
+cached and then handed to every worker request for a whole TTL.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.extensions import db
+from app.utils.cache import TTLCache
+
+_PENDING_KEY = "_cp_user_cache_evict"
+CACHED_FIELDS = ("id", "email", "first_name", "last_name", "company_name", "is_active", "is_verified")
+_LISTENERS_INSTALLED = False
+
+
+def _cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("user_cache")
+
+
+def _snapshot(user):
+    state = inspect(user)
+    return {key: state.dict[key] for key in CACHED_FIELDS if key in state.dict}
+
+
+def _restore(model, values):
+    user = model()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_user(user_id):
+    from app.models import User
+
+    user_id = int(user_id)
+    cache = _cache()
+    if cache is None:
+        return db.session.get(User, user_id)
+
+    values = cache.get(user_id)
+    if values is not None:
+        return _restore(User, values)
+
+    user = db.session.get(User, user_id, bind_arguments={"bind": db.engine})
+    if user is not None:
+        cache.set(user_id, _snapshot(user))
+    return user
+
+
+def evict(user_id):
+    cache = _cache()
+    if cache is not None:
+        cache.pop(user_id)
+
+
+def _collect_changed_users(session, flush_context, instances):
+    from app.models import User
+
+    changed = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+            evict(obj.id)
+
+
+def _evict_committed_users(session):
+    # A concurrent request may have re-cached the old row between our flush
+    # and commit, so evict again once the change is durable.
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        evict(user_id)
+
+
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _install_listeners():
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    event.listen(Session, "before_flush", _collect_changed_users)
+    event.listen(Session, "after_commit", _evict_committed_users)
+    event.listen(Session, "after_soft_rollback", lambda session, previous: _discard_pending(session))
+    _LISTENERS_INSTALLED = True
+
+
+def init_app(app):
+    app.config.setdefault("USER_CACHE_TTL", 30)
+    app.config.setdefault("USER_CACHE_SIZE", 2048)
+    if app.config["USER_CACHE_TTL"] <= 0:
+        return
+    app.extensions["user_cache"] = TTLCache(
+        maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"]
+    )
+    _install_listeners()
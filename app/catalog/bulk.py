@@ -0,0 +1,155 @@
+"""Set-based changes to a filtered slice of one seller's catalogue.
+
+A bulk update selects the matching ids once, then runs a single
+``UPDATE product SET ... WHERE id = ?`` over them as an executemany, so
+repricing thousands of listings costs one prepared statement rather than
+an ORM round trip per product. Every touched row gets the same
+``updated_at`` and its own ``change_seq``, numbered in id order.
+"""
+
+import math
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, func, select, update
+
+from app.models import Product, db
+from app.signals import catalog_changed
+from app.utils import change_seq
+
+MAX_SELECTORS = 10000
+
+# criteria key -> Product column, for equality filters
+_EQUALITY_FILTERS = {
+    "category": Product.category,
+    "country_of_origin": Product.country_of_origin,
+    "currency": Product.currency,
+}
+
+
+def _as_list(value, name):
+    if isinstance(value, str):
+        value = [v for v in (part.strip() for part in value.split(",")) if v]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f"{name} must be a list")
+    if len(value) > MAX_SELECTORS:
+        raise ValueError(f"{name} accepts at most {MAX_SELECTORS} entries")
+    return list(value)
+
+
+def _as_bool(value, name):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes"):
+        return True
+    if text in ("0", "false", "no"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def _as_price(value, name):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number")
+    return number
+
+
+def product_filters(seller_id, criteria):
+    """Translate request criteria into WHERE clauses scoped to ``seller_id``.
+
+    Supported keys: ``ids``, ``skus``, ``category``, ``country_of_origin``,
+    ``currency``, ``is_active``, ``min_price`` and ``max_price``. Unknown
+    keys raise ``ValueError`` so a typo cannot widen the selection.
+    """
+    criteria = criteria or {}
+    if not isinstance(criteria, dict):
+        raise ValueError("filter must be an object")
+    clauses = [Product.seller_id == seller_id]
+    for key, value in criteria.items():
+        if value is None or value == "":
+            continue
+        if key == "ids":
+            try:
+                ids = [int(v) for v in _as_list(value, "ids")]
+            except (TypeError, ValueError):
+                raise ValueError("ids must be integers")
+            clauses.append(Product.id.in_(ids))
+        elif key == "skus":
+            clauses.append(Product.sku.in_([str(v) for v in _as_list(value, "skus")]))
+        elif key in _EQUALITY_FILTERS:
+            clauses.append(_EQUALITY_FILTERS[key] == str(value))
+        elif key == "is_active":
+            clauses.append(Product.is_active == _as_bool(value, "is_active"))
+        elif key == "min_price":
+            clauses.append(Product.price_per_unit >= _as_price(value, "min_price"))
+        elif key == "max_price":
+            clauses.append(Product.price_per_unit <= _as_price(value, "max_price"))
+        else:
+            raise ValueError(f"Unknown filter: {key}")
+    return clauses
+
+
+def bulk_update_products(seller_id, criteria, changes):
+    """Apply ``changes`` to the seller's products matching ``criteria``.
+
+    ``changes`` may combine:
+
+    * ``price_percent`` -- relative change, e.g. ``-10`` for 10% off;
+    * ``price_delta`` -- amount added to each price (may be negative);
+    * ``is_active`` -- activate or deactivate the listings;
+    * ``currency`` -- relabel the listing currency (prices are not converted).
+
+    Products whose price would drop to zero or below are left untouched.
+    Returns the number of rows updated.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("changes must be an object")
+    clauses = product_filters(seller_id, criteria)
+    values = {}
+
+    if "price_percent" in changes and "price_delta" in changes:
+        raise ValueError("Use either price_percent or price_delta, not both")
+    if changes.get("price_percent") is not None:
+        percent = _as_price(changes["price_percent"], "price_percent")
+        if percent <= -100:
+            raise ValueError("price_percent must be greater than -100")
+        values["price_per_unit"] = func.round(Product.price_per_unit * (1 + percent / 100.0), 2)
+    elif changes.get("price_delta") is not None:
+        delta = _as_price(changes["price_delta"], "price_delta")
+        values["price_per_unit"] = func.round(Product.price_per_unit + delta, 2)
+    if "price_per_unit" in values:
+        # Guard on the rounded price: 0.01 at -60% rounds to 0.00.
+        clauses.append(values["price_per_unit"] > 0)
+    if changes.get("is_active") is not None:
+        values["is_active"] = _as_bool(changes["is_active"], "is_active")
+    if changes.get("currency"):
+        currency = str(changes["currency"]).strip().upper()
+        if not (3 <= len(currency) <= 10 and currency.isalpha()):
+            raise ValueError("currency must be a currency code such as INR or USD")
+        values["currency"] = currency
+    if not values:
+        raise ValueError("Nothing to update: give price_percent, price_delta, is_active or currency")
+
+    values["updated_at"] = datetime.now(timezone.utc)
+    # Take the counter's lock before selecting so the matching set cannot
+    # change under us, then reserve exactly one number per matching row.
+    connection = db.session.connection()
+    change_seq.allocate(connection, 0)
+    ids = db.session.execute(select(Product.id).where(*clauses).order_by(Product.id)).scalars().all()
+    if not ids:
+        db.session.rollback()
+        return 0
+    first = change_seq.allocate(connection, len(ids))
+    table = Product.__table__
+    connection.execute(
+        update(table).where(table.c.id == bindparam("row_id")).values(**values, change_seq=bindparam("row_seq")),
+        [{"row_id": row_id, "row_seq": first + offset} for offset, row_id in enumerate(ids)],
+    )
+    db.session.commit()
+    catalog_changed.send(current_app._get_current_object(), seller_id=seller_id)
+    return len(ids)
+
@@ -0,0 +1,83 @@
+"""Streaming export of a seller's catalogue as CSV or JSON Lines.
+
+Rows are fetched as plain tuples in ``EXPORT_BATCH`` sized chunks and
+written out as they arrive, so exporting a large catalogue never holds it
+in memory. The columns match what :mod:`app.catalog.importer` accepts, so
+an export can be edited and re-imported.
+"""
+
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from app.catalog.bulk import product_filters
+from app.models import Product, db
+
+EXPORT_BATCH = 1000
+
+EXPORT_FIELDS = (
+    "id",
+    "sku",
+    "title",
+    "description",
+    "category",
+    "hs_code",
+    "quantity",
+    "unit",
+    "price_per_unit",
+    "currency",
+    "country_of_origin",
+    "min_order_quantity",
+    "payment_terms",
+    "delivery_terms",
+    "is_active",
+    "updated_at",
+)
+
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_statement(seller_id, criteria=None):
+    """Build the export query; raises ``ValueError`` for bad criteria."""
+    columns = [getattr(Product, name) for name in EXPORT_FIELDS]
+    return select(*columns).where(*product_filters(seller_id, criteria)).order_by(Product.id)
+
+
+def _records(statement):
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH))
+    for partition in result.partitions():
+        yield [
+            {
+                name: value.isoformat() if name == "updated_at" and value is not None else value
+                for name, value in zip(EXPORT_FIELDS, row)
+            }
+            for row in partition
+        ]
+
+
+def iter_csv(statement):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for records in _records(statement):
+        writer.writerows(records)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(statement):
+    for records in _records(statement):
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+
+def iter_export(statement, fmt):
+    if fmt == "csv":
+        return iter_csv(statement)
+    if fmt in ("jsonl", "ndjson"):
+        return iter_jsonl(statement)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,318 @@
+"""Streaming bulk import of a seller's catalogue from CSV or JSON Lines.
+
+Rows are read one at a time from the uploaded stream, validated, and
+upserted into ``Product`` in batches keyed on ``(seller_id, sku)``: one
+``SELECT ... IN`` per batch finds existing listings, then a single bulk
+UPDATE and a single bulk INSERT write the batch. Only one batch is held in
+memory, so memory use does not grow with file size.
+
+Each batch commits on its own. A batch that violates a constraint (say, a
+SKU inserted by a concurrent import) is rolled back and retried row by row
+so only the offending rows are reported; any other database error rolls
+the batch back and stops the import, leaving earlier batches in place.
+A file that stops being readable part way (bad UTF-8, broken CSV quoting)
+also stops the import: the rows already read but not yet written are
+dropped, and the report says where reading failed.
+"""
+
+import codecs
+import csv
+import io
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import Product, db
+from app.signals import catalog_changed
+from app.utils import change_seq
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+HS_CODE_RE = re.compile(r"^\d{4}(\.?\d{2}){1,3}$")
+UNIT_RE = re.compile(r"^[A-Za-z][A-Za-z .-]{0,19}$")
+SKU_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._/-]{0,63}$")
+
+TEXT_FIELDS = {
+    "title": 200,
+    "description": None,
+    "category": 50,
+    "currency": 10,
+    "country_of_origin": 50,
+    "payment_terms": 100,
+    "delivery_terms": 100,
+}
+
+
+@dataclass
+class RowError:
+    line: int
+    sku: str
+    message: str
+
+    def as_dict(self):
+        return {"line": self.line, "sku": self.sku, "error": self.message}
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    error_count: int = 0
+    aborted: bool = False
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, sku, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, sku or "", message))
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "aborted": self.aborted,
+            "errors": [e.as_dict() for e in self.errors],
+            "errors_truncated": self.error_count > len(self.errors),
+        }
+
+
+def _text_stream(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+
+
+def iter_csv_rows(binary_stream):
+    """Yield ``(line_number, row_dict)`` from a CSV byte stream with a header row."""
+    reader = csv.DictReader(_text_stream(binary_stream))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_jsonl_rows(binary_stream):
+    """Yield ``(line_number, row_dict)`` from a JSON Lines byte stream."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    line_no = 0
+    for raw in binary_stream:
+        line_no += 1
+        line = decoder.decode(raw).strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"Invalid JSON: {e}")
+            continue
+        yield line_no, row if isinstance(row, dict) else ValueError("Each line must be a JSON object")
+
+
+def iter_rows(binary_stream, fmt):
+    if fmt == "csv":
+        return iter_csv_rows(binary_stream)
+    if fmt in ("jsonl", "ndjson"):
+        return iter_jsonl_rows(binary_stream)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _text(row, name):
+    """``row[name]`` as stripped text; "" when missing. JSON numbers are allowed."""
+    raw = row.get(name)
+    if raw is None:
+        return ""
+    if isinstance(raw, bool) or not isinstance(raw, (str, int, float)):
+        raise ValueError(f"{name} must be text")
+    return str(raw).strip()
+
+
+def _number(row, name, required=False, minimum=None, strictly_positive=False):
+    raw = row.get(name)
+    if isinstance(raw, bool) or not isinstance(raw, (str, int, float, type(None))):
+        raise ValueError(f"{name} must be a number")
+    if raw is None or (isinstance(raw, str) and not raw.strip()):
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    if strictly_positive and value <= 0:
+        raise ValueError(f"{name} must be greater than zero")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return value
+
+
+def _boolean(raw):
+    if raw is None or raw == "":
+        return True
+    if isinstance(raw, bool):
+        return raw
+    value = str(raw).strip().lower()
+    if value in ("1", "true", "yes", "y", "active"):
+        return True
+    if value in ("0", "false", "no", "n", "inactive"):
+        return False
+    raise ValueError("is_active must be true or false")
+
+
+def validate_row(row):
+    """Return a dict of Product column values, or raise ValueError.
+
+    Optional columns missing from the row are left out, so an update only
+    overwrites the fields the file actually carries.
+    """
+    sku = _text(row, "sku")
+    if not SKU_RE.match(sku):
+        raise ValueError("sku is required (letters, digits, . _ / -; max 64 characters)")
+
+    values = {"sku": sku}
+    for name, max_len in TEXT_FIELDS.items():
+        if row.get(name) is None:
+            continue
+        text = _text(row, name)
+        if max_len and len(text) > max_len:
+            raise ValueError(f"{name} is too long (max {max_len} characters)")
+        values[name] = text or None
+    if not values.get("title"):
+        raise ValueError("title is required")
+
+    unit = _text(row, "unit")
+    if not UNIT_RE.match(unit):
+        raise ValueError("unit is required (e.g. kg, tons, pieces)")
+    values["unit"] = unit
+
+    if "hs_code" in row:
+        hs_code = _text(row, "hs_code")
+        if hs_code and not HS_CODE_RE.match(hs_code):
+            raise ValueError("hs_code must be 6-10 digits, e.g. 4412.31")
+        values["hs_code"] = hs_code or None
+
+    values["price_per_unit"] = _number(row, "price_per_unit", required=True, strictly_positive=True)
+    for name in ("quantity", "min_order_quantity"):
+        if name in row:
+            values[name] = _number(row, name, minimum=0)
+    if (
+        values.get("quantity") is not None
+        and values.get("min_order_quantity") is not None
+        and values["min_order_quantity"] > values["quantity"]
+    ):
+        raise ValueError("min_order_quantity cannot exceed quantity")
+    if "is_active" in row:
+        values["is_active"] = _boolean(row["is_active"])
+    if values.get("currency"):
+        values["currency"] = values["currency"].upper()
+    return values
+
+
+def _write_batch(seller_id, batch, result):
+    existing = dict(
+        db.session.execute(
+            select(Product.sku, Product.id).where(
+                Product.seller_id == seller_id, Product.sku.in_(list(batch))
+            )
+        ).all()
+    )
+    now = datetime.now(timezone.utc)
+    updates, inserts = [], []
+    for sku, (_line, row_values) in batch.items():
+        values = dict(row_values, updated_at=now)
+        if sku in existing:
+            updates.append(dict(values, id=existing[sku]))
+        else:
+            inserts.append(
+                dict(
+                    values,
+                    seller_id=seller_id,
+                    created_at=now,
+                    currency=values.get("currency") or "INR",
+                    is_active=values.get("is_active", True),
+                )
+            )
+
+    # Bulk statements skip the ORM flush that stamps change_seq.
+    seq = change_seq.allocate(db.session.connection(), len(updates) + len(inserts))
+    for offset, values in enumerate(updates + inserts):
+        values["change_seq"] = seq + offset
+
+    if updates:
+        db.session.execute(update(Product), updates)
+    if inserts:
+        db.session.execute(insert(Product), inserts)
+    db.session.commit()
+    result.updated += len(updates)
+    result.created += len(inserts)
+
+
+def _flush_batch(seller_id, batch, result):
+    """Write ``batch``; return False if the import has to stop."""
+    try:
+        _write_batch(seller_id, batch, result)
+    except IntegrityError:
+        db.session.rollback()
+        if len(batch) == 1:
+            ((sku, (line, _values)),) = batch.items()
+            result.add_error(line, sku, "conflicts with an existing listing; row not saved")
+            return True
+        for sku, item in batch.items():
+            if not _flush_batch(seller_id, {sku: item}, result):
+                return False
+    except OperationalError as e:
+        db.session.rollback()
+        current_app.logger.warning("catalog import for seller %s stopped: %s", seller_id, e.orig)
+        for sku, (line, _values) in batch.items():
+            result.add_error(line, sku, "database error; import stopped, row not saved")
+        result.aborted = True
+        return False
+    return True
+
+
+def _readable_rows(rows, result):
+    """Yield from ``rows`` until the file cannot be decoded or parsed."""
+    line = 0
+    try:
+        for line, row in rows:
+            yield line, row
+    except (UnicodeDecodeError, csv.Error) as e:
+        reason = "file is not valid UTF-8" if isinstance(e, UnicodeDecodeError) else f"malformed CSV: {e}"
+        result.add_error(line + 1, None, f"{reason}; import stopped")
+        result.aborted = True
+
+
+def import_products(seller_id, rows, batch_size=BATCH_SIZE):
+    """Validate and upsert ``(line, row)`` pairs for ``seller_id``."""
+    result = ImportResult()
+    batch = {}
+    for line, row in _readable_rows(rows, result):
+        result.rows += 1
+        if isinstance(row, Exception):
+            result.add_error(line, None, str(row))
+            continue
+        try:
+            values = validate_row(row)
+        except ValueError as e:
+            sku = row.get("sku")
+            result.add_error(line, sku if isinstance(sku, str) else None, str(e))
+            continue
+        # A SKU repeated within one batch keeps its last occurrence.
+        batch[values["sku"]] = (line, values)
+        if len(batch) >= batch_size:
+            if not _flush_batch(seller_id, batch, result):
+                break
+            batch = {}
+    else:
+        if batch and not result.aborted:
+            _flush_batch(seller_id, batch, result)
+    if result.created or result.updated:
+        catalog_changed.send(current_app._get_current_object(), seller_id=seller_id)
+    return result
@@ -0,0 +1,51 @@
+"""Short-lived, per-process cache of data shared by every marketplace page.
+
+The category and country dropdowns need two ``SELECT DISTINCT`` scans over
+``product``; they change only when listings do. Entries are dropped on
+``catalog_changed`` and otherwise expire after ``LISTING_CACHE_TTL``
+seconds, which bounds staleness for writes made by other workers.
+"""
+
+from flask import current_app
+
+from app.signals import catalog_changed
+from app.utils.cache import TTLCache
+
+_FACETS_KEY = "facets"
+_RECEIVER_CONNECTED = False
+
+
+def _cache():
+    return current_app.extensions.get("listing_cache")
+
+
+def marketplace_facets():
+    """Return ``(categories, countries)`` for the marketplace filters."""
+    from app.models import Product, db
+
+    cache = _cache()
+    facets = cache.get(_FACETS_KEY) if cache is not None else None
+    if facets is None:
+        categories = [c[0] for c in db.session.query(Product.category).distinct() if c[0]]
+        countries = [c[0] for c in db.session.query(Product.country_of_origin).distinct() if c[0]]
+        facets = (categories, countries)
+        if cache is not None:
+            cache.set(_FACETS_KEY, facets)
+    return facets
+
+
+def invalidate(app, **extra):
+    cache = app.extensions.get("listing_cache")
+    if cache is not None:
+        cache.clear()
+
+
+def init_app(app):
+    global _RECEIVER_CONNECTED
+    app.config.setdefault("LISTING_CACHE_TTL", 300)
+    if app.config["LISTING_CACHE_TTL"] <= 0:
+        return
+    app.extensions["listing_cache"] = TTLCache(maxsize=64, ttl=app.config["LISTING_CACHE_TTL"])
+    if not _RECEIVER_CONNECTED:
+        catalog_changed.connect(invalidate)
+        _RECEIVER_CONNECTED = True
@@ -0,0 +1,280 @@
+import click
+from flask import current_app
+
+
+def register_cli(app):
+    app.cli.add_command(startup_report)
+    app.cli.add_command(precompile_templates)
+    app.cli.add_command(build_assets)
+    app.cli.add_command(generate_data)
+    app.cli.add_command(import_products)
+    app.cli.add_command(migrate_uploads)
+    app.cli.add_command(calibrate_password_hash)
+    app.cli.add_command(deliver_webhooks)
+    app.cli.add_command(backfill_change_seq)
+    app.cli.add_command(reshard_messages)
+    app.cli.add_command(db_doctor)
+
+
+def compile_templates(app):
+    """Load every template, filling the bytecode cache. Returns the names loaded."""
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+@click.command("startup-report")
+def startup_report():
+    """Show how long each create_app() phase took."""
+    timings = current_app.extensions.get("startup_timings", {})
+    for name, ms in timings.items():
+        click.echo(f"{name:<12} {ms:>9.2f} ms")
+    if "schema_upgraded" in current_app.extensions:
+        state = "upgraded" if current_app.extensions["schema_upgraded"] else "current (skipped)"
+        click.echo(f"schema       {state}")
+    else:
+        click.echo("schema       not checked (FAST_START)")
+
+
+@click.command("precompile-templates")
+def precompile_templates():
+    """Compile all templates into TEMPLATE_CACHE_DIR (run at build time)."""
+    cache_dir = current_app.config.get("TEMPLATE_CACHE_DIR")
+    if not cache_dir:
+        raise click.ClickException("TEMPLATE_CACHE_DIR is not set; nothing to precompile into.")
+    names = compile_templates(current_app)
+    click.echo(f"Compiled {len(names)} templates into {cache_dir}")
+
+
+@click.command("build-assets")
+def build_assets():
+    """Fingerprint app/static files into the asset manifest (run at build time)."""
+    from app.utils.assets import build_manifest, load_manifest
+
+    path = current_app.config["ASSET_MANIFEST"]
+    manifest = build_manifest(current_app.static_folder, path)
+    load_manifest(current_app, path)
+    click.echo(f"Fingerprinted {len(manifest)} static files into {path}")
+
+
+@click.command("generate-data")
+@click.option("--users", default=100, show_default=True)
+@click.option("--products", default=1000, show_default=True)
+@click.option("--trades", default=1000, show_default=True)
+@click.option("--messages", default=10000, show_default=True)
+@click.option("--attachments", default=500, show_default=True)
+@click.option("--escrow", "escrow_transactions", default=1000, show_default=True)
+@click.option("--skew", default=1.1, show_default=True, help="Zipf exponent for picking users.")
+@click.option("--seed", default=42, show_default=True)
+@click.option("--chunk-size", default=10000, show_default=True)
+@click.option("--reset", is_flag=True, help="Drop and recreate all tables first.")
+def generate_data(reset, **options):
+    """Bulk-insert deterministic synthetic data (users, products, trades, ...)."""
+    from app.extensions import db
+    from app.utils.datagen import DataSpec, generate
+
+    if reset:
+        db.drop_all()
+        db.create_all()
+    spec = DataSpec(**options)
+    report = generate(db.engine, spec, progress=click.echo)
+    first_user = report["user"][0]
+    click.echo(f"Done. Hottest user: user{first_user}.{spec.seed}@example.com / {spec.password}")
+
+
+@click.command("import-products")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--seller", "seller_email", required=True, help="Email of the selling account.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Defaults to the file extension.")
+@click.option("--batch-size", default=1000, show_default=True)
+def import_products(path, seller_email, fmt, batch_size):
+    """Upsert a seller's listings from a CSV or JSON Lines file, keyed on sku."""
+    from app.catalog.importer import import_products as run_import, iter_rows
+    from app.models import User
+
+    seller = User.query.filter_by(email=seller_email.strip().lower()).first()
+    if seller is None:
+        raise click.ClickException(f"No user with email {seller_email}")
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+
+    with open(path, "rb") as f:
+        try:
+            rows = iter_rows(f, fmt)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        result = run_import(seller.id, rows, batch_size=batch_size)
+
+    click.echo(f"{result.rows} rows: {result.created} created, {result.updated} updated, {result.error_count} errors")
+    for error in result.errors:
+        click.echo(f"  line {error.line} [{error.sku}]: {error.message}")
+    if result.aborted:
+        raise click.ClickException("Import stopped early; rows after the last reported line were not saved")
+
+
+@click.command("migrate-uploads")
+@click.option("--from-backend", type=click.Choice(["local", "object"]),
+              help="Copy every object from this backend instead of migrating legacy paths.")
+@click.option("--from-root", help="Root directory of --from-backend (defaults to its usual location).")
+@click.option("--dry-run", is_flag=True, help="Report what would move without changing anything.")
+def migrate_uploads(from_backend, from_root, dry_run):
+    """Move absolute-path uploads and static product images into STORAGE_BACKEND."""
+    import os
+
+    from app.utils.storage import create_storage, get_storage
+    from app.utils.storage_migrate import copy_storage, migrate_legacy_uploads
+
+    target = get_storage()
+    if from_backend:
+        source = create_storage(current_app, backend=from_backend, root=from_root)
+        if os.path.abspath(source.root) == os.path.abspath(target.root) and source.name == target.name:
+            raise click.ClickException("Source and target storage are the same.")
+        copied, skipped = copy_storage(source, target, dry_run=dry_run)
+        click.echo(f"{copied} objects copied, {skipped} already present in {target.name}:{target.root}")
+        return
+
+    images_dir = os.path.join(current_app.static_folder, "uploads", "products")
+    report = migrate_legacy_uploads(target, images_dir, dry_run=dry_run)
+    verb = "would move" if dry_run else "moved"
+    click.echo(f"{report['moved']} files {verb} into {target.name}:{target.root}, {report['skipped']} skipped")
+    for missing in report["missing"]:
+        click.echo(f"  missing: {missing}")
+
+
+@click.command("calibrate-password-hash")
+@click.option("--algorithm", type=click.Choice(["scrypt", "pbkdf2", "bcrypt"]), default="scrypt", show_default=True)
+@click.option("--target-ms", default=250, show_default=True, help="Hashing time to aim for on this host.")
+@click.option("--samples", default=3, show_default=True, help="Hashes timed per candidate cost (median used).")
+def calibrate_password_hash(algorithm, target_ms, samples):
+    """Pick a PASSWORD_HASH_METHOD cost that takes about --target-ms here."""
+    from app.auth.passwords import calibrate
+
+    def progress(method, seconds):
+        click.echo(f"{method:<24} {seconds * 1000:>9.1f} ms")
+
+    try:
+        method, seconds = calibrate(algorithm, target_ms / 1000, samples=samples, progress=progress)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Recommended ({seconds * 1000:.1f} ms per hash):")
+    click.echo(f"PASSWORD_HASH_METHOD={method}")
+
+
+@click.command("deliver-webhooks")
+@click.option("--interval", default=5.0, show_default=True, help="Seconds between delivery passes.")
+@click.option("--once", is_flag=True, help="Run a single pass and exit.")
+def deliver_webhooks(interval, once):
+    """Deliver pending trade events to webhook subscribers (run one worker)."""
+    from app.trades.webhooks import run_worker
+
+    def progress(report):
+        click.echo(
+            f"{report['events']} events in {report['batches']} batches to "
+            f"{report['subscriptions']} subscribers, {report['failed']} failed"
+        )
+
+    report = run_worker(interval, once=once, progress=progress)
+    if once and not (report["batches"] or report["failed"]):
+        click.echo("Nothing to deliver.")
+
+
+@click.command("backfill-change-seq")
+def backfill_change_seq():
+    """Stamp rows written before the change sequence existed (for /api/sync)."""
+    from app.extensions import db
+    from app.utils.change_seq import backfill
+
+    with db.engine.begin() as conn:
+        stamped = backfill(conn)
+    click.echo(f"Stamped {stamped} rows")
+
+
+@click.command("reshard-messages")
+@click.option("--shards", "count", type=int, required=True, help="Shard files to use; 0 moves messages back into the main database.")
+@click.option("--batch-size", type=int, default=1000, show_default=True)
+def reshard_messages(count, batch_size):
+    """Move messages into COUNT shard files by conversation (run with the app stopped)."""
+    from app.utils.message_shards import reshard
+
+    try:
+        moved = reshard(current_app, count, batch_size, progress=lambda n: click.echo(f"  {n} messages copied"))
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    target = f"{count} shard files" if count else "the main database"
+    click.echo(f"Moved {moved} messages into {target}")
+
+
+def _format_bytes(size):
+    if size is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+@click.group("db-doctor", invoke_without_command=True)
+@click.option("--verbose", "-v", is_flag=True, help="Print the plan of every query, not just flagged ones.")
+@click.option("--sizes/--no-sizes", default=True, show_default=True, help="Report table and index sizes.")
+@click.pass_context
+def db_doctor(ctx, verbose, sizes):
+    """Check the query plans of hot queries and report table sizes."""
+    if ctx.invoked_subcommand is not None:
+        return
+    from app.utils.db_doctor import check_all, database_stats, maintenance_engines, table_sizes
+
+    results = check_all(current_app)
+    engines = maintenance_engines(current_app)
+    checked = flagged = 0
+    for name, reports in results:
+        if len(results) > 1:
+            click.echo(f"== {name} ==")
+        for report in reports:
+            status = "FLAG" if report.flagged else "ok"
+            click.echo(f"{status:<5} {report.name}" + (f"  ({report.note})" if report.note and not report.flagged else ""))
+            if report.flagged or verbose:
+                for detail in report.plan:
+                    click.echo(f"        {detail}")
+            for table in report.full_scans if report.flagged else ():
+                click.echo(f"        full scan of {table}")
+            for sort in report.temp_btrees if report.flagged else ():
+                click.echo(f"        temp B-tree for {sort}")
+            for suggestion in report.suggestions:
+                click.echo(f"        suggest: {suggestion};")
+        checked += len(reports)
+        flagged += sum(1 for r in reports if r.flagged)
+    click.echo(f"{checked} queries checked, {flagged} flagged")
+
+    if sizes:
+        for name, engine in engines:
+            stats = database_stats(engine)
+            click.echo("")
+            if len(engines) > 1:
+                click.echo(f"== {name} ==")
+            click.echo(
+                f"{stats['page_count']} pages of {stats['page_size']} bytes, {stats['freelist_count']} free; "
+                f"auto_vacuum={stats['auto_vacuum']} journal_mode={stats['journal_mode']}"
+            )
+            for obj, kind, table, size, rows in table_sizes(engine):
+                owner = f" on {table}" if kind == "index" else ""
+                click.echo(f"{_format_bytes(size):>11}  {'-' if rows is None else rows:>9} rows  {kind} {obj}{owner}")
+    if flagged:
+        ctx.exit(1)
+
+
+@db_doctor.command("maintain")
+@click.option("--interval", default=3600.0, show_default=True, help="Seconds between maintenance passes.")
+@click.option("--once", is_flag=True, help="Run a single pass and exit.")
+@click.option("--force", type=click.Choice(["analyze", "vacuum"]), multiple=True, help="Run this task even if not due.")
+def db_maintain(interval, once, force):
+    """Run ANALYZE and (incremental) VACUUM on the main database and shards when due."""
+    from app.utils.db_doctor import run_maintenance
+
+    def progress(report):
+        for name, ran in report.items():
+            done = ", ".join(f"{task} {seconds * 1000:.0f} ms" for task, seconds in ran.items()) or "nothing due"
+            click.echo(f"{name}: {done}")
+
+    run_maintenance(interval, once=once, force=tuple(force), progress=progress)
@@ -1,5 +1,9 @@
 from datetime import datetime, timezone
+
+from sqlalchemy import func, update
+
 from app.models import EscrowTransaction, Trade, User, db
+from app.utils import metrics
 
 
 class EscrowSimulator:
@@ -10,11 +14,36 @@ class EscrowSimulator:
     EscrowTransaction for auditing.
     """
 
+    def _commit(self, tx: EscrowTransaction):
+        transaction_type = tx.transaction_type
+        db.session.add(tx)
+        db.session.commit()
+        metrics.inc("chainport_escrow_operations_total", {"transaction_type": transaction_type})
+        return tx
+
+    def _adjust_balance(self, user: User, delta: float) -> bool:
+        """Add ``delta`` to the stored balance in one UPDATE.
+
+        The balance is never read into Python first, so concurrent writers
+        (and stale copies of ``user``) cannot lose each other's changes.
+        Returns False, changing nothing, when a debit exceeds the balance.
+        """
+        stmt = update(User).where(User.id == user.id)
+        if delta < 0:
+            stmt = stmt.where(User.escrow_balance >= -delta)
+        result = db.session.execute(
+            stmt.values(escrow_balance=func.coalesce(User.escrow_balance, 0.0) + delta),
+            execution_options={"synchronize_session": False},
+        )
+        if user in db.session:
+            db.session.expire(user, ["escrow_balance"])
+        return result.rowcount == 1
+
     def deposit_to_wallet(self, user: User, amount: float, notes: str = "Manual deposit (simulated)"):
         if amount <= 0:
             raise ValueError("Amount must be positive")
 
-        user.escrow_balance = (user.escrow_balance or 0.0) + float(amount)
+        self._adjust_balance(user, float(amount))
         tx = EscrowTransaction(
             user_id=user.id,
             transaction_type="deposit",
@@ -23,17 +52,14 @@ class EscrowSimulator:
             notes=notes,
             created_at=datetime.now(timezone.utc),
         )
-        db.session.add(tx)
-        db.session.commit()
-        return tx
+        return self._commit(tx)
 
     def withdraw_from_wallet(self, user: User, amount: float, notes: str = "Manual withdrawal (simulated)"):
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        if (user.escrow_balance or 0) < amount:
+        if not self._adjust_balance(user, -float(amount)):
             raise ValueError("Insufficient balance")
 
-        user.escrow_balance -= float(amount)
         tx = EscrowTransaction(
             user_id=user.id,
             transaction_type="withdrawal",
@@ -42,9 +68,7 @@ class EscrowSimulator:
             notes=notes,
             created_at=datetime.now(timezone.utc),
         )
-        db.session.add(tx)
-        db.session.commit()
-        return tx
+        return self._commit(tx)
 
     def deposit_to_trade(self, buyer: User, trade: Trade, amount: float):
         """Move funds from buyer.wallet -> trade.escrow_amount (hold).
@@ -53,14 +77,13 @@ class EscrowSimulator:
         """
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        if (buyer.escrow_balance or 0) < amount:
-            raise ValueError("Insufficient escrow balance")
         if trade.buyer_id != buyer.id:
             raise ValueError("Only buyer can deposit to trade")
         if trade.total_amount and (trade.escrow_amount or 0) + float(amount) > float(trade.total_amount):
             raise ValueError("Escrow deposit exceeds trade total")
+        if not self._adjust_balance(buyer, -float(amount)):
+            raise ValueError("Insufficient escrow balance")
 
-        buyer.escrow_balance -= float(amount)
         trade.escrow_amount = (trade.escrow_amount or 0.0) + float(amount)
         trade.status = "escrow_deposited"
 
@@ -74,9 +97,7 @@ class EscrowSimulator:
             created_at=datetime.now(timezone.utc),
         )
 
-        db.session.add(tx)
-        db.session.commit()
-        return tx
+        return self._commit(tx)
 
     def release_to_seller(self, actor: User, trade: Trade):
         """Release escrowed funds to the seller; only seller or authorized actor.
@@ -93,7 +114,7 @@ class EscrowSimulator:
         if seller is None:
             raise ValueError("Seller not found")
 
-        seller.escrow_balance = (seller.escrow_balance or 0.0) + float(trade.escrow_amount)
+        self._adjust_balance(seller, float(trade.escrow_amount))
 
         tx = EscrowTransaction(
             user_id=seller.id,
@@ -108,9 +129,7 @@ class EscrowSimulator:
         trade.escrow_amount = 0
         trade.status = "completed"
 
-        db.session.add(tx)
-        db.session.commit()
-        return tx
+        return self._commit(tx)
 
     def refund_to_buyer(self, actor: User, trade: Trade):
         """Refund escrowed funds back to the buyer. Sets trade.status to 'cancelled'."""
@@ -123,7 +142,7 @@ class EscrowSimulator:
         if buyer is None:
             raise ValueError("Buyer not found")
 
-        buyer.escrow_balance = (buyer.escrow_balance or 0.0) + float(trade.escrow_amount)
+        self._adjust_balance(buyer, float(trade.escrow_amount))
 
         tx = EscrowTransaction(
             user_id=buyer.id,
@@ -138,6 +157,4 @@ class EscrowSimulator:
         trade.escrow_amount = 0
         trade.status = "cancelled"
 
-        db.session.add(tx)
-        db.session.commit()
-        return tx
+        return self._commit(tx)
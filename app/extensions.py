@@ -2,6 +2,25 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 
-db = SQLAlchemy()
+from app.utils.read_replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
-csrf = CSRFProtect()
+
+
+class ChainPortCSRFProtect(CSRFProtect):
+    """CSRF protection that stands aside for verified signed API requests.
+
+    A signed request carries no ambient credential a third-party page could
+    ride on, so the token check does not apply to it.
+    """
+
+    def protect(self):
+        from app.auth.signed_requests import authenticate_signed_request
+
+        if authenticate_signed_request() is not None:
+            return
+        return super().protect()
+
+
+csrf = ChainPortCSRFProtect()
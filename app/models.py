@@ -1,4 +1,3 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 from app.extensions import db
 from flask_login import UserMixin
@@ -48,19 +47,64 @@ class User(UserMixin, db.Model):
     kyc_documents = db.relationship("KYCDocument", backref="user", lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app.auth.passwords import hash_password
+
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from app.auth.passwords import verify_password
+
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        from app.auth.passwords import needs_rehash
+
+        return needs_rehash(self.password_hash)
 
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
 
 
+class ApiClient(db.Model):
+    """A machine client's ed25519 public key; see app.auth.signed_requests."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    key_id = db.Column(db.String(16), unique=True, nullable=False)
+    public_key = db.Column(db.String(64), unique=True, nullable=False)  # base64, 32 bytes
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    revoked_at = db.Column(db.DateTime)
+
+
+class ApiNonce(db.Model):
+    """A nonce already used by a signed request, shared by every worker."""
+
+    __table_args__ = (
+        db.UniqueConstraint("key_id", "nonce", name="uq_api_nonce_key_nonce"),
+        db.Index("ix_api_nonce_seen_at", "seen_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    key_id = db.Column(db.String(16), nullable=False)
+    nonce = db.Column(db.String(64), nullable=False)
+    seen_at = db.Column(db.Integer, nullable=False)  # unix seconds
+
+
 class Product(db.Model):
+    __table_args__ = (
+        # Seller-supplied SKUs key bulk catalogue imports; NULLs stay allowed.
+        db.Index("ix_product_seller_sku", "seller_id", "sku", unique=True),
+        db.Index("ix_product_change_seq", "change_seq"),
+        # Marketplace: active listings, newest first.
+        db.Index("ix_product_active_created", "is_active", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     seller_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    sku = db.Column(db.String(64))
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     category = db.Column(db.String(50), index=True)
@@ -74,6 +118,8 @@ class Product(db.Model):
     payment_terms = db.Column(db.String(100))
     delivery_terms = db.Column(db.String(100))  # FOB, CIF, etc.
     is_active = db.Column(db.Boolean, default=True)
+    image_key = db.Column(db.String(300))  # storage key of the display image
+    change_seq = db.Column(db.BigInteger)  # see app.utils.change_seq
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(
         db.DateTime,
@@ -83,35 +129,33 @@ class Product(db.Model):
 
     @property
     def image_url(self):
-        """Return a URL for the product image if present in static/uploads/products,
-        otherwise return a placeholder image URL.
-        """
+        """URL of the product image, or a placeholder if none was uploaded."""
+        from flask import url_for
+
         try:
-            from flask import url_for, current_app
-            import os
-
-            # Look for common image extensions named by product id
-            uploads_dir = os.path.join(current_app.static_folder, "uploads", "products")
-            # Prefer a generated thumbnail if present
-            thumb_name = f"{self.id}_thumb.jpg"
-            thumb_path = os.path.join(uploads_dir, thumb_name)
-            if os.path.exists(thumb_path):
-                return url_for("static", filename=f"uploads/products/{thumb_name}")
-
-            candidates = [f"{self.id}.png", f"{self.id}.jpg", f"{self.id}.jpeg", f"{self.id}.webp", f"{self.id}.svg"]
-            for fname in candidates:
-                path = os.path.join(uploads_dir, fname)
-                if os.path.exists(path):
-                    return url_for("static", filename=f"uploads/products/{fname}")
-
-            # Fallback placeholder
+            if self.image_key:
+                return url_for("main.media", key=self.image_key)
             return url_for("static", filename="images/product_placeholder.svg")
-        except Exception:
-            # If not in app context or any error, return a relative path fallback
+        except RuntimeError:
+            # Outside an app/request context
             return "/static/images/product_placeholder.svg"
 
 
 class Trade(db.Model):
+    __table_args__ = (
+        # Per-side trade lists, newest first, optionally narrowed by status;
+        # the status indexes also serve dashboard counts. Filtering by
+        # counterparty pins both parties, so one pair index serves either side.
+        db.Index("ix_trade_buyer_created", "buyer_id", "created_at", "id"),
+        db.Index("ix_trade_buyer_status_created", "buyer_id", "status", "created_at", "id"),
+        db.Index("ix_trade_seller_created", "seller_id", "created_at", "id"),
+        db.Index("ix_trade_seller_status_created", "seller_id", "status", "created_at", "id"),
+        db.Index("ix_trade_pair_created", "buyer_id", "seller_id", "created_at", "id"),
+        # Delta sync: each party's changes after a sequence cursor.
+        db.Index("ix_trade_buyer_seq", "buyer_id", "change_seq"),
+        db.Index("ix_trade_seller_seq", "seller_id", "change_seq"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     seller_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
@@ -135,6 +179,7 @@ class Trade(db.Model):
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
+    change_seq = db.Column(db.BigInteger)
 
     # Relationships
     buyer = db.relationship(
@@ -151,6 +196,14 @@ class Trade(db.Model):
 
 
 class Message(db.Model):
+    __table_args__ = (
+        db.Index("ix_message_sender_seq", "sender_id", "change_seq"),
+        db.Index("ix_message_receiver_seq", "receiver_id", "change_seq"),
+        # Threads and unread flags by (sender, receiver) pair; trade threads.
+        db.Index("ix_message_pair_time", "sender_id", "receiver_id", "timestamp"),
+        db.Index("ix_message_trade_time", "trade_id", "timestamp"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     receiver_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
@@ -159,6 +212,7 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    change_seq = db.Column(db.BigInteger)
 
     # Relationships
     sender = db.relationship(
@@ -176,13 +230,20 @@ class MessageAttachment(db.Model):
     message_id = db.Column(db.Integer, db.ForeignKey("message.id"), nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # storage key
     content_type = db.Column(db.String(100))
     file_size = db.Column(db.Integer)
+    sha256 = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 
 class EscrowTransaction(db.Model):
+    __table_args__ = (
+        db.Index("ix_escrow_transaction_user_seq", "user_id", "change_seq"),
+        # Escrow history and the preferred chat partner, newest first.
+        db.Index("ix_escrow_transaction_user_created", "user_id", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     trade_id = db.Column(db.Integer, db.ForeignKey("trade.id"), nullable=True, index=True)
@@ -195,17 +256,60 @@ class EscrowTransaction(db.Model):
     reference_id = db.Column(db.String(100))  # external payment reference
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    change_seq = db.Column(db.BigInteger)
+
+
+class TradeEvent(db.Model):
+    """Append-only history of trade changes; see app.trades.events."""
+
+    __table_args__ = (
+        # Webhook delivery reads each party's events after a cursor.
+        db.Index("ix_trade_event_buyer_id", "buyer_id", "id"),
+        db.Index("ix_trade_event_seller_id", "seller_id", "id"),
+        db.Index("ix_trade_event_trade_id", "trade_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    trade_id = db.Column(db.Integer, db.ForeignKey("trade.id"), nullable=False)
+    buyer_id = db.Column(db.Integer, nullable=False)
+    seller_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(30), nullable=False)  # trade.created, trade.status_changed
+    old_status = db.Column(db.String(20))
+    new_status = db.Column(db.String(20))
+    actor_id = db.Column(db.Integer)
+    payload = db.Column(db.Text, nullable=False)  # JSON snapshot of the trade
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    trade = db.relationship("Trade")
+
+
+class WebhookSubscription(db.Model):
+    """Where a user's trade events are delivered; see app.trades.webhooks."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    # Highest TradeEvent id delivered; everything after it is pending.
+    last_event_id = db.Column(db.Integer, default=0, nullable=False)
+    failures = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 
 class KYCDocument(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     document_type = db.Column(
         db.String(50), nullable=False
     )  # business_license, tax_id, passport, etc.
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # storage key
+    file_size = db.Column(db.Integer)
+    sha256 = db.Column(db.String(64))
     status = db.Column(db.String(20), default="pending")  # pending, approved, rejected
     uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     reviewed_at = db.Column(db.DateTime)
@@ -1,9 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 import os
 import base64
 import uuid
 import io
+import secrets
+from urllib.parse import urlsplit
 
 from flask import (
     Blueprint,
@@ -17,9 +19,11 @@ from flask import (
     current_app,
     abort,
     send_file,
+    stream_with_context,
 )
 
 from flask_login import login_required, current_user
+from sqlalchemy import select
 from werkzeug.utils import secure_filename
 
 from app.models import (
@@ -30,19 +34,25 @@ from app.models import (
     MessageAttachment,
     EscrowTransaction,
     KYCDocument,
+    WebhookSubscription,
     db,
 )
 from app.extensions import csrf
-from app.escrow.simulator import EscrowSimulator
-from app.utils.pdf_report import create_trade_pdf
-
-# Optional PyNaCl import for ed25519 verification; wallet endpoints degrade if unavailable
-try:
-    import nacl.signing
-    _HAS_PYNACL = True
-except Exception:
-    nacl = None
-    _HAS_PYNACL = False
+from app.catalog.listing_cache import marketplace_facets
+from app.signals import catalog_changed
+from app.trades.events import serialize_event, trade_events
+from app.trades.stats import recent_trades, trade_stats
+from app.trades.suggestions import escrow_counterparties
+from app.trades.webhooks import UnsafeWebhookURL, check_url, latest_event_id
+from app.utils import message_shards, metrics
+from app.utils.page_cache import cached_page
+from app.utils.storage import get_storage, make_key
+from app.utils.sync import changes_since
+from app.utils.uploads import max_content_length, upload_exceeded, upload_limit
+
+# The escrow simulator, PDF report (reportlab/Pillow) and PyNaCl are imported
+# on first use so worker boot and test start-up do not pay for them.
+_NACL_SIGNING = None
 
 main_bp = Blueprint("main", __name__)
 
@@ -59,19 +69,7 @@ def get_or_404(model, obj_id):
 
 
 def build_conversations(user_id):
-    messages = (
-        Message.query.filter(
-            (Message.sender_id == user_id) | (Message.receiver_id == user_id)
-        )
-        .order_by(Message.timestamp.desc())
-        .all()
-    )
-
-    latest_by_user = {}
-    for msg in messages:
-        other_id = msg.receiver_id if msg.sender_id == user_id else msg.sender_id
-        if other_id not in latest_by_user:
-            latest_by_user[other_id] = msg
+    latest_by_user = message_shards.latest_by_conversation(user_id)
 
     conversations = []
     for other_id, last_message in latest_by_user.items():
@@ -103,12 +101,30 @@ def get_preferred_chat_user_id(user_id):
     return None
 
 
+def _load_nacl_signing():
+    """Return ``nacl.signing`` or None; wallet endpoints degrade if unavailable."""
+    global _NACL_SIGNING
+    if _NACL_SIGNING is None:
+        try:
+            import nacl.signing
+
+            _NACL_SIGNING = nacl.signing
+        except Exception:
+            _NACL_SIGNING = False
+    return _NACL_SIGNING or None
+
+
+def _megabytes(limit):
+    return f"{limit / (1024 * 1024):g} MB"
+
+
 def allowed_file(filename, allowed_extensions):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in allowed_extensions
 
 
 @main_bp.route('/product/<int:product_id>/upload-image', methods=['POST'])
 @login_required
+@upload_limit(lambda config: config["PRODUCT_IMAGE_MAX_BYTES"])
 def upload_product_image(product_id):
     product = get_or_404(Product, product_id)
 
@@ -127,50 +143,46 @@ def upload_product_image(product_id):
         return redirect(url_for('main.product_detail', product_id=product.id))
 
     ALLOWED = {'png', 'jpg', 'jpeg', 'webp', 'svg'}
-    MAX_BYTES = 2 * 1024 * 1024  # 2 MB
     if file and allowed_file(file.filename, ALLOWED):
         filename = secure_filename(file.filename)
         ext = filename.rsplit('.', 1)[1].lower()
 
-        uploads_dir = os.path.join(current_app.static_folder, 'uploads', 'products')
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        dest_name = f"{product.id}.{ext}"
-        dest_path = os.path.join(uploads_dir, dest_name)
-
-        # Read file into memory first to enforce size limits
-        from io import BytesIO
-        data = file.read()
-        if len(data) > MAX_BYTES:
-            flash('Image too large. Maximum size is 2 MB.', 'error')
+        # The body was streamed to a temp file and cut off at the limit.
+        if upload_exceeded(file):
+            flash(f'Image too large. Maximum size is {_megabytes(current_app.config["PRODUCT_IMAGE_MAX_BYTES"])}.', 'error')
             return redirect(url_for('main.product_detail', product_id=product.id))
 
-        # Remove existing images for this product with other extensions
-        for cand_ext in ALLOWED:
-            cand = os.path.join(uploads_dir, f"{product.id}.{cand_ext}")
-            try:
-                if os.path.exists(cand) and os.path.abspath(cand) != os.path.abspath(dest_path):
-                    os.remove(cand)
-            except Exception:
-                pass
+        storage = get_storage()
+        stem = f"{product.id}-{uuid.uuid4().hex}"
+        key = make_key('products', f"{stem}.{ext}")
 
-        # Save uploaded bytes
+        # Move the uploaded temp file into storage
         try:
-            with open(dest_path, 'wb') as f:
-                f.write(data)
+            storage.save(file, key)
+            image_key = key
 
-            # Create a standard JPG thumbnail (preserve aspect) if Pillow available
+            # Replace it with a standard JPG thumbnail (preserve aspect) if Pillow available
             try:
                 from PIL import Image
-                img_buf = BytesIO(data)
-                with Image.open(img_buf) as im:
+                with storage.open(key) as fh, Image.open(fh) as im:
                     im = im.convert('RGB')
                     im.thumbnail((800, 800))
-                    thumb_path = os.path.join(uploads_dir, f"{product.id}_thumb.jpg")
-                    im.save(thumb_path, format='JPEG', quality=85)
+                    thumb = io.BytesIO()
+                    im.save(thumb, format='JPEG', quality=85)
+                thumb.seek(0)
+                thumb_key = make_key('products', f"{stem}-thumb.jpg")
+                storage.save_stream(thumb, thumb_key, 'image/jpeg')
+                image_key = thumb_key
+                storage.delete(key)
             except Exception:
-                thumb_path = None
+                pass
 
+            previous_key = product.image_key
+            product.image_key = image_key
+            db.session.commit()
+            catalog_changed.send(current_app._get_current_object(), seller_id=product.seller_id)
+            if previous_key:
+                storage.delete(previous_key)
             flash('Product image uploaded successfully.', 'success')
         except Exception as e:
             flash(f'Failed to save image: {e}', 'error')
@@ -181,6 +193,95 @@ def upload_product_image(product_id):
     return redirect(url_for('main.product_detail', product_id=product.id))
 
 
+_IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/x-jsonlines": "jsonl",
+}
+
+
+@main_bp.route("/api/products/import", methods=["POST"])
+@login_required
+@max_content_length(lambda config: config["PRODUCT_IMPORT_MAX_BYTES"])
+def import_products():
+    """Bulk create/update the current seller's listings, keyed on ``sku``.
+
+    Send the file either as multipart field ``file`` or as the raw request
+    body with a CSV/JSON Lines content type; raw bodies are read straight
+    from the request stream.
+    """
+    from app.catalog.importer import import_products as run_import, iter_rows
+
+    fmt = (request.args.get("format") or "").lower() or None
+    upload = request.files.get("file") if request.mimetype == "multipart/form-data" else None
+    if upload is not None:
+        if not fmt and "." in (upload.filename or ""):
+            fmt = upload.filename.rsplit(".", 1)[1].lower()
+        stream = upload.stream
+    else:
+        fmt = fmt or _IMPORT_CONTENT_TYPES.get(request.mimetype)
+        stream = request.stream
+
+    try:
+        rows = iter_rows(stream, fmt or "")
+    except ValueError:
+        return jsonify({"error": "Upload a .csv or .jsonl file (or set ?format=csv|jsonl)"}), 400
+
+    result = run_import(current_user.id, rows)
+    if result.aborted and not result.rows:
+        return jsonify(result.as_dict()), 400
+    return jsonify(result.as_dict()), 200 if not result.error_count else 207
+
+
+@main_bp.route("/api/products/export")
+@login_required
+def export_products():
+    """Stream the current seller's listings as CSV (default) or JSON Lines.
+
+    Query parameters other than ``format`` filter the export, e.g.
+    ``?category=plywood&is_active=true``.
+    """
+    from app.catalog.exporter import CONTENT_TYPES, export_statement, iter_export
+
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in CONTENT_TYPES:
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    criteria = {k: v for k, v in request.args.items() if k != "format"}
+    try:
+        statement = export_statement(current_user.id, criteria)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filename = f"products-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    return current_app.response_class(
+        stream_with_context(iter_export(statement, fmt)),
+        mimetype=CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@main_bp.route("/api/products/bulk-update", methods=["POST"])
+@login_required
+def bulk_update_products():
+    """Reprice, (de)activate or relabel many listings in one statement.
+
+    Body: ``{"filter": {...}, "price_percent": -5}``; see
+    :func:`app.catalog.bulk.bulk_update_products` for the accepted keys.
+    """
+    from app.catalog.bulk import bulk_update_products as run_update
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    changes = {k: v for k, v in data.items() if k != "filter"}
+    try:
+        updated = run_update(current_user.id, data.get("filter"), changes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "updated": updated})
+
+
 def _serialize_message(msg):
     return {
         "id": msg.id,
@@ -203,46 +304,35 @@ def _serialize_message(msg):
 
 # Landing Page
 @main_bp.route("/")
+@cached_page()
 def index():
     return render_template("index.html")
 
 
 # Dashboard (public + user)
 @main_bp.route("/dashboard")
+@cached_page()
 def dashboard():
     # If user is not authenticated, show a public demo dashboard
     if not current_user.is_authenticated:
         return render_template("dashboard_public.html")
 
     user = current_user
-    trades = (
-        Trade.query.filter((Trade.buyer_id == user.id) | (Trade.seller_id == user.id))
-        .limit(5)
-        .all()
-    )
-
-    # Calculate stats
-    active_trades = len(
-        [
-            t
-            for t in trades
-            if t.status in ["pending", "escrow_deposited", "in_progress"]
-        ]
-    )
-    completed_trades = len([t for t in trades if t.status == "completed"])
-    total_deals = len(trades)
+    stats = trade_stats(user.id)
 
     return render_template(
         "dashboard.html",
         user=user,
-        trades=trades,
-        active_trades=active_trades,
-        completed_trades=completed_trades,
-        total_deals=total_deals,
+        trades=recent_trades(user.id),
+        active_trades=stats.active_trades,
+        completed_trades=stats.completed_trades,
+        total_deals=stats.total_deals,
+        gmv=stats.gmv,
     )
 
 
 @main_bp.route("/marketplace")
+@cached_page("page", "search", "category", "country", "verified")
 def marketplace():
     page = request.args.get("page", 1, type=int)
     per_page = 9
@@ -293,8 +383,7 @@ def marketplace():
     products = query.paginate(page=page, per_page=per_page, error_out=False)
 
     # Dropdown data
-    categories = [c[0] for c in db.session.query(Product.category).distinct() if c[0]]
-    countries = [c[0] for c in db.session.query(Product.country_of_origin).distinct() if c[0]]
+    categories, countries = marketplace_facets()
 
     return render_template(
         "marketplace.html",
@@ -373,9 +462,7 @@ def trade_detail(trade_id):
         flash("You don't have permission to view this trade.", "error")
         return redirect(url_for("main.dashboard"))
 
-    messages = (
-        Message.query.filter_by(trade_id=trade_id).order_by(Message.timestamp).all()
-    )
+    messages = message_shards.trade_messages(trade)
 
     return render_template("trade_detail.html", trade=trade, messages=messages)
 
@@ -383,11 +470,36 @@ def trade_detail(trade_id):
 @main_bp.route("/trades")
 @login_required
 def trades():
-    user = current_user
-    user_trades = Trade.query.filter(
-        (Trade.buyer_id == user.id) | (Trade.seller_id == user.id)
-    ).all()
-    return render_template("trades.html", trades=user_trades)
+    from app.trades.listing import ROLES, STATUSES, list_trades
+
+    role = request.args.get("role", "all")
+    status = request.args.get("status", "")
+    counterparty_id = request.args.get("counterparty", type=int)
+    try:
+        page = list_trades(
+            current_user.id,
+            role=role,
+            status=status or None,
+            counterparty_id=counterparty_id,
+            cursor=request.args.get("cursor"),
+            page_size=request.args.get("per_page", 25, type=int),
+        )
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for("main.trades"))
+
+    counterparty = db.session.get(User, counterparty_id) if counterparty_id else None
+    filters = {"role": role, "status": status, "counterparty": counterparty_id}
+    return render_template(
+        "trades.html",
+        trades=page.trades,
+        next_cursor=page.next_cursor,
+        filters={k: v for k, v in filters.items() if v and v != "all"},
+        roles=ROLES,
+        statuses=STATUSES,
+        counterparty=counterparty,
+        is_first_page=not request.args.get("cursor"),
+    )
 
 
 @main_bp.route("/escrow")
@@ -413,6 +525,8 @@ def escrow_deposit():
         return redirect(url_for("main.escrow"))
     # In a real application, this would integrate with a payment gateway.
     # Use simulator to perform and record the deposit.
+    from app.escrow.simulator import EscrowSimulator
+
     sim = EscrowSimulator()
     try:
         sim.deposit_to_wallet(current_user, amount)
@@ -431,6 +545,8 @@ def escrow_withdraw():
     if amount <= 0:
         flash("Please enter a valid amount.", "error")
         return redirect(url_for("main.escrow"))
+    from app.escrow.simulator import EscrowSimulator
+
     sim = EscrowSimulator()
     try:
         sim.withdraw_from_wallet(current_user, amount)
@@ -441,6 +557,37 @@ def escrow_withdraw():
     return redirect(url_for("main.escrow"))
 
 
+@main_bp.route("/api/escrow/wallet")
+@login_required
+def api_escrow_wallet():
+    # Read the balance itself rather than the (possibly cached) current_user.
+    balance = db.session.scalar(select(User.escrow_balance).where(User.id == current_user.id))
+    since_id = request.args.get("since_id", type=int) or 0
+    transactions = (
+        EscrowTransaction.query.filter(
+            EscrowTransaction.user_id == current_user.id, EscrowTransaction.id > since_id
+        )
+        .order_by(EscrowTransaction.id.desc())
+        .limit(20)
+        .all()
+    )
+    return jsonify({
+        "balance": balance or 0.0,
+        "transactions": [
+            {
+                "id": tx.id,
+                "trade_id": tx.trade_id,
+                "transaction_type": tx.transaction_type,
+                "amount": tx.amount,
+                "currency": tx.currency,
+                "status": tx.status,
+                "created_at": tx.created_at.isoformat() if tx.created_at else None,
+            }
+            for tx in transactions
+        ],
+    })
+
+
 @main_bp.route("/messages")
 @login_required
 def messages():
@@ -453,23 +600,10 @@ def messages():
     if selected_user_id:
         selected_user = db.session.get(User, selected_user_id)
         if selected_user:
-            Message.query.filter_by(
-                sender_id=selected_user.id,
-                receiver_id=current_user.id,
-                is_read=False,
-            ).update({"is_read": True})
-            db.session.commit()
-
-            thread_messages = (
-                Message.query.filter(
-                    ((Message.sender_id == current_user.id) & (Message.receiver_id == selected_user.id))
-                    | ((Message.sender_id == selected_user.id) & (Message.receiver_id == current_user.id))
-                )
-                .order_by(Message.timestamp.desc())
-                .limit(200)
-                .all()
+            message_shards.mark_read(current_user.id, selected_user.id)
+            thread_messages = message_shards.thread(
+                current_user._get_current_object(), selected_user, limit=200, newest=True
             )
-            thread_messages = list(reversed(thread_messages))
 
     return render_template(
         "messages.html",
@@ -512,12 +646,14 @@ def conversation(user_id):
 
 @main_bp.route("/send-message", methods=["POST"])
 @login_required
+@upload_limit(lambda config: config["MESSAGE_ATTACHMENT_MAX_BYTES"])
 def send_message():
     now = time.time()
     key = f"user:{current_user.id}"
     timestamps = _MESSAGE_RATE_LIMIT.get(key, [])
     timestamps = [ts for ts in timestamps if now - ts < _MESSAGE_RATE_WINDOW]
     if len(timestamps) >= _MESSAGE_RATE_MAX:
+        metrics.inc("chainport_rate_limit_rejections_total", {"limiter": "send_message"})
         flash("You are sending messages too quickly. Please wait and try again.", "error")
         return redirect(request.referrer or url_for("main.messages"))
     timestamps.append(now)
@@ -573,41 +709,49 @@ def send_message():
         flash("All selected attachments are invalid file types.", "error")
         return redirect(request.referrer or url_for("main.messages"))
 
+    too_large = [f.filename for f in valid_files if upload_exceeded(f)]
+    if too_large:
+        limit = _megabytes(current_app.config["MESSAGE_ATTACHMENT_MAX_BYTES"])
+        flash(f"{', '.join(too_large)} exceeds the {limit} attachment limit.", "error")
+        return redirect(request.referrer or url_for("main.messages", user_id=receiver.id))
+
     if not content and not valid_files:
         flash("Message cannot be empty.", "error")
         return redirect(request.referrer or url_for("main.messages"))
 
-    message = Message(
-        sender_id=current_user.id,
-        receiver_id=receiver.id,
-        trade_id=trade_id,
-        subject=subject,
-        content=content,
-    )
+    with message_shards.session_for(current_user.id, receiver.id) as session:
+        message = Message(
+            sender_id=current_user.id,
+            receiver_id=receiver.id,
+            trade_id=trade_id,
+            subject=subject,
+            content=content,
+        )
 
-    db.session.add(message)
-    db.session.commit()
+        session.add(message)
+        session.commit()
 
-    if valid_files:
-        for file in valid_files:
-            original_filename = file.filename
-            safe_name = secure_filename(original_filename)
-            base_name, ext = os.path.splitext(safe_name)
-            if not base_name:
-                base_name = "attachment"
-            unique_name = f"{base_name}-{uuid.uuid4().hex}{ext.lower()}"
-            file_path = os.path.join(current_app.config["MESSAGE_UPLOAD_FOLDER"], unique_name)
-            file.save(file_path)
-            attachment = MessageAttachment(
-                message_id=message.id,
-                filename=unique_name,
-                original_filename=original_filename,
-                file_path=file_path,
-                content_type=file.mimetype,
-                file_size=os.path.getsize(file_path),
-            )
-            db.session.add(attachment)
-        db.session.commit()
+        if valid_files:
+            for file in valid_files:
+                original_filename = file.filename
+                safe_name = secure_filename(original_filename)
+                base_name, ext = os.path.splitext(safe_name)
+                if not base_name:
+                    base_name = "attachment"
+                unique_name = f"{base_name}-{uuid.uuid4().hex}{ext.lower()}"
+                key = make_key("messages", unique_name)
+                file_size, digest = get_storage().save(file, key)
+                attachment = MessageAttachment(
+                    message_id=message.id,
+                    filename=unique_name,
+                    original_filename=original_filename,
+                    file_path=key,
+                    content_type=file.mimetype,
+                    file_size=file_size,
+                    sha256=digest,
+                )
+                session.add(attachment)
+            session.commit()
 
     flash("Message sent successfully!", "success")
     return redirect(url_for("main.messages", user_id=receiver.id))
@@ -616,7 +760,7 @@ def send_message():
 @main_bp.route("/messages/attachment/<int:attachment_id>")
 @login_required
 def message_attachment(attachment_id):
-    attachment = db.session.get(MessageAttachment, attachment_id)
+    attachment = message_shards.get_attachment(attachment_id)
     if not attachment:
         abort(404)
     if (
@@ -624,15 +768,29 @@ def message_attachment(attachment_id):
         and attachment.message.receiver_id != current_user.id
     ):
         abort(403)
-    if not os.path.exists(attachment.file_path):
+    storage = get_storage()
+    if not storage.exists(attachment.file_path):
         abort(404)
-    return send_file(
+    return storage.send(
         attachment.file_path,
         as_attachment=True,
         download_name=attachment.original_filename,
+        mimetype=attachment.content_type,
     )
 
 
+@main_bp.route("/media/<path:key>")
+def media(key):
+    """Public product images; keys are unique per upload, so cache forever."""
+    storage = get_storage()
+    if not key.startswith("products/") or not storage.exists(key):
+        abort(404)
+    response = storage.send(key, max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @main_bp.route("/api/messages/thread/<int:user_id>")
 @login_required
 def api_thread(user_id):
@@ -641,67 +799,29 @@ def api_thread(user_id):
         return jsonify({"error": "User not found"}), 404
 
     since_id = request.args.get("since_id", type=int)
-    query = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id))
-        | ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp)
-
     limit = request.args.get("limit", type=int) or 200
     limit = max(1, min(limit, 500))
 
-    if since_id:
-        query = query.filter(Message.id > since_id)
-
-    messages = query.limit(limit).all()
+    messages = message_shards.thread(current_user._get_current_object(), other_user, since_id, limit)
     return jsonify({"messages": [_serialize_message(m) for m in messages]})
 
 
-@main_bp.route("/api/messages/escrow-suggestions")
+@main_bp.route("/api/sync")
 @login_required
-def api_escrow_suggestions():
-    trade_ids = set(
-        row[0]
-        for row in db.session.query(EscrowTransaction.trade_id)
-        .filter(EscrowTransaction.user_id == current_user.id)
-        .filter(EscrowTransaction.trade_id.isnot(None))
-        .distinct()
-        .all()
-        if row[0] is not None
-    )
+def api_sync():
+    """Changes visible to the user after ``since``; resume from ``next``.
 
-    # Also include all trades where the user is buyer or seller.
-    trade_ids.update(
-        row[0]
-        for row in db.session.query(Trade.id)
-        .filter((Trade.buyer_id == current_user.id) | (Trade.seller_id == current_user.id))
-        .all()
-    )
+    With sharded messages, also resume from ``message_cursor``.
+    """
+    since = request.args.get("since", type=int) or 0
+    limit = max(1, min(request.args.get("limit", type=int) or 500, 1000))
+    return jsonify(changes_since(current_user.id, since, limit, request.args.get("message_cursor")))
 
-    if not trade_ids:
-        return jsonify({"users": []})
-
-    trades = Trade.query.filter(Trade.id.in_(list(trade_ids))).all()
-    user_ids = set()
-    for trade in trades:
-        if trade.buyer_id == current_user.id and trade.seller_id:
-            user_ids.add(trade.seller_id)
-        elif trade.seller_id == current_user.id and trade.buyer_id:
-            user_ids.add(trade.buyer_id)
-
-    users = []
-    for uid in user_ids:
-        u = db.session.get(User, uid)
-        if u:
-            users.append(
-                {
-                    "id": u.id,
-                    "name": u.company_name or u.full_name or u.email,
-                    "email": u.email,
-                }
-            )
 
-    users.sort(key=lambda x: x["name"].lower())
-    return jsonify({"users": users})
+@main_bp.route("/api/messages/escrow-suggestions")
+@login_required
+def api_escrow_suggestions():
+    return jsonify({"users": escrow_counterparties(current_user.id)})
 
 
 @main_bp.route("/profile")
@@ -713,6 +833,7 @@ def profile():
 
 @main_bp.route("/kyc", methods=["GET", "POST"])
 @login_required
+@upload_limit(lambda config: config["KYC_DOCUMENT_MAX_BYTES"])
 def kyc():
     if request.method == "POST":
         # Handle file uploads
@@ -727,30 +848,39 @@ def kyc():
             flash("Tax ID is too short.", "error")
             return redirect(url_for("main.kyc"))
 
-        has_valid_doc = False
-        for file in uploaded_files:
-            if file and allowed_file(
-                file.filename, current_app.config["ALLOWED_EXTENSIONS"]
-            ):
-                has_valid_doc = True
-                original_filename = file.filename
-                safe_name = secure_filename(original_filename)
-                base_name, ext = os.path.splitext(safe_name)
-                if not base_name:
-                    base_name = "document"
-                unique_name = f"{base_name}-{uuid.uuid4().hex}{ext.lower()}"
-                file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], unique_name)
-                file.save(file_path)
+        valid_files = [
+            f
+            for f in uploaded_files
+            if f and allowed_file(f.filename, current_app.config["ALLOWED_EXTENSIONS"])
+        ]
+        too_large = [f.filename for f in valid_files if upload_exceeded(f)]
+        if too_large:
+            limit = _megabytes(current_app.config["KYC_DOCUMENT_MAX_BYTES"])
+            flash(f"{', '.join(too_large)} exceeds the {limit} limit per document.", "error")
+            return redirect(url_for("main.kyc"))
 
-                kyc_doc = KYCDocument(
-                    user_id=current_user.id,
-                    document_type=request.form.get("document_type", "general"),
-                    filename=unique_name,
-                    original_filename=original_filename,
-                    file_path=file_path,
-                )
+        has_valid_doc = bool(valid_files)
+        for file in valid_files:
+            original_filename = file.filename
+            safe_name = secure_filename(original_filename)
+            base_name, ext = os.path.splitext(safe_name)
+            if not base_name:
+                base_name = "document"
+            unique_name = f"{base_name}-{uuid.uuid4().hex}{ext.lower()}"
+            key = make_key("kyc", unique_name)
+            file_size, digest = get_storage().save(file, key)
+
+            kyc_doc = KYCDocument(
+                user_id=current_user.id,
+                document_type=request.form.get("document_type", "general"),
+                filename=unique_name,
+                original_filename=original_filename,
+                file_path=key,
+                file_size=file_size,
+                sha256=digest,
+            )
 
-                db.session.add(kyc_doc)
+            db.session.add(kyc_doc)
 
         if not has_valid_doc:
             flash("Please upload at least one valid document.", "error")
@@ -830,6 +960,66 @@ def update_trade_status(trade_id):
     return jsonify({"success": True, "status": new_status})
 
 
+@main_bp.route("/api/trade/<int:trade_id>/events")
+@login_required
+def api_trade_events(trade_id):
+    trade = get_or_404(Trade, trade_id)
+    if trade.buyer_id != current_user.id and trade.seller_id != current_user.id:
+        return jsonify({"error": "Permission denied"}), 403
+    return jsonify({"events": [serialize_event(e) for e in trade_events(trade.id)]})
+
+
+def _serialize_webhook(subscription):
+    return {
+        "id": subscription.id,
+        "url": subscription.url,
+        "is_active": subscription.is_active,
+        "last_event_id": subscription.last_event_id,
+        "failures": subscription.failures,
+        "next_attempt_at": subscription.next_attempt_at.isoformat() if subscription.next_attempt_at else None,
+        "last_error": subscription.last_error,
+    }
+
+
+@main_bp.route("/api/webhooks", methods=["GET", "POST"])
+@login_required
+def api_webhooks():
+    """List or add the current user's trade event webhooks."""
+    if request.method == "GET":
+        subscriptions = WebhookSubscription.query.filter_by(user_id=current_user.id).order_by(WebhookSubscription.id)
+        return jsonify({"webhooks": [_serialize_webhook(s) for s in subscriptions]})
+
+    data = request.get_json(silent=True) or {}
+    url = (data.get("url") or "").strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc or len(url) > 500:
+        return jsonify({"error": "url must be an absolute http(s) URL"}), 400
+    try:
+        check_url(url, current_app.config["WEBHOOK_ALLOW_PRIVATE"])
+    except UnsafeWebhookURL as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Deliveries start from events recorded after the subscription.
+    subscription = WebhookSubscription(
+        user_id=current_user.id, url=url, secret=secrets.token_hex(32), last_event_id=latest_event_id()
+    )
+    db.session.add(subscription)
+    db.session.commit()
+    # The signing secret is only ever shown here.
+    return jsonify(dict(_serialize_webhook(subscription), secret=subscription.secret)), 201
+
+
+@main_bp.route("/api/webhooks/<int:subscription_id>", methods=["DELETE"])
+@login_required
+def delete_webhook(subscription_id):
+    subscription = WebhookSubscription.query.filter_by(id=subscription_id, user_id=current_user.id).first()
+    if subscription is None:
+        return jsonify({"error": "Not found"}), 404
+    subscription.is_active = False
+    db.session.commit()
+    return jsonify({"success": True})
+
+
 @main_bp.route("/api/trade/<int:trade_id>/escrow", methods=["POST"])
 @login_required
 def manage_escrow(trade_id):
@@ -846,6 +1036,8 @@ def manage_escrow(trade_id):
     except (TypeError, ValueError):
         return jsonify({"error": "Invalid amount"}), 400
 
+    from app.escrow.simulator import EscrowSimulator
+
     sim = EscrowSimulator()
     try:
         if action == "deposit":
@@ -904,6 +1096,8 @@ def trade_report(trade_id, tx_id):
         tx = db.session.get(EscrowTransaction, tx_id)
 
     try:
+        from app.utils.pdf_report import create_trade_pdf
+
         buf = create_trade_pdf(trade, tx)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -930,7 +1124,8 @@ def wallet_verify():
     if not (pub_b64 and sig_b64 and challenge_b64):
         return jsonify({'error': 'Missing fields or no challenge'}), 400
 
-    if not _HAS_PYNACL:
+    signing = _load_nacl_signing()
+    if signing is None:
         return jsonify({'error': 'Server missing PyNaCl for signature verification'}), 501
 
     try:
@@ -938,7 +1133,7 @@ def wallet_verify():
         sig_bytes = base64.b64decode(sig_b64)
         challenge_bytes = base64.b64decode(challenge_b64)
 
-        verify_key = nacl.signing.VerifyKey(pub_bytes)
+        verify_key = signing.VerifyKey(pub_bytes)
         verify_key.verify(challenge_bytes, sig_bytes)
 
     except Exception:
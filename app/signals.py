@@ -0,0 +1,12 @@
+"""Application-level signals.
+
+``catalog_changed`` is sent with the Flask app as sender after a commit that
+changes product listings; ``seller_id`` is passed as a keyword argument.
+Receivers drop whatever they cache about listings.
+"""
+
+from blinker import Namespace
+
+_signals = Namespace()
+
+catalog_changed = _signals.signal("catalog-changed")
@@ -0,0 +1,102 @@
+"""Append-only trade event log (a transactional outbox).
+
+A ``before_flush`` listener adds a ``TradeEvent`` for every new ``Trade``
+and every change to ``Trade.status`` to the flush that writes the change,
+so an event is committed exactly when its change is, whichever code path
+made it (views, ``EscrowSimulator``, scripts). Each event carries a JSON
+snapshot of the trade, so readers such as the webhook worker never need to
+join back to a row that may have changed since.
+
+Bulk ``query.update()`` statements bypass the ORM and are not recorded.
+"""
+
+import json
+
+from flask import g, has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Trade, TradeEvent
+
+SNAPSHOT_FIELDS = (
+    "buyer_id",
+    "seller_id",
+    "product_id",
+    "quantity",
+    "unit",
+    "price_per_unit",
+    "total_amount",
+    "currency",
+    "status",
+    "escrow_amount",
+)
+
+_LISTENERS_INSTALLED = False
+
+
+def _actor_id():
+    # Only use a user Flask-Login has already loaded; never query mid-flush.
+    if not has_request_context():
+        return None
+    return getattr(g.get("_login_user"), "id", None)
+
+
+def _record(session, trade, event_type, old_status, new_status, actor_id):
+    snapshot = {name: getattr(trade, name) for name in SNAPSHOT_FIELDS}
+    snapshot["status"] = new_status
+    session.add(TradeEvent(
+        trade=trade,
+        buyer_id=trade.buyer_id,
+        seller_id=trade.seller_id,
+        event_type=event_type,
+        old_status=old_status,
+        new_status=new_status,
+        actor_id=actor_id,
+        payload=json.dumps(snapshot),
+    ))
+
+
+def _before_flush(session, flush_context, instances):
+    actor_id = None
+    for obj in session.new:
+        if isinstance(obj, Trade):
+            actor_id = actor_id or _actor_id()
+            _record(session, obj, "trade.created", None, obj.status or "pending", actor_id)
+    for obj in session.dirty:
+        if not isinstance(obj, Trade):
+            continue
+        history = inspect(obj).attrs.status.history
+        old = history.deleted[0] if history.deleted else None
+        if not history.added or history.added[0] == old:
+            continue
+        actor_id = actor_id or _actor_id()
+        _record(session, obj, "trade.status_changed", old, history.added[0], actor_id)
+
+
+def serialize_event(event):
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "trade_id": event.trade_id,
+        "old_status": event.old_status,
+        "new_status": event.new_status,
+        "actor_id": event.actor_id,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+        "trade": json.loads(event.payload),
+    }
+
+
+def trade_events(trade_id):
+    return TradeEvent.query.filter_by(trade_id=trade_id).order_by(TradeEvent.id).all()
+
+
+def _install_listeners():
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    event.listen(Session, "before_flush", _before_flush)
+    _LISTENERS_INSTALLED = True
+
+
+def init_app(app):
+    _install_listeners()
@@ -0,0 +1,87 @@
+"""Keyset-paginated, filterable trade lists.
+
+Pages are ordered newest first by ``(created_at, id)`` and continue from an
+opaque cursor holding the last row's key, so page 500 costs the same as
+page 1. Each side of a trade has composite indexes leading with the user's
+column (optionally followed by ``status``) and ending in ``(created_at,
+id)``, plus a ``(buyer_id, seller_id, created_at, id)`` index for
+counterparty filters; every filter combination is an ordered index range
+scan with no sort step. ``role="all"`` runs the buyer-side and seller-side
+queries separately and merges the two sorted results.
+"""
+
+import base64
+import heapq
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from app.models import Trade
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+ROLES = ("all", "buyer", "seller")
+STATUSES = ("pending", "escrow_deposited", "in_progress", "completed", "cancelled", "disputed")
+
+
+@dataclass
+class TradePage:
+    trades: list
+    next_cursor: str = None
+
+
+def encode_cursor(trade):
+    # SQLite stores DateTime without an offset, so compare on the naive value.
+    created_at = trade.created_at.replace(tzinfo=None)
+    raw = f"{created_at.isoformat()}|{trade.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, trade_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(trade_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _side_query(side, user_id, status, counterparty_id, after, limit):
+    own, other = (Trade.buyer_id, Trade.seller_id) if side == "buyer" else (Trade.seller_id, Trade.buyer_id)
+    query = Trade.query.options(joinedload(Trade.buyer), joinedload(Trade.seller)).filter(own == user_id)
+    if side == "seller":
+        # A trade with oneself is listed once, on the buyer side.
+        query = query.filter(Trade.buyer_id != user_id)
+    if counterparty_id is not None:
+        query = query.filter(other == counterparty_id)
+    if status:
+        query = query.filter(Trade.status == status)
+    if after is not None:
+        query = query.filter(tuple_(Trade.created_at, Trade.id) < tuple_(*after))
+    return query.order_by(Trade.created_at.desc(), Trade.id.desc()).limit(limit).all()
+
+
+def list_trades(user_id, role="all", status=None, counterparty_id=None, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return one :class:`TradePage` of the user's trades.
+
+    Raises ``ValueError`` for an unknown role or status or a malformed cursor.
+    """
+    if role not in ROLES:
+        raise ValueError(f"role must be one of {', '.join(ROLES)}")
+    if status and status not in STATUSES:
+        raise ValueError("Unknown status")
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    sides = ("buyer", "seller") if role == "all" else (role,)
+    results = [_side_query(side, user_id, status, counterparty_id, after, page_size + 1) for side in sides]
+    if len(results) == 1:
+        rows = results[0]
+    else:
+        key = lambda t: (t.created_at.replace(tzinfo=None), t.id)  # noqa: E731
+        rows = list(heapq.merge(*results, key=key, reverse=True))[: page_size + 1]
+
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return TradePage(trades=rows[:page_size], next_cursor=next_cursor)
@@ -0,0 +1,89 @@
+"""Per-user trade statistics for the dashboard.
+
+All figures come from a single statement: a ``GROUP BY status, currency``
+for each side of the user's trades, joined with ``UNION ALL``. Each half
+reads one index range leading with ``(buyer_id, status)`` or
+``(seller_id, status)``; only the user's own trades are grouped, so the
+numbers are exact regardless of how many trades there are in total.
+
+Amounts are never added across currencies: trade volume is reported per
+currency.
+"""
+
+from dataclasses import dataclass, field
+
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.orm import joinedload
+
+from app.models import Trade, db
+
+ACTIVE_STATUSES = ("pending", "escrow_deposited", "in_progress")
+# Trades that never happened do not count towards gross merchandise value.
+EXCLUDED_FROM_GMV = ("cancelled",)
+DEFAULT_CURRENCY = "INR"
+
+
+@dataclass
+class TradeStats:
+    counts: dict = field(default_factory=dict)
+    # (status, currency) -> summed total_amount
+    amounts: dict = field(default_factory=dict)
+
+    @property
+    def total_deals(self):
+        return sum(self.counts.values())
+
+    @property
+    def active_trades(self):
+        return sum(self.counts.get(status, 0) for status in ACTIVE_STATUSES)
+
+    @property
+    def completed_trades(self):
+        return self.counts.get("completed", 0)
+
+    @property
+    def gmv(self):
+        """Gross merchandise value per currency, e.g. ``{"INR": 3100.0}``."""
+        totals = {}
+        for (status, currency), amount in sorted(self.amounts.items()):
+            if status not in EXCLUDED_FROM_GMV:
+                totals[currency] = totals.get(currency, 0.0) + amount
+        return totals
+
+
+def _involving(user_id):
+    return or_(Trade.buyer_id == user_id, Trade.seller_id == user_id)
+
+
+def _per_status(*criteria):
+    currency = func.coalesce(Trade.currency, DEFAULT_CURRENCY)
+    return (
+        select(Trade.status, currency, func.count(Trade.id), func.coalesce(func.sum(Trade.total_amount), 0.0))
+        .where(*criteria)
+        .group_by(Trade.status, currency)
+    )
+
+
+def trade_stats(user_id):
+    statement = union_all(
+        _per_status(Trade.buyer_id == user_id),
+        # A trade with oneself is already counted on the buyer side.
+        _per_status(Trade.seller_id == user_id, Trade.buyer_id != user_id),
+    )
+    stats = TradeStats()
+    for status, currency, count, amount in db.session.execute(statement):
+        stats.counts[status] = stats.counts.get(status, 0) + count
+        key = (status, currency)
+        stats.amounts[key] = stats.amounts.get(key, 0.0) + float(amount)
+    return stats
+
+
+def recent_trades(user_id, limit=5):
+    """Newest trades first, with both parties loaded for display."""
+    return (
+        Trade.query.options(joinedload(Trade.buyer), joinedload(Trade.seller))
+        .filter(_involving(user_id))
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,100 @@
+"""Escrow counterparty suggestions for the chat page.
+
+Everyone the user has traded with, as one statement: the counterparty ids
+from both sides of the user's trades (``UNION`` de-duplicates them) joined
+to ``user`` for display names, ordered by name in SQL.
+
+Results are cached per user for ``ESCROW_SUGGESTIONS_TTL`` seconds. A new
+trade evicts both parties once it commits; the TTL bounds staleness for
+renamed counterparties and for writes made by other workers.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select, union
+from sqlalchemy.orm import Session
+
+from app.models import Trade, User, db
+from app.utils.cache import TTLCache
+
+_PENDING_KEY = "_cp_suggestions_evict"
+_LISTENERS_INSTALLED = False
+
+
+def _cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("escrow_suggestions")
+
+
+def _display_name():
+    full_name = func.trim(func.coalesce(User.first_name, "") + " " + func.coalesce(User.last_name, ""))
+    return func.coalesce(func.nullif(User.company_name, ""), func.nullif(full_name, ""), User.email)
+
+
+def _query_counterparties(user_id):
+    counterparties = union(
+        select(Trade.seller_id.label("id")).where(Trade.buyer_id == user_id),
+        select(Trade.buyer_id.label("id")).where(Trade.seller_id == user_id),
+    ).subquery()
+    name = _display_name().label("name")
+    rows = db.session.execute(
+        select(User.id, name, User.email)
+        .join(counterparties, counterparties.c.id == User.id)
+        .where(User.id != user_id)
+        .order_by(func.lower(name), User.id)
+    )
+    return [{"id": row.id, "name": row.name, "email": row.email} for row in rows]
+
+
+def escrow_counterparties(user_id):
+    cache = _cache()
+    if cache is None:
+        return _query_counterparties(user_id)
+    users = cache.get(user_id)
+    if users is None:
+        users = _query_counterparties(user_id)
+        cache.set(user_id, users)
+    return users
+
+
+def evict(*user_ids):
+    cache = _cache()
+    if cache is not None:
+        for user_id in user_ids:
+            cache.pop(user_id)
+
+
+def _collect_new_trades(session, flush_context, instances):
+    parties = session.info.setdefault(_PENDING_KEY, set())
+    for obj in session.new:
+        if isinstance(obj, Trade):
+            parties.update(uid for uid in (obj.buyer_id, obj.seller_id) if uid is not None)
+
+
+def _evict_committed(session):
+    evict(*session.info.pop(_PENDING_KEY, ()))
+
+
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _install_listeners():
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    event.listen(Session, "before_flush", _collect_new_trades)
+    event.listen(Session, "after_commit", _evict_committed)
+    event.listen(Session, "after_soft_rollback", lambda session, previous: _discard_pending(session))
+    _LISTENERS_INSTALLED = True
+
+
+def init_app(app):
+    app.config.setdefault("ESCROW_SUGGESTIONS_TTL", 300)
+    app.config.setdefault("ESCROW_SUGGESTIONS_CACHE_SIZE", 4096)
+    if app.config["ESCROW_SUGGESTIONS_TTL"] <= 0:
+        return
+    app.extensions["escrow_suggestions"] = TTLCache(
+        maxsize=app.config["ESCROW_SUGGESTIONS_CACHE_SIZE"], ttl=app.config["ESCROW_SUGGESTIONS_TTL"]
+    )
+    _install_listeners()
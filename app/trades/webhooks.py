@@ -0,0 +1,259 @@
+"""Batched webhook delivery of trade events.
+
+Each ``WebhookSubscription`` keeps a cursor (``last_event_id``) into the
+append-only ``TradeEvent`` log. A delivery run POSTs every due subscriber
+its pending events, oldest first, ``WEBHOOK_BATCH_SIZE`` per request::
+
+    POST <url>
+    X-ChainPort-Signature: sha256=<hex HMAC-SHA256 of the body with the secret>
+    {"subscription_id": 3, "events": [{"id": 41, "type": "trade.status_changed", ...}]}
+
+A 2xx response advances the cursor past the batch. Anything else leaves it
+in place and pushes ``next_attempt_at`` back exponentially, from
+``WEBHOOK_BACKOFF_BASE`` seconds up to ``WEBHOOK_BACKOFF_MAX``, so one dead
+endpoint costs a request per backoff step rather than one per event.
+Delivery is at-least-once: receivers should skip event ids they have seen.
+Run a single worker (``flask deliver-webhooks``) per database.
+
+Webhook URLs are user-supplied, so the host is resolved both when a URL is
+registered and before every delivery, and every address it resolves to
+must be public (``is_global``); loopback, private, link-local and metadata
+addresses are refused unless ``WEBHOOK_ALLOW_PRIVATE`` is set. A delivery
+connects to the addresses that were vetted rather than resolving the host
+again, so a short-TTL name cannot be rebound to an internal address in
+between; the Host header and TLS server name still carry the hostname.
+Environment proxies are ignored. Redirects are never followed: a 3xx
+answer counts as a failed delivery.
+"""
+
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import socket
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.models import TradeEvent, WebhookSubscription, db
+from app.trades.events import serialize_event
+from app.utils import metrics
+
+USER_AGENT = "ChainPort-Webhooks/1"
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def sign(secret, body):
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def latest_event_id():
+    return db.session.query(db.func.max(TradeEvent.id)).scalar() or 0
+
+
+def pending_events(user_id, after_id, limit):
+    """The next ``limit`` events on the user's trades after ``after_id``.
+
+    One index range scan per side (``(buyer_id, id)`` and ``(seller_id,
+    id)``) instead of an OR the planner cannot serve from either index.
+    """
+    sides = [
+        TradeEvent.query.filter(column == user_id, TradeEvent.id > after_id)
+        .order_by(TradeEvent.id)
+        .limit(limit)
+        .all()
+        for column in (TradeEvent.buyer_id, TradeEvent.seller_id)
+    ]
+    merged = {event.id: event for side in sides for event in side}
+    return [merged[event_id] for event_id in sorted(merged)[:limit]]
+
+
+def backoff_seconds(failures, config):
+    return min(config["WEBHOOK_BACKOFF_BASE"] * 2 ** (failures - 1), config["WEBHOOK_BACKOFF_MAX"])
+
+
+class UnsafeWebhookURL(ValueError):
+    pass
+
+
+def check_url(url, allow_private=False):
+    """Raise :class:`UnsafeWebhookURL` unless ``url`` only reaches public hosts.
+
+    Returns the vetted ``(family, sockaddr)`` pairs to connect to.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeWebhookURL("url must be an absolute http(s) URL")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise UnsafeWebhookURL(f"cannot resolve {parts.hostname}: {e}")
+    addresses = [(family, sockaddr) for family, _type, _proto, _name, sockaddr in infos]
+    if not allow_private:
+        for _family, sockaddr in addresses:
+            address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+            if not address.is_global:
+                raise UnsafeWebhookURL(f"{parts.hostname} resolves to non-public address {address}")
+    return addresses
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # the 3xx is raised as an HTTPError instead
+
+
+def _connect(addresses, timeout, source_address=None):
+    """Open a TCP connection to the first reachable vetted address."""
+    error = OSError("no addresses to connect to")
+    for family, sockaddr in addresses:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error
+
+
+def _pinned(connection_class, addresses):
+    """``connection_class`` that connects to ``addresses`` instead of resolving its host."""
+
+    def factory(host, **kwargs):
+        connection = connection_class(host, **kwargs)
+        connection._create_connection = lambda _address, timeout, source_address=None: _connect(
+            addresses, timeout, source_address
+        )
+        return connection
+
+    return factory
+
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, addresses):
+        super().__init__()
+        self.addresses = addresses
+
+    def http_open(self, req):
+        return self.do_open(_pinned(http.client.HTTPConnection, self.addresses), req)
+
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, addresses):
+        super().__init__()
+        self.addresses = addresses
+
+    def https_open(self, req):
+        return self.do_open(_pinned(http.client.HTTPSConnection, self.addresses), req, context=self._context)
+
+
+def post_batch(url, body, headers, timeout, allow_private=False):
+    """POST one batch; raises on unsafe URLs, network errors and non-2xx responses."""
+    addresses = check_url(url, allow_private)
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}),
+        _NoRedirects,
+        _PinnedHTTPHandler(addresses),
+        _PinnedHTTPSHandler(addresses),
+    )
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    with opener.open(request, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def deliver_subscription(subscription, now=None):
+    """Send a subscription its pending batches; returns ``(events, batches, ok)``.
+
+    Stops after ``WEBHOOK_MAX_BATCHES`` so one busy subscriber cannot hold
+    up the rest of the run, or at the first failure.
+    """
+    config = current_app.config
+    now = now or _utcnow()
+    delivered = batches = 0
+    while batches < config["WEBHOOK_MAX_BATCHES"]:
+        events = pending_events(subscription.user_id, subscription.last_event_id, config["WEBHOOK_BATCH_SIZE"])
+        if not events:
+            break
+        body = json.dumps(
+            {"subscription_id": subscription.id, "events": [serialize_event(e) for e in events]}
+        ).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": USER_AGENT,
+            "X-ChainPort-Signature": sign(subscription.secret, body),
+        }
+        try:
+            post_batch(
+                subscription.url, body, headers, config["WEBHOOK_TIMEOUT"], config["WEBHOOK_ALLOW_PRIVATE"]
+            )
+        except Exception as e:
+            subscription.failures += 1
+            subscription.last_error = str(e)[:500]
+            subscription.next_attempt_at = now + timedelta(seconds=backoff_seconds(subscription.failures, config))
+            metrics.inc("chainport_webhook_batches_total", {"outcome": "failed"})
+            return delivered, batches, False
+        subscription.last_event_id = events[-1].id
+        subscription.failures = 0
+        subscription.last_error = None
+        subscription.next_attempt_at = None
+        delivered += len(events)
+        batches += 1
+        metrics.inc("chainport_webhook_batches_total", {"outcome": "delivered"})
+    return delivered, batches, True
+
+
+def deliver_due(now=None):
+    """One delivery pass over every active, due subscription."""
+    now = now or _utcnow()
+    report = {"subscriptions": 0, "events": 0, "batches": 0, "failed": 0}
+    due = (
+        WebhookSubscription.query.filter(
+            WebhookSubscription.is_active.is_(True),
+            or_(WebhookSubscription.next_attempt_at.is_(None), WebhookSubscription.next_attempt_at <= now),
+        )
+        .order_by(WebhookSubscription.id)
+        .all()
+    )
+    for subscription in due:
+        events, batches, ok = deliver_subscription(subscription, now)
+        # Commit per subscriber so a crash never re-sends another's batches.
+        db.session.commit()
+        report["subscriptions"] += 1
+        report["events"] += events
+        report["batches"] += batches
+        report["failed"] += 0 if ok else 1
+    return report
+
+
+def run_worker(interval, once=False, progress=None):
+    while True:
+        report = deliver_due()
+        if progress and (report["batches"] or report["failed"]):
+            progress(report)
+        db.session.remove()
+        if once:
+            return report
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.config.setdefault("WEBHOOK_BATCH_SIZE", 100)
+    app.config.setdefault("WEBHOOK_MAX_BATCHES", 10)
+    app.config.setdefault("WEBHOOK_TIMEOUT", 10)
+    app.config.setdefault("WEBHOOK_BACKOFF_BASE", 10)
+    app.config.setdefault("WEBHOOK_BACKOFF_MAX", 3600)
+    app.config.setdefault("WEBHOOK_ALLOW_PRIVATE", False)
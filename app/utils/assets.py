@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+import os
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MANIFEST_NAME = "assets-manifest.json"
+# Runtime-written folders are served as-is rather than fingerprinted.
+_SKIP_DIRS = {"uploads", "tmp"}
+
+
+def build_manifest(static_folder, manifest_path=None):
+    """Hash every static file and write ``{"css/a.css": "css/a.<hash>.css"}``."""
+    manifest_path = manifest_path or os.path.join(static_folder, MANIFEST_NAME)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if d not in _SKIP_DIRS]
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.abspath(path) == os.path.abspath(manifest_path):
+                continue
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(65536), b""):
+                    digest.update(chunk)
+            rel = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(rel)
+            manifest[rel] = f"{stem}.{digest.hexdigest()[:12]}{ext}"
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def load_manifest(app, manifest_path=None):
+    manifest_path = manifest_path or app.config["ASSET_MANIFEST"]
+    manifest = {}
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    app.extensions["asset_manifest"] = manifest
+    app.extensions["asset_files"] = {hashed: original for original, hashed in manifest.items()}
+    return manifest
+
+
+def _fingerprint_static_urls(endpoint, values):
+    # url_defaults hook: rewrites url_for("static", filename=...) everywhere.
+    if endpoint != "static" or "filename" not in values:
+        return
+    hashed = current_app.extensions["asset_manifest"].get(values["filename"])
+    if hashed:
+        values["filename"] = hashed
+
+
+def _serve_static(filename):
+    app = current_app._get_current_object()
+    original = app.extensions["asset_files"].get(filename)
+    if original is None:
+        return app.send_static_file(filename)
+    response = send_from_directory(app.static_folder, original, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress_response(response):
+    config = current_app.config
+    if not config["COMPRESS_ENABLED"]:
+        return response
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in config["COMPRESS_MIMETYPES"]
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < config["COMPRESS_MIN_SIZE"]:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=config["COMPRESS_BR_QUALITY"])
+    else:
+        data = gzip.compress(data, compresslevel=config["COMPRESS_GZIP_LEVEL"])
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    app.config.setdefault("ASSET_MANIFEST", os.path.join(app.static_folder, MANIFEST_NAME))
+    app.config.setdefault("COMPRESS_ENABLED", True)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESS_MIMETYPES", {"text/html", "application/json"})
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", 6)
+    app.config.setdefault("COMPRESS_BR_QUALITY", 5)
+
+    load_manifest(app)
+    app.url_defaults(_fingerprint_static_urls)
+    app.view_functions["static"] = _serve_static
+    app.after_request(_compress_response)
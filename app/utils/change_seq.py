@@ -0,0 +1,102 @@
+"""A global change sequence for delta sync.
+
+Every insert or update of a ``Trade``, ``Message``, ``EscrowTransaction``
+or ``Product`` stamps the row's ``change_seq`` with a number drawn from a
+single counter row, in the same transaction as the write. Drawing a number
+takes the counter row's write lock, so numbers become visible in commit
+order: a client that has seen ``n`` can never later find a committed row
+below ``n`` that it missed.
+
+ORM writes are stamped by a ``before_flush`` listener; bulk statements
+(catalogue import, bulk price updates, generated data) call
+:func:`allocate` themselves. Hard deletes are not sequenced.
+"""
+
+from sqlalchemy import bindparam, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+change_sequence = db.Table(
+    "chainport_change_seq",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("value", db.BigInteger, nullable=False),
+)
+
+_LISTENERS_INSTALLED = False
+
+
+@event.listens_for(change_sequence, "after_create")
+def _seed_counter(table, connection, **kw):
+    connection.execute(insert(table).values(id=1, value=0))
+
+
+def allocate(connection, count):
+    """Reserve ``count`` consecutive numbers; returns the first of them."""
+    value = connection.execute(
+        update(change_sequence)
+        .where(change_sequence.c.id == 1)
+        .values(value=change_sequence.c.value + count)
+        .returning(change_sequence.c.value)
+    ).scalar()
+    if value is None:
+        connection.execute(insert(change_sequence).values(id=1, value=count))
+        value = count
+    return value - count + 1
+
+
+def current(connection):
+    return connection.execute(select(change_sequence.c.value).where(change_sequence.c.id == 1)).scalar() or 0
+
+
+def _sequenced_models():
+    from app.models import EscrowTransaction, Message, Product, Trade
+
+    return (Trade, Message, EscrowTransaction, Product)
+
+
+def _before_flush(session, flush_context, instances):
+    models = _sequenced_models()
+    changed = [obj for obj in session.new if isinstance(obj, models)]
+    changed += [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, models) and session.is_modified(obj, include_collections=False)
+    ]
+    if not changed:
+        return
+    first = allocate(session.connection(), len(changed))
+    for offset, obj in enumerate(changed):
+        obj.change_seq = first + offset
+
+
+def backfill(connection, batch_size=5000):
+    """Stamp rows written before sequencing existed; returns rows stamped."""
+    stamped = 0
+    for model in _sequenced_models():
+        table = model.__table__
+        while True:
+            ids = connection.execute(
+                select(table.c.id).where(table.c.change_seq.is_(None)).order_by(table.c.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            first = allocate(connection, len(ids))
+            connection.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(change_seq=bindparam("_seq")),
+                [{"_id": row_id, "_seq": first + offset} for offset, row_id in enumerate(ids)],
+            )
+            stamped += len(ids)
+    return stamped
+
+
+def _install_listeners():
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    event.listen(Session, "before_flush", _before_flush)
+    _LISTENERS_INSTALLED = True
+
+
+def init_app(app):
+    _install_listeners()
@@ -0,0 +1,275 @@
+"""Deterministic, high-volume synthetic data for load tests and benchmarks.
+
+Rows are produced lazily in chunks and written with SQLAlchemy Core
+``executemany`` inside a single transaction, so memory stays flat and
+millions of rows take minutes rather than hours. Counterparties are drawn
+from a Zipf-like distribution (``skew``) so a few accounts carry most of
+the trades and conversations, as in production. The same ``seed`` always
+yields the same data.
+"""
+
+import itertools
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.auth.passwords import hash_password
+from app.models import EscrowTransaction, Message, MessageAttachment, Product, Trade, User
+from app.utils import change_seq
+from app.utils.storage import make_key
+
+DEFAULT_PASSWORD = "password123"
+
+CATEGORIES = ["plywood", "adhesive", "textile", "fiberglass", "chemicals", "paint", "agri", "foam"]
+COUNTRIES = ["India", "China", "Malaysia", "Vietnam", "Germany", "Turkey", "Brazil"]
+UNITS = ["kg", "tons", "pieces", "meter", "sheet", "litre"]
+TRADE_STATUSES = ["pending", "escrow_deposited", "in_progress", "completed", "cancelled", "disputed"]
+ESCROW_TYPES = ["deposit", "withdrawal", "escrow_hold", "escrow_release", "escrow_refund"]
+
+
+@dataclass
+class DataSpec:
+    users: int = 100
+    products: int = 1000
+    trades: int = 1000
+    messages: int = 10000
+    attachments: int = 500
+    escrow_transactions: int = 1000
+    skew: float = 1.1
+    seed: int = 42
+    chunk_size: int = 10000
+    password: str = DEFAULT_PASSWORD
+    # Timestamps are laid out backwards from this fixed instant so output
+    # does not depend on when the generator ran.
+    anchor: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class _SkewedPicker:
+    """Draw ids from ``first..first+n-1`` with weight ``1 / rank ** skew``."""
+
+    def __init__(self, rng, first_id, n, skew):
+        self.rng = rng
+        self.ids = range(first_id, first_id + n)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+    def pick(self):
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights)[0]
+
+    def pick_other(self, exclude):
+        if len(self.ids) < 2:
+            raise ValueError("Need at least two users to pick a counterparty")
+        while True:
+            uid = self.pick()
+            if uid != exclude:
+                return uid
+
+
+def _chunks(rows, size):
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+@contextmanager
+def _bulk_connection(engine):
+    """One connection in a transaction; on SQLite with fsyncs off.
+
+    Durability is irrelevant for generated data, but ``synchronous`` is a
+    per-connection setting, so it is put back before the connection returns
+    to the pool and serves the app's own writes.
+    """
+    with engine.connect() as conn:
+        previous = None
+        if engine.dialect.name == "sqlite":
+            previous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+            conn.exec_driver_sql("PRAGMA synchronous = OFF")
+            conn.commit()
+        try:
+            with conn.begin():
+                yield conn
+        finally:
+            if previous is not None:
+                conn.exec_driver_sql(f"PRAGMA synchronous = {int(previous)}")
+                conn.commit()
+
+
+def generate(engine, spec, progress=None):
+    """Append ``spec``'s rows to the database; returns ``{table: (first_id, count)}``."""
+    rng = random.Random(spec.seed)
+    now = spec.anchor
+    password_hash = hash_password(spec.password)
+    report = {}
+
+    def emit(name, count, elapsed):
+        if progress:
+            progress(f"{name:<20} {count:>11,} rows in {elapsed:6.1f}s")
+
+    with _bulk_connection(engine) as conn:
+
+        def insert(model, rows, count):
+            start = time.perf_counter()
+            first_id = _next_id(conn, model)
+            table = model.__table__
+            seq = change_seq.allocate(conn, count) if "change_seq" in table.c else None
+            for chunk in _chunks(rows(first_id), spec.chunk_size):
+                if seq is not None:
+                    for row in chunk:
+                        row["change_seq"] = seq
+                        seq += 1
+                conn.execute(table.insert(), chunk)
+            report[table.name] = (first_id, count)
+            emit(table.name, count, time.perf_counter() - start)
+            return first_id
+
+        first_user = insert(
+            User,
+            lambda first: (
+                {
+                    "id": first + i,
+                    "email": f"user{first + i}.{spec.seed}@example.com",
+                    "password_hash": password_hash,
+                    "first_name": f"User{first + i}",
+                    "last_name": "Synthetic",
+                    "company_name": f"{rng.choice(CATEGORIES).title()} Traders {first + i}",
+                    "phone": f"+91-9{rng.randrange(10**9):09d}",
+                    "is_active": True,
+                    "is_verified": rng.random() < 0.4,
+                    "kyc_status": rng.choice(["pending", "submitted", "verified"]),
+                    "escrow_balance": round(rng.uniform(0, 500000), 2),
+                    "created_at": now - timedelta(days=rng.randrange(720)),
+                    "updated_at": now,
+                }
+                for i in range(spec.users)
+            ),
+            spec.users,
+        )
+        users = _SkewedPicker(rng, first_user, spec.users, spec.skew)
+
+        first_product = insert(
+            Product,
+            lambda first: (
+                {
+                    "id": first + i,
+                    "seller_id": users.pick(),
+                    "title": f"{category.title()} grade {rng.randrange(1, 9)} lot {first + i}",
+                    "description": f"Synthetic {category} listing for load testing.",
+                    "category": category,
+                    "hs_code": f"{rng.randrange(1000, 9999)}.{rng.randrange(10, 99)}",
+                    "quantity": float(rng.randrange(100, 100000)),
+                    "unit": rng.choice(UNITS),
+                    "price_per_unit": round(rng.uniform(1, 5000), 2),
+                    "currency": "INR",
+                    "country_of_origin": rng.choice(COUNTRIES),
+                    "min_order_quantity": float(rng.randrange(1, 100)),
+                    "payment_terms": "Escrow",
+                    "delivery_terms": rng.choice(["FOB", "CIF", "EXW"]),
+                    "is_active": rng.random() < 0.9,
+                    "created_at": now - timedelta(minutes=spec.products - i),
+                    "updated_at": now,
+                }
+                for i, category in ((i, rng.choice(CATEGORIES)) for i in range(spec.products))
+            ),
+            spec.products,
+        )
+
+        # Trade parties, kept compactly so escrow rows reference a real participant.
+        trade_buyers = array("q")
+        trade_sellers = array("q")
+
+        def trade_rows(first):
+            for i in range(spec.trades):
+                buyer = users.pick()
+                seller = users.pick_other(buyer)
+                trade_buyers.append(buyer)
+                trade_sellers.append(seller)
+                quantity = float(rng.randrange(1, 500))
+                price = round(rng.uniform(1, 5000), 2)
+                status = rng.choice(TRADE_STATUSES)
+                yield {
+                    "id": first + i,
+                    "buyer_id": buyer,
+                    "seller_id": seller,
+                    "product_id": first_product + rng.randrange(spec.products) if spec.products else None,
+                    "quantity": quantity,
+                    "unit": "kg",
+                    "price_per_unit": price,
+                    "total_amount": round(quantity * price, 2),
+                    "currency": "INR",
+                    "status": status,
+                    "escrow_amount": round(quantity * price, 2) if status == "escrow_deposited" else 0.0,
+                    "created_at": now - timedelta(minutes=spec.trades - i),
+                    "updated_at": now,
+                }
+
+        first_trade = insert(Trade, trade_rows, spec.trades)
+
+        def message_rows(first):
+            for i in range(spec.messages):
+                sender = users.pick()
+                yield {
+                    "id": first + i,
+                    "sender_id": sender,
+                    "receiver_id": users.pick_other(sender),
+                    "trade_id": first_trade + rng.randrange(spec.trades) if spec.trades and rng.random() < 0.2 else None,
+                    "subject": "",
+                    "content": f"Synthetic message {first + i}",
+                    "is_read": rng.random() < 0.8,
+                    "timestamp": now - timedelta(seconds=spec.messages - i),
+                }
+
+        first_message = insert(Message, message_rows, spec.messages)
+
+        insert(
+            MessageAttachment,
+            lambda first: (
+                {
+                    "id": first + i,
+                    "message_id": first_message + rng.randrange(spec.messages),
+                    "filename": f"synthetic-{first + i}.pdf",
+                    "original_filename": f"document-{first + i}.pdf",
+                    "file_path": make_key("messages", f"synthetic-{first + i}.pdf"),
+                    "content_type": "application/pdf",
+                    "file_size": rng.randrange(10_000, 5_000_000),
+                    "created_at": now,
+                }
+                for i in range(spec.attachments if spec.messages else 0)
+            ),
+            spec.attachments if spec.messages else 0,
+        )
+
+        def escrow_rows(first):
+            for i in range(spec.escrow_transactions):
+                kind = rng.choice(ESCROW_TYPES)
+                user_id = users.pick()
+                trade_id = None
+                if spec.trades and kind.startswith("escrow"):
+                    offset = rng.randrange(spec.trades)
+                    trade_id = first_trade + offset
+                    user_id = trade_sellers[offset] if kind == "escrow_release" else trade_buyers[offset]
+                yield {
+                    "id": first + i,
+                    "user_id": user_id,
+                    "trade_id": trade_id,
+                    "transaction_type": kind,
+                    "amount": round(rng.uniform(100, 100000), 2),
+                    "currency": "INR",
+                    "status": "completed",
+                    "notes": "Synthetic",
+                    "created_at": now - timedelta(minutes=spec.escrow_transactions - i),
+                }
+
+        insert(EscrowTransaction, escrow_rows, spec.escrow_transactions)
+
+    return report
@@ -0,0 +1,464 @@
+"""Query-plan checks, index advice, sizes and scheduled maintenance.
+
+``HOT_QUERIES`` mirrors the statements behind the busiest routes and
+helpers. :func:`check_queries` runs ``EXPLAIN QUERY PLAN`` on each of them
+and flags full table scans and temporary B-trees (an ORDER BY or GROUP BY
+that has to sort). For a flagged table it suggests an index: the columns
+the query compares for equality, then range comparisons, then the ORDER BY
+columns. Queries where a flag is the best SQLite can do, like a ``LIKE
+'%term%'`` search, list it in ``allow`` with a note.
+
+:func:`check_all` also runs the message queries on every message shard,
+with ids sampled from the main database, since shard files get their own
+indexes and statistics.
+
+:func:`maintain` runs ANALYZE, incremental vacuum and VACUUM when each is
+due. The time of each run is recorded in ``chainport_maintenance``, so
+``flask db-doctor maintain --once`` can be run from cron as often as you
+like. Message shard files are maintained along with the main database.
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import Column, insert, inspect, or_, select, tuple_, update
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.sql.elements import BinaryExpression
+from sqlalchemy.sql.visitors import iterate
+
+from app.extensions import db
+from app.models import (
+    EscrowTransaction,
+    KYCDocument,
+    Message,
+    Product,
+    Trade,
+    TradeEvent,
+    User,
+    WebhookSubscription,
+)
+
+maintenance_log = db.Table(
+    "chainport_maintenance",
+    db.Column("task", db.String(30), primary_key=True),
+    db.Column("last_run_at", db.DateTime, nullable=False),
+)
+
+EQUALITY = {operators.eq, operators.is_}
+RANGE = {operators.gt, operators.ge, operators.lt, operators.le}
+
+
+@dataclass
+class HotQuery:
+    name: str
+    build: object  # callable(ids) -> Select
+    allow: tuple = ()  # "scan" and/or "temp_btree"
+    note: str = ""
+
+
+@dataclass
+class QueryReport:
+    name: str
+    plan: list
+    full_scans: list = field(default_factory=list)
+    temp_btrees: list = field(default_factory=list)
+    suggestions: list = field(default_factory=list)
+    allowed: bool = False
+    note: str = ""
+
+    @property
+    def flagged(self):
+        return bool(self.full_scans or self.temp_btrees) and not self.allowed
+
+
+def _between(a, b):
+    return or_(
+        (Message.sender_id == a) & (Message.receiver_id == b),
+        (Message.sender_id == b) & (Message.receiver_id == a),
+    )
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "marketplace.page",
+        lambda ids: select(Product).join(User, Product.seller_id == User.id)
+        .where(Product.is_active.is_(True))
+        .order_by(Product.created_at.desc())
+        .limit(9),
+    ),
+    HotQuery(
+        "marketplace.category",
+        lambda ids: select(Product).join(User, Product.seller_id == User.id)
+        .where(Product.is_active.is_(True), Product.category == "textile")
+        .order_by(Product.created_at.desc())
+        .limit(9),
+        allow=("temp_btree",),
+        note="category is selective; its matches are sorted",
+    ),
+    HotQuery(
+        "marketplace.search",
+        lambda ids: select(Product).join(User, Product.seller_id == User.id)
+        .where(Product.is_active.is_(True), Product.title.ilike("%steel%"))
+        .order_by(Product.created_at.desc())
+        .limit(9),
+        allow=("scan", "temp_btree"),
+        note="substring search cannot use a B-tree index",
+    ),
+    HotQuery(
+        "messages.conversations",
+        lambda ids: select(Message)
+        .where((Message.sender_id == ids["user"]) | (Message.receiver_id == ids["user"]))
+        .order_by(Message.timestamp.desc()),
+        allow=("temp_btree",),
+        note="one index range per side, merged by a sort",
+    ),
+    HotQuery(
+        "messages.thread",
+        lambda ids: select(Message)
+        .where(_between(ids["user"], ids["other"]))
+        .order_by(Message.timestamp, Message.id)
+        .limit(200),
+        allow=("temp_btree",),
+        note="one index range per direction, merged by a sort",
+    ),
+    HotQuery(
+        "messages.unread",
+        lambda ids: select(Message).where(
+            Message.sender_id == ids["other"], Message.receiver_id == ids["user"], Message.is_read.is_(False)
+        ),
+    ),
+    HotQuery(
+        "messages.trade",
+        lambda ids: select(Message).where(Message.trade_id == ids["trade"]).order_by(Message.timestamp),
+    ),
+    HotQuery(
+        "escrow.history",
+        lambda ids: select(EscrowTransaction)
+        .where(EscrowTransaction.user_id == ids["user"])
+        .order_by(EscrowTransaction.created_at.desc())
+        .limit(20),
+    ),
+    HotQuery(
+        "escrow.preferred_chat",
+        lambda ids: select(EscrowTransaction)
+        .where(EscrowTransaction.user_id == ids["user"], EscrowTransaction.trade_id.isnot(None))
+        .order_by(EscrowTransaction.created_at.desc())
+        .limit(1),
+    ),
+    HotQuery(
+        "escrow.wallet",
+        lambda ids: select(EscrowTransaction)
+        .where(EscrowTransaction.user_id == ids["user"], EscrowTransaction.id > 0)
+        .order_by(EscrowTransaction.id.desc())
+        .limit(20),
+    ),
+    HotQuery(
+        "trades.buyer_status",
+        lambda ids: select(Trade)
+        .where(Trade.buyer_id == ids["user"], Trade.status == "pending")
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+        .limit(26),
+    ),
+    HotQuery(
+        "trades.seller_after_cursor",
+        lambda ids: select(Trade)
+        .where(
+            Trade.seller_id == ids["user"],
+            tuple_(Trade.created_at, Trade.id) < tuple_(datetime(2100, 1, 1), 2**31),
+        )
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+        .limit(26),
+    ),
+    HotQuery(
+        "trades.recent",
+        lambda ids: select(Trade)
+        .where((Trade.buyer_id == ids["user"]) | (Trade.seller_id == ids["user"]))
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+        .limit(5),
+        allow=("temp_btree",),
+        note="one index range per side, merged by a sort",
+    ),
+    HotQuery(
+        "sync.messages",
+        lambda ids: select(Message.id, Message.change_seq)
+        .where(Message.receiver_id == ids["user"], Message.change_seq > 0)
+        .order_by(Message.change_seq)
+        .limit(500),
+    ),
+    HotQuery(
+        "sync.products",
+        lambda ids: select(Product.id, Product.change_seq).where(Product.change_seq > 0).order_by(Product.change_seq).limit(500),
+    ),
+    HotQuery(
+        "webhooks.pending_events",
+        lambda ids: select(TradeEvent)
+        .where(TradeEvent.buyer_id == ids["user"], TradeEvent.id > 0)
+        .order_by(TradeEvent.id)
+        .limit(100),
+    ),
+    HotQuery(
+        "webhooks.due",
+        lambda ids: select(WebhookSubscription)
+        .where(WebhookSubscription.is_active.is_(True))
+        .order_by(WebhookSubscription.id),
+        allow=("scan",),
+        note="every active subscription is read each pass",
+    ),
+    HotQuery(
+        "kyc.documents",
+        lambda ids: select(KYCDocument).where(KYCDocument.user_id == ids["user"]),
+    ),
+    HotQuery(
+        "auth.user_by_email",
+        lambda ids: select(User).where(User.email == "someone@example.com"),
+    ),
+]
+
+
+def sample_ids(session):
+    """Ids to bind into the hot queries; any value gives the same plan."""
+    trade = session.execute(select(Trade.id, Trade.buyer_id, Trade.seller_id).limit(1)).first()
+    if trade:
+        return {"user": trade.buyer_id, "other": trade.seller_id, "trade": trade.id}
+    return {"user": 1, "other": 2, "trade": 1}
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional).all()
+    return [row[3] for row in rows]
+
+
+def _plan_flags(plan):
+    scans, sorts = [], []
+    for detail in plan:
+        words = detail.split()
+        if words[0] == "SCAN" and "USING" not in words and words[1] not in ("CONSTANT", "SUBQUERY"):
+            scans.append(words[1])
+        elif detail.startswith("USE TEMP B-TREE"):
+            sorts.append(detail[len("USE TEMP B-TREE FOR "):])
+    return scans, sorts
+
+
+def _table_columns(clause, table, ops):
+    columns = []
+    if clause is None:
+        return columns
+    for element in iterate(clause):
+        if isinstance(element, BinaryExpression) and element.operator in ops:
+            column = element.left
+            if isinstance(column, Column) and column.table is table and column.name not in columns:
+                columns.append(column.name)
+    return columns
+
+
+def _order_columns(statement, table):
+    columns = []
+    for clause in statement._order_by_clauses:
+        for element in iterate(clause):
+            if isinstance(element, Column) and element.table is table and element.name not in columns:
+                columns.append(element.name)
+    return columns
+
+
+def suggest_index(statement, table, existing):
+    """``CREATE INDEX`` text for ``table`` in ``statement``, or None.
+
+    ``existing`` maps index names to column lists; nothing is suggested if
+    an index already starts with the same columns (ANALYZE may be needed).
+    """
+    columns = []
+    for name in (
+        _table_columns(statement.whereclause, table, EQUALITY)
+        + _table_columns(statement.whereclause, table, RANGE)
+        + _order_columns(statement, table)
+    ):
+        if name not in columns:
+            columns.append(name)
+    if not columns:
+        return None
+    for index_columns in existing.values():
+        if index_columns[: len(columns)] == columns:
+            return None
+    name = f"ix_{table.name}_{'_'.join(columns)}"
+    return f'CREATE INDEX {name} ON "{table.name}" ({", ".join(columns)})'
+
+
+def check_queries(engine, queries=None, ids=None):
+    """EXPLAIN every hot query; returns a :class:`QueryReport` per query."""
+    inspector = inspect(engine)
+    tables = db.metadata.tables
+    reports = []
+    with engine.connect() as conn:
+        ids = ids or sample_ids(conn)
+        for query in HOT_QUERIES if queries is None else queries:
+            statement = query.build(ids)
+            plan = explain(conn, statement)
+            scans, sorts = _plan_flags(plan)
+            report = QueryReport(query.name, plan, scans, sorts, note=query.note)
+            report.allowed = (not scans or "scan" in query.allow) and (not sorts or "temp_btree" in query.allow)
+            if report.flagged:
+                touched = set(scans) or {t.name for t in statement.get_final_froms() if hasattr(t, "name")}
+                for table_name in sorted(touched):
+                    table = tables.get(table_name)
+                    if table is None:
+                        continue
+                    existing = {
+                        index["name"]: index["column_names"] for index in inspector.get_indexes(table_name)
+                    }
+                    suggestion = suggest_index(statement, table, existing)
+                    if suggestion:
+                        report.suggestions.append(suggestion)
+            reports.append(report)
+    return reports
+
+
+def shard_queries(ids):
+    """The hot queries that only read tables kept in the message shards."""
+    from app.utils.message_shards import SHARD_TABLES
+
+    names = {table.name for table in SHARD_TABLES}
+    return [
+        query for query in HOT_QUERIES
+        if {table.name for table in find_tables(query.build(ids))} <= names
+    ]
+
+
+def check_all(app):
+    """``[(database name, [QueryReport])]`` for the main database and each shard."""
+    engines = maintenance_engines(app)
+    with db.engine.connect() as conn:
+        ids = sample_ids(conn)
+    results = [("main", check_queries(db.engine, ids=ids))]
+    on_shards = shard_queries(ids)
+    for name, engine in engines[1:]:
+        results.append((name, check_queries(engine, on_shards, ids)))
+    return results
+
+
+def table_sizes(engine):
+    """``[(name, kind, table, bytes, rows)]``, largest first.
+
+    Sizes come from the ``dbstat`` table when SQLite was built with it;
+    row counts from ``sqlite_stat1`` (None until ANALYZE has run).
+    """
+    with engine.connect() as conn:
+        objects = conn.exec_driver_sql(
+            "SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"
+        ).all()
+        try:
+            sizes = dict(conn.exec_driver_sql("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").all())
+        except Exception:
+            sizes = {}
+        try:
+            stats = conn.exec_driver_sql("SELECT tbl, idx, stat FROM sqlite_stat1").all()
+        except Exception:
+            stats = []
+    rows = {}
+    for tbl, idx, stat in stats:
+        rows.setdefault(tbl, int(stat.split()[0]))
+        if idx:
+            rows[idx] = int(stat.split()[0])
+    result = [(name, kind, table, sizes.get(name), rows.get(name)) for name, kind, table in objects]
+    return sorted(result, key=lambda item: (-(item[3] or 0), item[0]))
+
+
+def database_stats(engine):
+    with engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()  # noqa: E731
+        return {
+            "page_size": pragma("page_size"),
+            "page_count": pragma("page_count"),
+            "freelist_count": pragma("freelist_count"),
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(pragma("auto_vacuum")),
+            "journal_mode": pragma("journal_mode"),
+        }
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _last_runs(conn):
+    maintenance_log.create(conn, checkfirst=True)
+    return dict(conn.execute(select(maintenance_log.c.task, maintenance_log.c.last_run_at)).all())
+
+
+def _record(conn, task, now):
+    if conn.execute(update(maintenance_log).where(maintenance_log.c.task == task).values(last_run_at=now)).rowcount == 0:
+        conn.execute(insert(maintenance_log).values(task=task, last_run_at=now))
+
+
+def maintain_engine(engine, config, now=None, force=()):
+    """Run whichever of ANALYZE, incremental vacuum and VACUUM are due.
+
+    Returns ``{task: seconds}`` for the tasks that ran.
+    """
+    now = now or _utcnow()
+    ran = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        last = _last_runs(conn)
+
+        def due(task, interval):
+            return task in force or last.get(task) is None or now - last[task] >= timedelta(seconds=interval)
+
+        def run(task, *sql):
+            start = time.perf_counter()
+            # executescript steps each statement to completion; execute()
+            # would stop incremental_vacuum after its first page.
+            conn.connection.driver_connection.executescript(";".join(sql))
+            ran[task] = time.perf_counter() - start
+            _record(conn, task, now)
+
+        if due("analyze", config["DB_ANALYZE_INTERVAL"]):
+            run("analyze", "ANALYZE")
+
+        stats = database_stats(engine)
+        free_ratio = stats["freelist_count"] / stats["page_count"] if stats["page_count"] else 0
+        if "vacuum" in force or (
+            free_ratio >= config["DB_VACUUM_FREE_RATIO"] and due("vacuum", config["DB_VACUUM_INTERVAL"])
+        ):
+            # Switch to incremental auto-vacuum on the way, so later passes
+            # can return free pages without rewriting the whole file.
+            run("vacuum", "PRAGMA auto_vacuum = INCREMENTAL", "VACUUM")
+        elif stats["auto_vacuum"] == "incremental" and stats["freelist_count"]:
+            run("incremental_vacuum", f"PRAGMA incremental_vacuum({int(config['DB_INCREMENTAL_VACUUM_PAGES'])})")
+    return ran
+
+
+def maintenance_engines(app):
+    engines = [("main", db.engine)]
+    shards = app.extensions.get("message_shards")
+    if shards is not None:
+        engines += [(f"message shard {index}", engine) for index, engine in enumerate(shards.engines)]
+    return engines
+
+
+def maintain(now=None, force=()):
+    """:func:`maintain_engine` over the main database and every message shard."""
+    app = current_app._get_current_object()
+    return {name: maintain_engine(engine, app.config, now, force) for name, engine in maintenance_engines(app)}
+
+
+def run_maintenance(interval, once=False, force=(), progress=None):
+    while True:
+        report = maintain(force=force)
+        if progress:
+            progress(report)
+        if once:
+            return report
+        force = ()
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.config.setdefault("DB_ANALYZE_INTERVAL", 24 * 3600)
+    app.config.setdefault("DB_VACUUM_INTERVAL", 7 * 24 * 3600)
+    # VACUUM only when at least this share of the file is free pages
+    app.config.setdefault("DB_VACUUM_FREE_RATIO", 0.2)
+    app.config.setdefault("DB_INCREMENTAL_VACUUM_PAGES", 2000)
@@ -0,0 +1,431 @@
+"""Messages sharded across SQLite files by conversation.
+
+``Message`` and ``MessageAttachment`` rows can live in N shard files under
+``MESSAGE_SHARD_DIR`` instead of the main database, so chat writes take a
+shard's writer lock rather than the one shared with balances and escrow. A
+conversation is keyed by its ``(min, max)`` user ids and always lives in a
+single shard, so a thread is read and written without fan-out; only the
+conversation list visits every shard.
+
+The current layout (``{"epoch": E, "count": N}``) is kept in
+``layout.json`` beside the shard files and is written only by
+:func:`reshard` (``flask reshard-messages``). Without a layout, or with a
+count of 0, messages stay in the main database and every helper here
+simply uses ``db.session``.
+
+Ids stay unique across all files: shard ``s`` of epoch ``E`` draws ids from
+its own range ``(E << 44) | (s << 36)``, as ``max(id) + 1`` computed inside
+the INSERT under the shard's writer lock. Resharding copies rows with their
+ids into a new epoch, whose ranges sit above every earlier id, so "newer
+than ``since_id``" still holds within a conversation after a move. Each
+shard keeps its own change sequence (see :mod:`app.utils.change_seq`), so
+delta sync carries one message cursor per shard.
+
+Rows read from a shard are returned detached with their attachments loaded
+and ``sender``/``receiver`` filled in from the main database.
+"""
+
+import json
+import os
+import zlib
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import create_engine, delete, event, func, insert, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import Message, MessageAttachment, db
+from app.utils import change_seq
+from app.utils.schema import ensure_schema
+from app.utils.sqlite_tuning import tune_engine
+
+LAYOUT_FILE = "layout.json"
+EPOCH_SHIFT = 44
+SHARD_SHIFT = 36
+MAX_SHARDS = 1 << (EPOCH_SHIFT - SHARD_SHIFT)
+# Epoch and shard bits keep ids below 2**53, so browsers read them exactly.
+MAX_EPOCH = (1 << (53 - EPOCH_SHIFT)) - 1
+
+SHARD_TABLES = (Message.__table__, MessageAttachment.__table__, change_seq.change_sequence)
+
+
+class ShardSession(Session):
+    """A session bound to one shard file; ``info["id_base"]`` is its id range."""
+
+
+def _assign_ids(session, flush_context, instances):
+    low = session.info["id_base"]
+    high = low + (1 << SHARD_SHIFT)
+    for obj in session.new:
+        if isinstance(obj, (Message, MessageAttachment)) and obj.id is None:
+            table = type(obj).__table__
+            obj.id = (
+                select(func.coalesce(func.max(table.c.id), low) + 1)
+                .where(table.c.id > low, table.c.id < high)
+                .scalar_subquery()
+            )
+
+
+event.listen(ShardSession, "before_flush", _assign_ids)
+
+
+def conversation_key(user_a, user_b):
+    return (min(user_a, user_b), max(user_a, user_b))
+
+
+def shard_index(user_a, user_b, count):
+    low, high = conversation_key(user_a, user_b)
+    return zlib.crc32(f"{low}:{high}".encode()) % count
+
+
+def read_layout(directory):
+    try:
+        with open(os.path.join(directory, LAYOUT_FILE)) as fh:
+            layout = json.load(fh)
+    except FileNotFoundError:
+        return {"epoch": 0, "count": 0}
+    return {"epoch": int(layout["epoch"]), "count": int(layout["count"])}
+
+
+def _write_layout(directory, layout):
+    path = os.path.join(directory, LAYOUT_FILE)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(layout, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def shard_path(directory, epoch, index):
+    return os.path.join(directory, f"messages-{epoch}-{index}.db")
+
+
+def _open_engines(app, directory, epoch, count):
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    engines = []
+    for index in range(count):
+        engine = tune_engine(app, create_engine(f"sqlite:///{shard_path(directory, epoch, index)}", **options))
+        # Shards carry their own schema stamp, so model changes to messages
+        # (new columns and indexes) reach existing shard files too.
+        ensure_schema(engine, SHARD_TABLES)
+        engines.append(engine)
+    return engines
+
+
+class MessageShards:
+    """The open shard engines for the app's current layout."""
+
+    def __init__(self, app):
+        self.app = app
+        self.directory = app.config["MESSAGE_SHARD_DIR"]
+        self.epoch = 0
+        self.engines = []
+        self.load()
+
+    def load(self):
+        self.dispose()
+        layout = read_layout(self.directory)
+        self.epoch = layout["epoch"]
+        self.engines = _open_engines(self.app, self.directory, self.epoch, layout["count"])
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+        self.engines = []
+
+    @property
+    def count(self):
+        return len(self.engines)
+
+    def index_for(self, user_a, user_b):
+        return shard_index(user_a, user_b, self.count)
+
+    def open(self, index):
+        return ShardSession(
+            bind=self.engines[index],
+            expire_on_commit=False,
+            info={"shard": index, "id_base": (self.epoch << EPOCH_SHIFT) | (index << SHARD_SHIFT)},
+        )
+
+
+def _shards():
+    return current_app.extensions["message_shards"]
+
+
+def is_sharded():
+    return _shards().count > 0
+
+
+@contextmanager
+def _shard_session(index):
+    session = _shards().open(index)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@contextmanager
+def session_for(user_a, user_b):
+    """The session holding the conversation between two users."""
+    shards = _shards()
+    if not shards.count:
+        yield db.session
+        return
+    with _shard_session(shards.index_for(user_a, user_b)) as session:
+        yield session
+
+
+@contextmanager
+def each_session():
+    shards = _shards()
+    if not shards.count:
+        yield [db.session]
+        return
+    sessions = [shards.open(index) for index in range(shards.count)]
+    try:
+        yield sessions
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def _between(user_id, other_id):
+    return ((Message.sender_id == user_id) & (Message.receiver_id == other_id)) | (
+        (Message.sender_id == other_id) & (Message.receiver_id == user_id)
+    )
+
+
+def _with_users(messages, *users):
+    by_id = {user.id: user for user in users if user is not None}
+    for message in messages:
+        set_committed_value(message, "sender", by_id.get(message.sender_id))
+        set_committed_value(message, "receiver", by_id.get(message.receiver_id))
+    return messages
+
+
+def thread(user, other, since_id=None, limit=200, newest=False):
+    """Messages between two users in timestamp order.
+
+    ``newest`` returns the last ``limit`` messages instead of the first
+    ``limit`` after ``since_id``.
+    """
+    query = select(Message).options(selectinload(Message.attachments)).where(_between(user.id, other.id))
+    if since_id:
+        query = query.where(Message.id > since_id)
+    if newest:
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.timestamp, Message.id)
+    with session_for(user.id, other.id) as session:
+        messages = session.scalars(query.limit(limit)).all()
+    if newest:
+        messages.reverse()
+    return _with_users(messages, user, other)
+
+
+def has_newer(user_id, other_id, since_id):
+    with session_for(user_id, other_id) as session:
+        return session.scalar(
+            select(Message.id).where(_between(user_id, other_id), Message.id > since_id).limit(1)
+        ) is not None
+
+
+def mark_read(receiver_id, sender_id):
+    """Mark everything ``sender_id`` sent to ``receiver_id`` as read."""
+    with session_for(receiver_id, sender_id) as session:
+        unread = session.scalars(
+            select(Message).where(
+                Message.sender_id == sender_id,
+                Message.receiver_id == receiver_id,
+                Message.is_read.is_(False),
+            )
+        ).all()
+        for message in unread:
+            message.is_read = True
+        session.commit()
+    return len(unread)
+
+
+def trade_messages(trade):
+    query = select(Message).where(Message.trade_id == trade.id).order_by(Message.timestamp)
+    with session_for(trade.buyer_id, trade.seller_id) as session:
+        messages = session.scalars(query).all()
+    return _with_users(messages, trade.buyer, trade.seller)
+
+
+def latest_by_conversation(user_id):
+    """``{other_user_id: latest message}`` across every shard, newest first."""
+    query = (
+        select(Message)
+        .where((Message.sender_id == user_id) | (Message.receiver_id == user_id))
+        .order_by(Message.timestamp.desc())
+    )
+    latest = {}
+    with each_session() as sessions:
+        for session in sessions:
+            for message in session.scalars(query):
+                other_id = message.receiver_id if message.sender_id == user_id else message.sender_id
+                current = latest.get(other_id)
+                if current is None or message.timestamp > current.timestamp:
+                    latest[other_id] = message
+    return dict(sorted(latest.items(), key=lambda item: item[1].timestamp, reverse=True))
+
+
+def get_attachment(attachment_id):
+    """The attachment (with its message loaded) or None."""
+    query = (
+        select(MessageAttachment)
+        .options(selectinload(MessageAttachment.message))
+        .where(MessageAttachment.id == attachment_id)
+    )
+    with each_session() as sessions:
+        # Try the shard whose id range the attachment was written in first.
+        hint = (attachment_id >> SHARD_SHIFT) & (MAX_SHARDS - 1)
+        if hint < len(sessions):
+            sessions.insert(0, sessions.pop(hint))
+        for session in sessions:
+            attachment = session.scalar(query)
+            if attachment is not None:
+                return attachment
+    return None
+
+
+def latest_ids():
+    """Per-shard cursor for :func:`messages_after`: the highest id in each."""
+    with each_session() as sessions:
+        return (_shards().epoch, [session.scalar(select(func.max(Message.id))) or 0 for session in sessions])
+
+
+def messages_after(cursor, limit):
+    """New ``(id, sender_id, receiver_id)`` rows after ``cursor``, and the next cursor.
+
+    A cursor from an earlier layout restarts at the current high-water mark.
+    """
+    epoch, last_ids = cursor
+    if epoch != _shards().epoch or len(last_ids) != max(_shards().count, 1):
+        return [], latest_ids()
+    rows, next_ids = [], []
+    with each_session() as sessions:
+        for session, last_id in zip(sessions, last_ids):
+            batch = session.execute(
+                select(Message.id, Message.sender_id, Message.receiver_id)
+                .where(Message.id > last_id)
+                .order_by(Message.id)
+                .limit(limit)
+            ).all()
+            rows.extend(batch)
+            next_ids.append(batch[-1].id if batch else last_id)
+    return rows, (epoch, next_ids)
+
+
+def parse_sync_cursor(token):
+    """``"<epoch>:<seq>.<seq>..."`` -> per-shard sequence list for this layout."""
+    shards = _shards()
+    try:
+        epoch, _, seqs = (token or "").partition(":")
+        values = [int(value) for value in seqs.split(".")]
+        if int(epoch) == shards.epoch and len(values) == shards.count:
+            return values
+    except ValueError:
+        pass
+    return [0] * shards.count
+
+
+def format_sync_cursor(seqs):
+    return f"{_shards().epoch}:" + ".".join(str(seq) for seq in seqs)
+
+
+def _copy_batch(source, targets, ids):
+    """Copy messages ``ids`` (and their attachments) from ``source`` to their shards."""
+    messages = source.execute(select(Message.__table__).where(Message.id.in_(ids))).mappings().all()
+    attachments = source.execute(
+        select(MessageAttachment.__table__).where(MessageAttachment.message_id.in_(ids))
+    ).mappings().all()
+    placement = {}
+    for row in messages:
+        placement.setdefault(shard_index(row["sender_id"], row["receiver_id"], len(targets)), []).append(dict(row))
+    for index, rows in placement.items():
+        moved = {row["id"] for row in rows}
+        with targets[index].begin() as conn:
+            # Sequence numbers are per file, so moved rows are stamped afresh.
+            seq = change_seq.allocate(conn, len(rows))
+            for offset, row in enumerate(rows):
+                row["change_seq"] = seq + offset
+            conn.execute(insert(Message.__table__), rows)
+            children = [dict(row) for row in attachments if row["message_id"] in moved]
+            if children:
+                conn.execute(insert(MessageAttachment.__table__), children)
+
+
+def reshard(app, count, batch_size=1000, progress=None):
+    """Move every message into ``count`` shard files (0: back into the main database).
+
+    Messages still in the main database (older rows, generated data) are
+    swept into the new layout too. Run it with the app stopped: rows written
+    to the old layout while it runs are not copied. Returns rows moved.
+    """
+    if not 0 <= count <= MAX_SHARDS:
+        raise ValueError(f"shard count must be between 0 and {MAX_SHARDS}")
+    shards = app.extensions["message_shards"]
+    if not count and not shards.count:
+        return 0
+    directory = shards.directory
+    old = read_layout(directory)
+    epoch = old["epoch"] + 1
+    if epoch > MAX_EPOCH:
+        raise ValueError("no message id epochs left")
+    os.makedirs(directory, exist_ok=True)
+
+    # Files left by an interrupted run of this same epoch are not live.
+    for index in range(MAX_SHARDS):
+        path = shard_path(directory, epoch, index)
+        if os.path.exists(path):
+            os.remove(path)
+    new_engines = _open_engines(app, directory, epoch, count)
+    targets = new_engines or [db.engine]
+
+    sources = list(shards.engines)
+    if count:
+        sources.append(db.engine)
+    moved = 0
+    swept_from_main = 0
+    try:
+        for source in sources:
+            last_id = 0
+            with source.connect() as conn:
+                while True:
+                    ids = conn.execute(
+                        select(Message.id).where(Message.id > last_id).order_by(Message.id).limit(batch_size)
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    _copy_batch(conn, targets, ids)
+                    last_id = ids[-1]
+                    moved += len(ids)
+                    if progress:
+                        progress(moved)
+            if source is db.engine:
+                swept_from_main = last_id
+    finally:
+        for engine in new_engines:
+            engine.dispose()
+
+    _write_layout(directory, {"epoch": epoch, "count": count})
+    retired = [shard_path(directory, old["epoch"], index) for index in range(shards.count)]
+    shards.load()
+    if swept_from_main:
+        with db.engine.begin() as conn:
+            main_ids = select(Message.id).where(Message.id <= swept_from_main)
+            conn.execute(delete(MessageAttachment.__table__).where(MessageAttachment.message_id.in_(main_ids)))
+            conn.execute(delete(Message.__table__).where(Message.id <= swept_from_main))
+    for path in retired:
+        if os.path.exists(path):
+            os.remove(path)
+    return moved
+
+
+def init_app(app):
+    app.extensions["message_shards"] = MessageShards(app)
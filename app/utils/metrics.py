@@ -0,0 +1,303 @@
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, abort, current_app, g, has_app_context, request
+
+from app.utils import sql_profiler
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_HELP = {
+    "chainport_http_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "chainport_http_request_duration_seconds": ("histogram", "Request latency in seconds."),
+    "chainport_http_response_size_bytes": ("histogram", "Response body size in bytes."),
+    "chainport_http_db_time_seconds": ("histogram", "Time spent in SQL per request."),
+    "chainport_db_queries_total": ("counter", "SQL statements executed while serving requests."),
+    "chainport_escrow_operations_total": ("counter", "Escrow operations by transaction type."),
+    "chainport_rate_limit_rejections_total": ("counter", "Requests rejected by a rate limiter."),
+    "chainport_webhook_batches_total": ("counter", "Webhook batches by delivery outcome."),
+}
+
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered in Prometheus text format.
+
+    With ``multiproc_dir`` set, every process periodically writes its own
+    totals to ``<dir>/metrics-<pid>.json`` and a scrape from any worker
+    merges all files, so counts survive being spread over gunicorn workers.
+    A file left by a process that is no longer running is folded into
+    ``<dir>/archive.json`` and then deleted. Its counters and histograms
+    stay in the totals, so a worker restart never looks like a counter reset.
+    """
+
+    ARCHIVE_FILE = "archive.json"
+    LOCK_FILE = "archive.lock"
+
+    def __init__(self, multiproc_dir=None, flush_interval=1.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._buckets = {}
+        self._last_flush = 0.0
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+            atexit.register(self._flush_at_exit)
+
+    def inc(self, name, labels=None, amount=1.0):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._buckets.setdefault(name, list(buckets))
+            bounds = self._buckets[name]
+            state = self._histograms.get(key)
+            if state is None:
+                # one slot per bucket plus +Inf, then sum and count
+                state = self._histograms[key] = [0] * (len(bounds) + 1) + [0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(bounds)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return _as_snapshot(self._counters, self._histograms, self._buckets)
+
+    def flush(self, force=True):
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        path = os.path.join(self.multiproc_dir, f"metrics-{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def _archive_dead_workers(self):
+        """Fold the files of exited workers into the archive, then delete them."""
+        with open(os.path.join(self.multiproc_dir, self.LOCK_FILE), "a") as lock:
+            # Only one scraping worker may move a file, or it is counted twice.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = [
+                os.path.join(self.multiproc_dir, name)
+                for name in sorted(os.listdir(self.multiproc_dir))
+                if name.startswith("metrics-") and name.endswith(".json")
+                and not _pid_alive(name[len("metrics-"):-len(".json")])
+            ]
+            if not dead:
+                return
+            archive_path = os.path.join(self.multiproc_dir, self.ARCHIVE_FILE)
+            snapshots = [snap for snap in map(_read_snapshot, [archive_path] + dead) if snap is not None]
+            tmp_path = f"{archive_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(_as_snapshot(*_merge(snapshots)), f)
+            os.replace(tmp_path, archive_path)
+            for path in dead:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def collect(self):
+        """Return merged (counters, histograms, buckets) across processes."""
+        if not self.multiproc_dir:
+            return _merge([self.snapshot()])
+        self.flush()
+        self._archive_dead_workers()
+        snapshots = []
+        for name in sorted(os.listdir(self.multiproc_dir)):
+            if name == self.ARCHIVE_FILE or (name.startswith("metrics-") and name.endswith(".json")):
+                snap = _read_snapshot(os.path.join(self.multiproc_dir, name))
+                if snap is not None:
+                    snapshots.append(snap)
+        return _merge(snapshots)
+
+    def render(self):
+        counters, histograms, buckets = self.collect()
+        lines = []
+        for metric in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+            kind, help_text = _HELP.get(metric, ("untyped", metric))
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for (name, labels), state in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets[name], state):
+                    cumulative += count
+                    le = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(le)} {cumulative}")
+                le = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{_format_labels(le)} {state[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(state[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    buckets = {}
+    for snap in snapshots:
+        buckets.update(snap["buckets"])
+        for name, labels, value in snap["counters"]:
+            counters[(name, _label_key(labels))] += value
+        for name, labels, state in snap["histograms"]:
+            key = (name, _label_key(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], state)]
+            else:
+                histograms[key] = list(state)
+    return counters, histograms, buckets
+
+
+def _as_snapshot(counters, histograms, buckets):
+    return {
+        "counters": [[n, list(map(list, l)), v] for (n, l), v in counters.items()],
+        "histograms": [[n, list(map(list, l)), list(s)] for (n, l), s in histograms.items()],
+        "buckets": {n: list(b) for n, b in buckets.items()},
+    }
+
+
+def _pid_alive(pid):
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, owned by another user
+        return True
+    return True
+
+
+def _label_key(labels):
+    if not labels:
+        return ()
+    if isinstance(labels, dict):
+        labels = labels.items()
+    return tuple(sorted((str(k), str(v)) for k, v in labels))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def get_registry():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("metrics")
+
+
+def inc(name, labels=None, amount=1.0):
+    """Increment a counter on the current app's registry, if metrics are on."""
+    registry = get_registry()
+    if registry is not None:
+        registry.inc(name, labels, amount)
+
+
+def init_app(app):
+    app.config.setdefault("METRICS_ENABLED", True)
+    app.config.setdefault("METRICS_MULTIPROC_DIR", None)
+    app.config.setdefault("METRICS_TOKEN", None)
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    registry = MetricsRegistry(app.config["METRICS_MULTIPROC_DIR"])
+    app.extensions["metrics"] = registry
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        start = g.get("_metrics_start")
+        if start is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        registry.inc(
+            "chainport_http_requests_total",
+            {"endpoint": endpoint, "method": request.method, "status": response.status_code},
+        )
+        registry.observe(
+            "chainport_http_request_duration_seconds",
+            time.perf_counter() - start,
+            {"endpoint": endpoint, "method": request.method},
+        )
+        if response.content_length is not None:
+            registry.observe(
+                "chainport_http_response_size_bytes",
+                response.content_length,
+                {"endpoint": endpoint},
+                buckets=SIZE_BUCKETS,
+            )
+        stats = sql_profiler.current_stats()
+        if stats is not None:
+            registry.observe(
+                "chainport_http_db_time_seconds", stats.total_time, {"endpoint": endpoint}
+            )
+            registry.inc("chainport_db_queries_total", {"endpoint": endpoint}, stats.count)
+        registry.flush(force=False)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        # Route names and traffic are not public: no token, no endpoint.
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,338 @@
+"""Full-page cache for anonymous visitors.
+
+Views decorated with :func:`cached_page` are rendered once per path and
+normalized query string and served from the cache to every visitor who is
+not logged in and has no flashed messages waiting. Logged-in users always
+get a fresh render. Each view names the query parameters it reads; only
+those (sorted, blank values dropped) are part of the key, so tracking tags
+or made-up parameters cannot mint new cache entries.
+
+A page is fresh for ``PAGE_CACHE_TTL`` seconds. For ``PAGE_CACHE_STALE``
+seconds after that it is still served, while a background thread
+re-renders it (stale-while-revalidate), so no visitor waits on the render
+once a page is warm. At most one thread per page and
+``PAGE_CACHE_MAX_REVALIDATIONS`` in all run at a time; past that, stale
+pages are served as they are until a thread frees up. Every page is
+dropped on ``catalog_changed``.
+
+The cache lives in process memory by default; invalidation then reaches
+only the worker that made the change, and the others catch up within the
+TTL. With ``PAGE_CACHE_DIR`` set, pages are files in that directory and all
+workers on the host share them and their invalidation. Either way the
+cache holds at most ``PAGE_CACHE_MAX_ENTRIES`` pages.
+
+Pages carry the visitor's CSRF token in ``base.html``; it is cut out of the
+stored body and each visitor's own token is put back in when it is served.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from app.signals import catalog_changed
+from app.utils.cache import TTLCache
+
+CSRF_PLACEHOLDER = b"<!--page-cache:csrf-token-->"
+_RECEIVER_CONNECTED = False
+
+
+@dataclass
+class CachedPage:
+    status: int
+    content_type: str
+    body: bytes
+    stored_at: float
+    generation: int
+
+
+class MemoryBackend:
+    """Pages in this process's memory, least recently used evicted first."""
+
+    def __init__(self, max_entries, lifetime):
+        self._pages = TTLCache(maxsize=max_entries, ttl=lifetime)
+        self._generation = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        page = self._pages.get(key)
+        return page if page is not None and page.generation == self._generation else None
+
+    def set(self, key, page):
+        if page.generation == self._generation:
+            self._pages.set(key, page)
+
+    def clear(self):
+        self._generation += 1
+        self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
+
+
+class DiskBackend:
+    """Pages as files in a directory shared by every worker on the host.
+
+    Each file is a JSON header line followed by the body. ``clear`` bumps a
+    generation number kept in the directory before deleting the files, so
+    a page rendered before the change and written after it is never served.
+    """
+
+    GENERATION_FILE = "generation"
+
+    def __init__(self, directory, max_entries, lifetime):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lifetime = lifetime
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".page")
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            return [entry for entry in it if entry.name.endswith(".page")]
+
+    def generation(self):
+        try:
+            with open(os.path.join(self.directory, self.GENERATION_FILE), encoding="ascii") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if header.get("key") != key or header["generation"] != self.generation():
+            return None
+        if header["stored_at"] + self.lifetime <= time.time():
+            return None
+        return CachedPage(header["status"], header["content_type"], body, header["stored_at"], header["generation"])
+
+    def set(self, key, page):
+        if self.max_entries <= 0 or page.generation != self.generation():
+            return
+        header = {
+            "key": key,
+            "status": page.status,
+            "content_type": page.content_type,
+            "stored_at": page.stored_at,
+            "generation": page.generation,
+        }
+        self._write(self._path(key), json.dumps(header).encode() + b"\n" + page.body)
+        entries = self._entries()
+        if len(entries) > self.max_entries:
+            entries.sort(key=_mtime)
+            for entry in entries[: len(entries) - self.max_entries]:
+                _remove(entry.path)
+
+    def clear(self):
+        self._write(os.path.join(self.directory, self.GENERATION_FILE), str(self.generation() + 1).encode())
+        for entry in self._entries():
+            _remove(entry.path)
+
+    def __len__(self):
+        return len(self._entries())
+
+
+def _mtime(entry):
+    try:
+        return entry.stat().st_mtime
+    except FileNotFoundError:  # removed by another worker meanwhile
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class PageCache:
+    def __init__(self, backend, ttl, stale, max_revalidations=4):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale = stale
+        self.max_revalidations = max_revalidations
+        self._lock = threading.Lock()
+        # Pages being re-rendered in this process: key -> thread.
+        self.revalidating = {}
+
+    def lookup(self, key):
+        """``(page, "fresh" | "stale")`` or ``(None, None)``."""
+        page = self.backend.get(key)
+        if page is None:
+            return None, None
+        age = time.time() - page.stored_at
+        if age < self.ttl:
+            return page, "fresh"
+        if age < self.ttl + self.stale:
+            return page, "stale"
+        return None, None
+
+    def store(self, key, response, generation):
+        """Keep ``response`` if it is a complete 200 HTML page without cookies."""
+        if (
+            response.status_code != 200
+            or response.mimetype != "text/html"
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Set-Cookie" in response.headers
+        ):
+            return False
+        body = response.get_data()
+        token = g.get(current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token"))
+        if token:
+            body = body.replace(token.encode(), CSRF_PLACEHOLDER)
+        self.backend.set(key, CachedPage(200, response.content_type, body, time.time(), generation))
+        return True
+
+    def revalidate(self, app, key, view, view_args, params):
+        """Re-render ``key`` in a background thread unless one already is.
+
+        Skipped while ``max_revalidations`` threads are busy; the page stays
+        stale until a later request finds a free slot.
+        """
+        with self._lock:
+            if key in self.revalidating or len(self.revalidating) >= self.max_revalidations:
+                return
+            thread = threading.Thread(
+                target=self._render,
+                args=(app, key, request.path, _normalized_query(params), view, view_args),
+                name=f"page-cache {key}",
+                daemon=True,
+            )
+            self.revalidating[key] = thread
+        thread.start()
+
+    def _render(self, app, key, path, query_string, view, view_args):
+        try:
+            generation = self.backend.generation()
+            with app.test_request_context(path, query_string=query_string):
+                self.store(key, make_response(view(**view_args)), generation)
+        except Exception:
+            app.logger.exception("page cache: re-rendering %s failed", key)
+        finally:
+            with self._lock:
+                self.revalidating.pop(key, None)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _normalized_query(params):
+    return urlencode(
+        sorted(
+            (name, value)
+            for name, value in request.args.items(multi=True)
+            if value != "" and name in params
+        )
+    )
+
+
+def cache_key(params=()):
+    query = _normalized_query(params)
+    return f"{request.path}?{query}" if query else request.path
+
+
+def _cacheable_request():
+    return (
+        request.method in ("GET", "HEAD")
+        and "Authorization" not in request.headers
+        and "_flashes" not in session
+        and not current_user.is_authenticated
+    )
+
+
+def _serve(page, state):
+    body = page.body
+    if CSRF_PLACEHOLDER in body:
+        body = body.replace(CSRF_PLACEHOLDER, generate_csrf().encode())
+    response = current_app.response_class(body, status=page.status, content_type=page.content_type)
+    response.headers["X-Page-Cache"] = state.upper()
+    return response
+
+
+def cached_page(*params):
+    """Serve the view from the page cache to anonymous visitors.
+
+    ``params`` are the query parameters the view reads; any others are
+    ignored when looking the page up.
+    """
+    params = frozenset(params)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            app = current_app._get_current_object()
+            cache = app.extensions.get("page_cache")
+            if cache is None or not _cacheable_request():
+                return view(**view_args)
+            key = cache_key(params)
+            page, state = cache.lookup(key)
+            if page is not None:
+                if state == "stale":
+                    cache.revalidate(app, key, view, view_args, params)
+                return _serve(page, state)
+
+            generation = cache.backend.generation()
+            response = make_response(view(**view_args))
+            if cache.store(key, response, generation):
+                response.headers["X-Page-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(app, **extra):
+    cache = app.extensions.get("page_cache")
+    if cache is not None:
+        cache.clear()
+
+
+def init_app(app):
+    global _RECEIVER_CONNECTED
+    app.config.setdefault("PAGE_CACHE_TTL", 30)
+    app.config.setdefault("PAGE_CACHE_STALE", 300)
+    app.config.setdefault("PAGE_CACHE_DIR", None)
+    app.config.setdefault("PAGE_CACHE_MAX_ENTRIES", 512)
+    app.config.setdefault("PAGE_CACHE_MAX_REVALIDATIONS", 4)
+    if app.config["PAGE_CACHE_TTL"] <= 0:
+        return
+    lifetime = app.config["PAGE_CACHE_TTL"] + app.config["PAGE_CACHE_STALE"]
+    if app.config["PAGE_CACHE_DIR"]:
+        backend = DiskBackend(app.config["PAGE_CACHE_DIR"], app.config["PAGE_CACHE_MAX_ENTRIES"], lifetime)
+    else:
+        backend = MemoryBackend(app.config["PAGE_CACHE_MAX_ENTRIES"], lifetime)
+    app.extensions["page_cache"] = PageCache(
+        backend,
+        app.config["PAGE_CACHE_TTL"],
+        app.config["PAGE_CACHE_STALE"],
+        app.config["PAGE_CACHE_MAX_REVALIDATIONS"],
+    )
+    if not _RECEIVER_CONNECTED:
+        catalog_changed.connect(invalidate)
+        _RECEIVER_CONNECTED = True
@@ -0,0 +1,121 @@
+"""Change notifications for long-poll and server-sent-event clients.
+
+One watcher task per event loop polls for new ``Message`` and
+``EscrowTransaction`` rows every ``PUSH_POLL_INTERVAL`` seconds (a primary
+key range scan per table and message shard, however many clients are
+connected) and fans them out to per-user asyncio queues. Because it reads
+the database rather than hooking this process's commits, writes made by
+WSGI workers or other processes are seen too. Events are hints: a woken
+client re-reads what it needs through the normal views.
+"""
+
+import asyncio
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from app.models import EscrowTransaction, db
+from app.utils import message_shards
+
+QUEUE_SIZE = 100
+BATCH_SIZE = 1000
+
+
+class PushHub:
+    """Per-user fan-out of change events to asyncio subscribers.
+
+    Subscribing, unsubscribing and publishing all happen on the event loop
+    thread; only the database poll runs in ``executor``.
+    """
+
+    def __init__(self, app, executor):
+        self.app = app
+        self.executor = executor
+        self.interval = app.config["PUSH_POLL_INTERVAL"]
+        self._subscribers = defaultdict(set)
+        self._cursor = None
+        self._task = None
+
+    @property
+    def subscriber_count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id, event):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client this far behind re-reads from the database anyway.
+                pass
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while self._subscribers:
+            try:
+                events = await loop.run_in_executor(self.executor, self._poll)
+            except Exception:
+                self.app.logger.exception("push watcher poll failed")
+                events = []
+            for user_id, event in events:
+                self.publish(user_id, event)
+            await asyncio.sleep(self.interval)
+        # Idle: forget the position so a later restart doesn't replay a backlog.
+        self._cursor = None
+
+    def _poll(self):
+        with self.app.app_context():
+            if self._cursor is None:
+                self._cursor = (
+                    message_shards.latest_ids(),
+                    db.session.scalar(select(func.max(EscrowTransaction.id))) or 0,
+                )
+                return []
+            last_messages, last_escrow = self._cursor
+            events = []
+
+            messages, last_messages = message_shards.messages_after(last_messages, BATCH_SIZE)
+            for row in messages:
+                event = {"type": "message", "id": row.id, "sender_id": row.sender_id, "receiver_id": row.receiver_id}
+                events.append((row.receiver_id, event))
+                if row.sender_id != row.receiver_id:
+                    events.append((row.sender_id, event))
+
+            transactions = db.session.execute(
+                select(
+                    EscrowTransaction.id,
+                    EscrowTransaction.user_id,
+                    EscrowTransaction.trade_id,
+                    EscrowTransaction.transaction_type,
+                    EscrowTransaction.amount,
+                )
+                .where(EscrowTransaction.id > last_escrow)
+                .order_by(EscrowTransaction.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            for row in transactions:
+                events.append((row.user_id, {
+                    "type": "wallet",
+                    "id": row.id,
+                    "trade_id": row.trade_id,
+                    "transaction_type": row.transaction_type,
+                    "amount": row.amount,
+                }))
+                last_escrow = row.id
+
+            self._cursor = (last_messages, last_escrow)
+            return events
@@ -0,0 +1,86 @@
+"""Read replicas: send safe reads to a copy, everything else to the primary.
+
+Each URI in ``SQLALCHEMY_REPLICA_URIS`` gets an engine of its own (kept
+in ``app.extensions["db_replicas"]`` rather than ``SQLALCHEMY_BINDS``, so
+``create_all``/``drop_all`` never touch a replica) and ``db.session`` is a
+:class:`RoutingSession` that picks an engine per statement:
+
+- writes -- flushes, INSERT/UPDATE/DELETE statements, raw SQL -- always go
+  to the primary, and once a session has written, the rest of its reads do
+  too;
+- reads in a GET/HEAD/OPTIONS request go to one replica, chosen at random
+  and kept for the rest of the request so it sees a single snapshot;
+- reads anywhere else (POST handlers, CLI commands, workers) go to the
+  primary.
+
+Replicas lag, so after any other request the browser session is marked to
+read from the primary for ``REPLICA_STICKY_SECONDS``: a user sees their own
+write on the page they are redirected to. Keeping the replicas up to date
+(a file copy, Litestream, LiteFS) is outside the app.
+"""
+
+import random
+import time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.elements import TextClause
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+STICKY_KEY = "_primary_until"
+
+
+def _reads_from_replica():
+    if not has_request_context() or request.method not in SAFE_METHODS:
+        return False
+    return session.get(STICKY_KEY, 0) <= time.time()
+
+
+class RoutingSession(Session):
+    """``db.session`` with per-statement primary/replica routing."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines.get(None):
+            # An explicit bind, or a model on a bind of its own.
+            return engine
+        if self._flushing or getattr(clause, "is_dml", False) or isinstance(clause, TextClause):
+            self.info["primary"] = True
+        if self.info.get("primary"):
+            return engine
+        replicas = current_app.extensions.get("db_replicas")
+        if not replicas or not _reads_from_replica():
+            return engine
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = random.choice(replicas)
+        return replica
+
+
+def _stick_to_primary(response):
+    sticky = current_app.config["REPLICA_STICKY_SECONDS"]
+    if request.method not in SAFE_METHODS and sticky > 0:
+        session[STICKY_KEY] = time.time() + sticky
+    return response
+
+
+def _mark_primary(db_session, flush_context):
+    db_session.info["primary"] = True
+
+
+event.listen(RoutingSession, "after_flush", _mark_primary)
+
+
+def init_app(app):
+    app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+    app.config.setdefault("REPLICA_STICKY_SECONDS", 10)
+    uris = app.config["SQLALCHEMY_REPLICA_URIS"]
+    if not uris:
+        return
+    # Imported here: app.extensions imports this module for RoutingSession.
+    from app.utils.sqlite_tuning import tune_engine
+
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    app.extensions["db_replicas"] = [tune_engine(app, create_engine(uri, **options)) for uri in uris]
+    app.after_request(_stick_to_primary)
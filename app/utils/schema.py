@@ -0,0 +1,152 @@
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+
+from app.extensions import db
+
+# One-row table recording a fingerprint of the model metadata the database
+# was last brought in line with.
+schema_stamp = db.Table(
+    "chainport_schema",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("fingerprint", db.String(64), nullable=False),
+    db.Column("stamped_at", db.DateTime),
+)
+
+
+def schema_fingerprint(metadata=None, tables=None):
+    """Hash the tables, columns and indexes declared on the models.
+
+    ``tables`` limits the hash to those tables, for databases that hold only
+    some of the models (the message shards).
+    """
+    metadata = metadata if metadata is not None else db.metadata
+    tables = tables if tables is not None else metadata.tables.values()
+    digest = hashlib.sha256()
+    for table in sorted(tables, key=lambda t: t.name):
+        digest.update(f"table:{table.name}\n".encode())
+        for column in table.columns:
+            digest.update(
+                f"col:{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}\n".encode()
+            )
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            cols = ",".join(c.name for c in index.columns)
+            digest.update(f"idx:{index.name}:{cols}:{index.unique}\n".encode())
+    return digest.hexdigest()
+
+
+def read_stamp(engine):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(schema_stamp.c.fingerprint).where(schema_stamp.c.id == 1)
+            ).scalar()
+    except DBAPIError:
+        # Stamp table missing: a fresh database or one created before stamping.
+        return None
+
+
+class SchemaUpgradeError(RuntimeError):
+    """A model change that cannot be applied to an existing table in place."""
+
+
+def column_ddl(column, dialect):
+    """The ``ADD COLUMN`` clause for ``column``, keeping NOT NULL, default and FK."""
+    table = column.table.name
+    if column.primary_key:
+        raise SchemaUpgradeError(f'cannot add primary key column "{table}.{column.name}" to an existing table')
+    if not column.nullable and column.server_default is None:
+        raise SchemaUpgradeError(
+            f'cannot add NOT NULL column "{table}.{column.name}" without a server_default '
+            "for the existing rows"
+        )
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    for fk in column.foreign_keys:
+        ddl += f' REFERENCES "{fk.column.table.name}" ("{fk.column.name}")'
+    return ddl
+
+
+@contextmanager
+def schema_lock(engine):
+    """A connection holding the database's write lock until the block ends.
+
+    Workers booting together queue here instead of racing each other's DDL;
+    whatever they inspect inside the block is what they will change.
+    """
+    if engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+    else:
+        with engine.begin() as conn:
+            schema_stamp.create(conn, checkfirst=True)
+            conn.execute(select(schema_stamp.c.id).with_for_update()).all()
+            yield conn
+
+
+def upgrade_schema(bind, tables=None):
+    """Create missing tables, then add columns and indexes that create_all skips.
+
+    ``create_all`` only creates whole tables, so a model gaining a column or
+    a new index would otherwise never reach an existing database. ``bind``
+    is an engine, or a connection from :func:`schema_lock`; ``tables``
+    defaults to every model table.
+    """
+    if isinstance(bind, Engine):
+        with schema_lock(bind) as conn:
+            return upgrade_schema(conn, tables)
+    conn = bind
+    tables = tables if tables is not None else db.metadata.sorted_tables
+    db.metadata.create_all(conn, tables=tables)
+    inspector = inspect(conn)
+    for table in tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {column_ddl(column, conn.dialect)}')
+            if column.unique:
+                # SQLite cannot add a UNIQUE column; an index enforces the same.
+                conn.exec_driver_sql(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "uq_{table.name}_{column.name}" '
+                    f'ON "{table.name}" ("{column.name}")'
+                )
+    for table in tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def ensure_schema(engine, tables=None):
+    """Bring the database up to date unless its stamp already matches.
+
+    ``tables`` is passed on to :func:`upgrade_schema`. Returns True when DDL
+    was run, False when the stamp was current.
+    """
+    fingerprint = schema_fingerprint(tables=tables)
+    if read_stamp(engine) == fingerprint:
+        return False
+
+    with schema_lock(engine) as conn:
+        schema_stamp.create(conn, checkfirst=True)
+        stamp = conn.execute(select(schema_stamp.c.fingerprint).where(schema_stamp.c.id == 1)).scalar()
+        if stamp == fingerprint:
+            # Another worker upgraded while this one waited for the lock.
+            return False
+        upgrade_schema(conn, tables)
+        conn.execute(schema_stamp.delete())
+        conn.execute(
+            schema_stamp.insert().values(
+                id=1, fingerprint=fingerprint, stamped_at=datetime.now(timezone.utc)
+            )
+        )
+    return True
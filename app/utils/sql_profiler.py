@@ -0,0 +1,187 @@
+import hmac
+import time
+from collections import Counter, deque
+
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    g,
+    has_request_context,
+    render_template,
+    request,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+debug_bp = Blueprint("debug", __name__, url_prefix="/debug")
+
+_LISTENERS_INSTALLED = False
+
+
+class RequestQueryStats:
+    """SQL statements executed while handling a single request."""
+
+    def __init__(self, detailed=True):
+        self.detailed = detailed
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = []
+        self._by_statement = Counter()
+        self._by_call = Counter()
+
+    def record(self, statement, parameters, duration):
+        self.count += 1
+        self.total_time += duration
+        if not self.detailed:
+            return
+        self.statements.append((statement, duration))
+        self._by_statement[statement] += 1
+        try:
+            self._by_call[(statement, repr(parameters))] += 1
+        except Exception:
+            pass
+
+    def slowest(self, limit=5):
+        return sorted(self.statements, key=lambda item: item[1], reverse=True)[:limit]
+
+    def repeated(self):
+        """Statements executed more than once with identical parameters."""
+        return [
+            (statement, count)
+            for (statement, _params), count in self._by_call.most_common()
+            if count > 1
+        ]
+
+    def n_plus_one(self, threshold):
+        """Statement shapes issued at least ``threshold`` times (likely N+1)."""
+        return [
+            (statement, count)
+            for statement, count in self._by_statement.most_common()
+            if count >= threshold
+        ]
+
+    def summary(self, slow_count, threshold):
+        return {
+            "queries": self.count,
+            "sql_time_ms": round(self.total_time * 1000, 2),
+            "slowest": [
+                {"statement": s, "ms": round(d * 1000, 2)} for s, d in self.slowest(slow_count)
+            ],
+            "repeated": [{"statement": s, "count": c} for s, c in self.repeated()],
+            "n_plus_one": [{"statement": s, "count": c} for s, c in self.n_plus_one(threshold)],
+        }
+
+
+def current_stats():
+    """Return the stats collector for the active request, if profiling is on."""
+    if not has_request_context():
+        return None
+    return g.get("_sql_stats")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_cp_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("_cp_query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, parameters, duration)
+
+
+def _install_listeners():
+    # Listen on the Engine class so every engine (including ones created after
+    # start-up) reports into the same per-request collector.
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _LISTENERS_INSTALLED = True
+
+
+def init_app(app):
+    """Register SQL profiling hooks; they are inert unless SQL_PROFILING is set."""
+    app.config.setdefault("SQL_PROFILING", False)
+    app.config.setdefault("SQL_PROFILING_N_PLUS_ONE_THRESHOLD", 5)
+    app.config.setdefault("SQL_PROFILING_SLOWEST", 5)
+    app.config.setdefault("SQL_PROFILING_HISTORY", 100)
+    # /debug/perf shows SQL text from other users' requests: only in debug
+    # mode, or to requests carrying this bearer token.
+    app.config.setdefault("SQL_PROFILING_TOKEN", None)
+    app.extensions["sql_profiler"] = deque(maxlen=app.config["SQL_PROFILING_HISTORY"])
+
+    _install_listeners()
+
+    @app.before_request
+    def _start_sql_profile():
+        if current_app.config["SQL_PROFILING"]:
+            g._sql_stats = RequestQueryStats()
+        elif "metrics" in current_app.extensions:
+            # Metrics only need totals, not every statement.
+            g._sql_stats = RequestQueryStats(detailed=False)
+
+    @app.after_request
+    def _finish_sql_profile(response):
+        stats = g.get("_sql_stats")
+        if stats is None or not stats.detailed:
+            return response
+
+        config = current_app.config
+        threshold = config["SQL_PROFILING_N_PLUS_ONE_THRESHOLD"]
+        summary = stats.summary(config["SQL_PROFILING_SLOWEST"], threshold)
+        summary.update(
+            method=request.method,
+            path=request.full_path.rstrip("?"),
+            endpoint=request.endpoint,
+            status=response.status_code,
+        )
+
+        response.headers["X-SQL-Queries"] = str(summary["queries"])
+        response.headers["X-SQL-Time-ms"] = f"{summary['sql_time_ms']:.2f}"
+        response.headers["X-SQL-N-Plus-One"] = str(len(summary["n_plus_one"]))
+
+        current_app.logger.info(
+            "sql-profile %s %s status=%s queries=%d sql_ms=%.2f repeated=%d n_plus_one=%d",
+            summary["method"],
+            summary["path"],
+            summary["status"],
+            summary["queries"],
+            summary["sql_time_ms"],
+            len(summary["repeated"]),
+            len(summary["n_plus_one"]),
+        )
+        for item in summary["n_plus_one"]:
+            current_app.logger.warning(
+                "possible N+1 on %s: %d x %s", summary["path"], item["count"], item["statement"]
+            )
+
+        if request.endpoint != "debug.perf":
+            current_app.extensions["sql_profiler"].appendleft(summary)
+        return response
+
+    app.register_blueprint(debug_bp)
+
+
+@debug_bp.route("/perf")
+def perf():
+    config = current_app.config
+    if not config["SQL_PROFILING"]:
+        abort(404)
+    if not current_app.debug:
+        token = config["SQL_PROFILING_TOKEN"]
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+    history = list(current_app.extensions["sql_profiler"])
+    return render_template(
+        "debug_perf.html",
+        history=history,
+        threshold=current_app.config["SQL_PROFILING_N_PLUS_ONE_THRESHOLD"],
+    )
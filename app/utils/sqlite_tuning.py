@@ -0,0 +1,91 @@
+"""SQLite connection profile and pool options.
+
+SQLite's defaults suit a single process: a rollback journal that makes
+readers and the writer block each other, a full fsync on every commit, and
+a small page cache. ``SQLITE_PROFILE = "production"`` applies, on every new
+connection of every SQLite engine the app opens (primary, replicas, message
+shards):
+
+- ``journal_mode=WAL``: readers never block the writer or each other;
+- ``synchronous=NORMAL``: in WAL mode commits stay atomic and consistent,
+  and only a power loss can drop the last few of them; fsync happens at
+  checkpoints rather than on every commit;
+- ``busy_timeout``: a writer waits this many milliseconds for the lock
+  instead of failing at once with "database is locked";
+- ``mmap_size``, ``cache_size``: read through a memory map and keep a
+  larger page cache per connection;
+- ``temp_store=MEMORY``: sorts and temporary B-trees stay off disk.
+
+``SQLITE_PRAGMAS`` overrides or adds individual pragmas;
+``SQLITE_PROFILE = "default"`` leaves SQLite's own settings alone. Compare
+them with ``python -m benchmarks.concurrent_writes``.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app.extensions import db
+
+PROFILES = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative: KiB, so 64 MiB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def profile_pragmas(profile, overrides=None):
+    if profile not in PROFILES:
+        raise ValueError(f"unknown SQLite profile {profile!r}; expected one of {sorted(PROFILES)}")
+    pragmas = dict(PROFILES[profile])
+    pragmas.update(overrides or {})
+    for name, value in pragmas.items():
+        # Pragmas can't take bound parameters; only accept plain tokens.
+        if not name.isidentifier() or not str(value).lstrip("-").isalnum():
+            raise ValueError(f"invalid SQLite pragma {name}={value!r}")
+    return pragmas
+
+
+def engine_options(uri, pool_size, max_overflow, pool_timeout):
+    """Pool settings for ``create_engine``; in-memory SQLite keeps its single connection."""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": pool_timeout}
+
+
+def tune(engine, pragmas):
+    """Run ``pragmas`` on each new connection of a SQLite ``engine``."""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+def tune_engine(app, engine):
+    """Apply the app's profile to an engine it created outside Flask-SQLAlchemy."""
+    tune(engine, app.extensions.get("sqlite_pragmas"))
+    return engine
+
+
+def init_app(app):
+    """Apply the profile to ``db``'s engines; call after ``db.init_app(app)``."""
+    app.config.setdefault("SQLITE_PROFILE", "production")
+    app.config.setdefault("SQLITE_PRAGMAS", {})
+    pragmas = profile_pragmas(app.config["SQLITE_PROFILE"], app.config["SQLITE_PRAGMAS"])
+    app.extensions["sqlite_pragmas"] = pragmas
+    with app.app_context():
+        for engine in db.engines.values():
+            tune(engine, pragmas)
@@ -0,0 +1,213 @@
+"""Pluggable storage for uploaded files.
+
+Rows store a relative *key* such as ``messages/3f/a9/invoice-<uuid>.pdf``
+instead of an absolute path, so files can move between disks, hosts or
+backends without rewriting the database. Keys are sharded on a hash of the
+file name, which keeps every directory small no matter how many files are
+stored.
+
+Backends (``STORAGE_BACKEND``):
+
+``local``
+    Files live at ``STORAGE_ROOT/<key>`` (default ``UPLOAD_FOLDER``).
+``object``
+    A local stand-in for an S3-style object store: each object is an opaque
+    blob named by the hash of its key, with a JSON metadata sidecar. Code
+    that works against it makes no assumptions about on-disk layout.
+
+Rows written before keys existed hold absolute paths; those are still
+served until ``flask migrate-uploads`` moves them into the backend.
+"""
+
+import abc
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import current_app, send_file
+
+from app.utils.uploads import StreamedUpload, save_upload
+
+NAMESPACES = ("kyc", "messages", "products")
+
+
+def make_key(namespace, filename):
+    """Build a sharded key for ``filename`` (already unique and sanitised)."""
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Unknown storage namespace: {namespace}")
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    return f"{namespace}/{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def is_legacy_path(key):
+    return os.path.isabs(key)
+
+
+class Storage(abc.ABC):
+    name = None
+
+    def __init__(self, root):
+        self.root = root
+
+    @abc.abstractmethod
+    def path_for(self, key):
+        """Filesystem path holding the object stored under ``key``."""
+
+    def _check_key(self, key):
+        parts = key.split("/")
+        if is_legacy_path(key) or ".." in parts or "" in parts or parts[0] not in NAMESPACES:
+            raise ValueError(f"Invalid storage key: {key!r}")
+
+    def _resolve(self, key):
+        if is_legacy_path(key):
+            return key
+        self._check_key(key)
+        return self.path_for(key)
+
+    def _written(self, key, path, size, digest, content_type):
+        """Hook for backends that keep metadata next to the object."""
+
+    def save(self, file, key, content_type=None):
+        """Store an uploaded ``FileStorage`` under ``key``; returns ``(size, sha256)``."""
+        self._check_key(key)
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size, digest = save_upload(file, path)
+        self._written(key, path, size, digest, content_type or getattr(file, "mimetype", None))
+        return size, digest
+
+    def save_stream(self, stream, key, content_type=None):
+        """Store the contents of a readable binary stream under ``key``."""
+        self._check_key(key)
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        upload = StreamedUpload(os.path.dirname(path))
+        try:
+            shutil.copyfileobj(stream, upload)
+            upload.save_as(path)
+        finally:
+            upload.close()
+        self._written(key, path, upload.size, upload.sha256, content_type)
+        return upload.size, upload.sha256
+
+    def exists(self, key):
+        try:
+            return os.path.isfile(self._resolve(key))
+        except ValueError:
+            return False
+
+    def open(self, key):
+        return open(self._resolve(key), "rb")
+
+    def size(self, key):
+        return os.path.getsize(self._resolve(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._resolve(key))
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def send(self, key, download_name=None, as_attachment=False, mimetype=None, max_age=None):
+        download_name = download_name or os.path.basename(key)
+        mimetype = mimetype or mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+        return send_file(
+            self._resolve(key),
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            max_age=max_age,
+        )
+
+    @abc.abstractmethod
+    def iter_keys(self):
+        """Yield every key the backend holds."""
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def path_for(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def iter_keys(self):
+        for namespace in NAMESPACES:
+            base = os.path.join(self.root, namespace)
+            for dirpath, _dirs, files in os.walk(base):
+                rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+                # Only sharded entries are keys; flat legacy files are not.
+                if rel.count("/") != 2:
+                    continue
+                for name in files:
+                    yield f"{rel}/{name}"
+
+
+class ObjectStorage(Storage):
+    name = "object"
+
+    def path_for(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _meta_path(self, path):
+        return f"{path}.json"
+
+    def _written(self, key, path, size, digest, content_type):
+        meta = {"key": key, "size": size, "sha256": digest, "content_type": content_type}
+        tmp_path = f"{self._meta_path(path)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(path))
+
+    def metadata(self, key):
+        with open(self._meta_path(self._resolve(key)), encoding="utf-8") as f:
+            return json.load(f)
+
+    def delete(self, key):
+        super().delete(key)
+        if not is_legacy_path(key):
+            try:
+                os.unlink(self._meta_path(self.path_for(key)))
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def send(self, key, download_name=None, as_attachment=False, mimetype=None, max_age=None):
+        if mimetype is None and not is_legacy_path(key):
+            try:
+                mimetype = self.metadata(key).get("content_type")
+            except (OSError, ValueError):
+                pass
+        return super().send(key, download_name, as_attachment, mimetype, max_age)
+
+    def iter_keys(self):
+        base = os.path.join(self.root, "objects")
+        for dirpath, _dirs, files in os.walk(base):
+            for name in files:
+                if name.endswith(".json"):
+                    with open(os.path.join(dirpath, name), encoding="utf-8") as f:
+                        yield json.load(f)["key"]
+
+
+BACKENDS = {LocalStorage.name: LocalStorage, ObjectStorage.name: ObjectStorage}
+
+
+def create_storage(app, backend=None, root=None):
+    backend = backend or app.config["STORAGE_BACKEND"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    if root is None:
+        root = app.config.get("STORAGE_ROOT")
+    if root is None:
+        root = app.config["UPLOAD_FOLDER"] if backend == "local" else os.path.join(app.instance_path, "objectstore")
+    return BACKENDS[backend](root)
+
+
+def get_storage():
+    """The app's configured backend, built on first use so tests can repoint it."""
+    app = current_app._get_current_object()
+    storage = app.extensions.get("storage")
+    if storage is None:
+        storage = app.extensions["storage"] = create_storage(app)
+    return storage
@@ -0,0 +1,114 @@
+"""Move pre-storage uploads into the configured backend.
+
+Before storage keys, KYC documents and message attachments were saved under
+absolute paths recorded in ``file_path``, and product images were written
+to ``static/uploads/products/<id>.<ext>``. ``migrate_legacy_uploads`` copies
+each file into the backend, points the row at its new key and only then
+removes the original, so an interrupted run can simply be restarted.
+Message attachments are migrated in whichever database holds them: the
+main one, or each message shard.
+"""
+
+import os
+import re
+import uuid
+
+from sqlalchemy import select
+
+from app.models import KYCDocument, MessageAttachment, Product, db
+from app.utils import message_shards
+from app.utils.storage import make_key
+
+BATCH_SIZE = 500
+_LEGACY_IMAGE_RE = re.compile(r"^(\d+)(_thumb)?\.(png|jpe?g|webp|svg)$", re.IGNORECASE)
+
+
+def _migrate_rows(storage, model, namespace, report, dry_run, session=None):
+    session = session or db.session
+    last_id = 0
+    while True:
+        rows = session.scalars(
+            select(model)
+            .where(model.id > last_id, ~model.file_path.like(f"{namespace}/%"))
+            .order_by(model.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        moved = []
+        for row in rows:
+            old_path = row.file_path
+            if not os.path.isfile(old_path):
+                report["missing"].append(f"{model.__tablename__}:{row.id} {old_path}")
+                continue
+            report["moved"] += 1
+            if dry_run:
+                continue
+            key = make_key(namespace, row.filename)
+            with open(old_path, "rb") as f:
+                size, digest = storage.save_stream(f, key, getattr(row, "content_type", None))
+            row.file_path = key
+            row.file_size = row.file_size or size
+            row.sha256 = row.sha256 or digest
+            moved.append(old_path)
+        if not dry_run:
+            session.commit()
+            for path in moved:
+                os.unlink(path)
+
+
+def _migrate_product_images(storage, images_dir, report, dry_run):
+    if not os.path.isdir(images_dir):
+        return
+    found = {}
+    for name in os.listdir(images_dir):
+        match = _LEGACY_IMAGE_RE.match(name)
+        if match:
+            found.setdefault(int(match.group(1)), []).append((bool(match.group(2)), name))
+
+    for product_id, names in sorted(found.items()):
+        product = db.session.get(Product, product_id)
+        # The thumbnail was what the site displayed; fall back to the original.
+        names.sort(reverse=True)
+        if product is None or product.image_key:
+            report["skipped"] += 1
+            continue
+        report["moved"] += 1
+        if dry_run:
+            continue
+        name = names[0][1]
+        ext = name.rsplit(".", 1)[1].lower()
+        key = make_key("products", f"{product_id}-{uuid.uuid4().hex}.{ext}")
+        with open(os.path.join(images_dir, name), "rb") as f:
+            storage.save_stream(f, key, None)
+        product.image_key = key
+        db.session.commit()
+        for _thumb, legacy in names:
+            os.unlink(os.path.join(images_dir, legacy))
+
+
+def migrate_legacy_uploads(storage, product_images_dir, dry_run=False):
+    """Returns ``{"moved": n, "skipped": n, "missing": [...]}``."""
+    report = {"moved": 0, "skipped": 0, "missing": []}
+    _migrate_rows(storage, KYCDocument, "kyc", report, dry_run)
+    with message_shards.each_session() as sessions:
+        for session in sessions:
+            _migrate_rows(storage, MessageAttachment, "messages", report, dry_run, session)
+    _migrate_product_images(storage, product_images_dir, report, dry_run)
+    return report
+
+
+def copy_storage(source, target, dry_run=False):
+    """Copy every object from ``source`` to ``target``; keys are unchanged."""
+    copied = skipped = 0
+    for key in source.iter_keys():
+        if target.exists(key):
+            skipped += 1
+            continue
+        copied += 1
+        if not dry_run:
+            content_type = source.metadata(key).get("content_type") if hasattr(source, "metadata") else None
+            with source.open(key) as f:
+                target.save_stream(f, key, content_type)
+    return copied, skipped
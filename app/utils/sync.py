@@ -0,0 +1,122 @@
+"""Delta sync: everything a user can see that changed after a cursor.
+
+``changes_since(user_id, since, limit)`` reads each table from its
+``change_seq`` index: escrow transactions by ``(user_id, change_seq)``,
+trades and messages by one range per party (``buyer``/``seller``,
+``sender``/``receiver``), and products -- the public catalogue -- by
+``change_seq`` alone. Rows are selected as plain column tuples and
+returned as short dicts.
+
+Sequence numbers are unique across tables, so one cursor covers them all.
+When any table has more than ``limit`` changes, the page ends at the
+lowest sequence number where a table was cut off, and rows above it are
+left for the next page; ``next`` is always safe to resume from.
+
+Sharded messages (see :mod:`app.utils.message_shards`) are numbered per
+shard instead, so they are paged separately under ``message_cursor``, one
+position per shard; a cursor from an older shard layout starts over.
+"""
+
+from sqlalchemy import select
+
+from app.models import EscrowTransaction, Message, Product, Trade, db
+from app.utils import message_shards
+
+TRADE_COLUMNS = (
+    Trade.id, Trade.change_seq, Trade.buyer_id, Trade.seller_id, Trade.product_id, Trade.status,
+    Trade.quantity, Trade.unit, Trade.total_amount, Trade.escrow_amount, Trade.currency, Trade.updated_at,
+)
+MESSAGE_COLUMNS = (
+    Message.id, Message.change_seq, Message.sender_id, Message.receiver_id, Message.trade_id,
+    Message.subject, Message.content, Message.is_read, Message.timestamp,
+)
+ESCROW_COLUMNS = (
+    EscrowTransaction.id, EscrowTransaction.change_seq, EscrowTransaction.trade_id,
+    EscrowTransaction.transaction_type, EscrowTransaction.amount, EscrowTransaction.currency,
+    EscrowTransaction.status, EscrowTransaction.created_at,
+)
+PRODUCT_COLUMNS = (
+    Product.id, Product.change_seq, Product.seller_id, Product.sku, Product.title, Product.category,
+    Product.price_per_unit, Product.currency, Product.unit, Product.quantity, Product.min_order_quantity,
+    Product.country_of_origin, Product.is_active, Product.updated_at,
+)
+
+
+def _row(row):
+    return {
+        key: value.isoformat() if hasattr(value, "isoformat") else value
+        for key, value in row._mapping.items()
+    }
+
+
+def _scan(columns, since, limit, *clauses, session=None):
+    seq = columns[1]
+    return (session or db.session).execute(
+        select(*columns).where(*clauses, seq > since).order_by(seq).limit(limit)
+    ).all()
+
+
+def _two_sided(columns, party_columns, user_id, since, limit, session=None):
+    rows = {}
+    for party in party_columns:
+        for row in _scan(columns, since, limit, party == user_id, session=session):
+            rows[row.id] = row
+    return sorted(rows.values(), key=lambda row: row.change_seq)[:limit]
+
+
+def _sharded_messages(user_id, cursor, limit):
+    """Messages from every shard after its own cursor; each shard pages alone."""
+    seqs = message_shards.parse_sync_cursor(cursor)
+    per_shard = max(1, -(-limit // len(seqs)))
+    rows, more = [], False
+    with message_shards.each_session() as sessions:
+        for index, session in enumerate(sessions):
+            batch = _two_sided(
+                MESSAGE_COLUMNS, (Message.sender_id, Message.receiver_id), user_id, seqs[index], per_shard, session
+            )
+            if batch:
+                seqs[index] = batch[-1].change_seq
+            more = more or len(batch) >= per_shard
+            rows.extend(batch)
+    return rows, message_shards.format_sync_cursor(seqs), more
+
+
+def changes_since(user_id, since=0, limit=500, message_cursor=None):
+    tables = {
+        "trades": _two_sided(TRADE_COLUMNS, (Trade.buyer_id, Trade.seller_id), user_id, since, limit),
+        "escrow_transactions": _scan(ESCROW_COLUMNS, since, limit, EscrowTransaction.user_id == user_id),
+        "products": _scan(PRODUCT_COLUMNS, since, limit),
+    }
+    sharded = message_shards.is_sharded()
+    if sharded:
+        messages, message_cursor, more_messages = _sharded_messages(user_id, message_cursor, limit)
+    else:
+        tables["messages"] = _two_sided(
+            MESSAGE_COLUMNS, (Message.sender_id, Message.receiver_id), user_id, since, limit
+        )
+
+    # A table that filled its page may have more rows after its last one;
+    # nothing past the earliest such cut-off is safe to return yet.
+    cutoffs = [rows[-1].change_seq for rows in tables.values() if len(rows) >= limit]
+    cursor = min(cutoffs) if cutoffs else None
+    if cursor is not None:
+        tables = {name: [r for r in rows if r.change_seq <= cursor] for name, rows in tables.items()}
+    else:
+        cursor = max((rows[-1].change_seq for rows in tables.values() if rows), default=since)
+
+    result = {"since": since, "next": cursor, "more": bool(cutoffs)}
+    if sharded:
+        result["messages"] = [_row(r) for r in messages]
+        result["message_cursor"] = message_cursor
+        result["more"] = result["more"] or more_messages
+    for name, rows in tables.items():
+        if name == "products":
+            # Other sellers' withdrawn listings only need to disappear.
+            result[name] = [
+                _row(r) if r.is_active or r.seller_id == user_id
+                else {"id": r.id, "change_seq": r.change_seq, "is_active": False}
+                for r in rows
+            ]
+        else:
+            result[name] = [_row(r) for r in rows]
+    return result
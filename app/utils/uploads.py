@@ -0,0 +1,153 @@
+"""Request-size limits and streaming file uploads.
+
+Every multipart file part is written straight to a temporary file in
+``UPLOAD_TMP_FOLDER`` as Werkzeug parses it, hashing and counting bytes on
+the way, so a worker holds one parser buffer per upload no matter how large
+the file is. A view decorated with :func:`upload_limit` caps each file: once
+a part goes over, its temp file is truncated and the rest of the part is
+discarded, and the view sees ``exceeded`` set. :func:`save_upload` moves the
+temp file into place with an atomic rename; temp files that are never saved
+are removed when the request closes.
+"""
+
+import errno
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app
+
+COPY_CHUNK = 64 * 1024
+
+
+def max_content_length(limit):
+    """Give a view its own request-size limit instead of MAX_CONTENT_LENGTH.
+
+    The limit is applied by :class:`ChainPortRequest` as soon as the body is
+    touched (form parsing, CSRF checks or ``request.stream``).
+    """
+
+    def decorator(view):
+        view.max_content_length = limit
+        return view
+
+    return decorator
+
+
+def upload_limit(limit):
+    """Cap the size of each file uploaded to a view (int or ``config -> int``)."""
+
+    def decorator(view):
+        view.upload_limit = limit
+        return view
+
+    return decorator
+
+
+def _view_setting(request, name):
+    if not current_app or not request.endpoint:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    value = getattr(view, name, None)
+    return value(current_app.config) if callable(value) else value
+
+
+class StreamedUpload(io.BufferedRandom):
+    """A temp file that hashes, counts and size-checks what is written to it."""
+
+    def __init__(self, tmp_dir, limit=None):
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, prefix="upload-", suffix=".part")
+        super().__init__(io.FileIO(fd, "w+b"))
+        self.limit = limit
+        self.size = 0
+        self.exceeded = False
+        self.saved = False
+        self._digest = hashlib.sha256()
+
+    def write(self, data):
+        if self.exceeded:
+            return len(data)
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            # Stop spending disk on a file that will be rejected anyway.
+            self.exceeded = True
+            self.seek(0)
+            self.truncate()
+            return len(data)
+        self._digest.update(data)
+        return super().write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def save_as(self, dest_path):
+        """Atomically move the upload to ``dest_path``; it must not have exceeded."""
+        if self.exceeded:
+            raise ValueError("Upload exceeded its size limit")
+        self.flush()
+        os.fsync(self.fileno())
+        super().close()
+        _atomic_move(self.path, dest_path)
+        self.saved = True
+
+    def close(self):
+        super().close()
+        if not self.saved:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _atomic_move(src, dest_path):
+    try:
+        os.replace(src, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystem: copy next to the destination, then rename.
+        part = f"{dest_path}.part"
+        shutil.copyfile(src, part)
+        os.replace(part, dest_path)
+        os.unlink(src)
+
+
+def save_upload(file, dest_path):
+    """Store a ``FileStorage`` at ``dest_path``; returns ``(size, sha256)``.
+
+    Streams that did not come through :class:`ChainPortRequest` are copied
+    through a :class:`StreamedUpload` first so the result is the same.
+    """
+    stream = file.stream
+    if not isinstance(stream, StreamedUpload):
+        copy = StreamedUpload(os.path.dirname(dest_path) or ".")
+        try:
+            shutil.copyfileobj(stream, copy, COPY_CHUNK)
+            copy.save_as(dest_path)
+        finally:
+            copy.close()
+        return copy.size, copy.sha256
+    stream.save_as(dest_path)
+    return stream.size, stream.sha256
+
+
+def upload_exceeded(file):
+    return getattr(file.stream, "exceeded", False)
+
+
+class ChainPortRequest(Request):
+    @property
+    def max_content_length(self):
+        limit = _view_setting(self, "max_content_length")
+        return limit if limit is not None else super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limit = _view_setting(self, "upload_limit")
+        tmp_dir = current_app.config["UPLOAD_TMP_FOLDER"]
+        upload = StreamedUpload(tmp_dir, limit)
+        if limit is not None and content_length is not None and content_length > limit:
+            upload.exceeded = True
+        return upload
@@ -0,0 +1,18 @@
+"""ASGI entry point: ``uvicorn asgi:application`` (or any ASGI server).
+
+Serves the whole site; the push and long-poll APIs are handled without
+tying up a thread per open connection. See ``app/asgi.py``.
+"""
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv()
+
+from app import create_app
+from app.asgi import create_asgi_app
+
+application = create_asgi_app(create_app())
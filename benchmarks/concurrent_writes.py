@@ -0,0 +1,163 @@
+"""Concurrent write throughput under each SQLite profile.
+
+Usage::
+
+    python -m benchmarks.concurrent_writes --workers 8 --transactions 300
+    python -m benchmarks.concurrent_writes --profiles production --output writes.json
+
+Each worker process opens its own engine (as a gunicorn worker would) and
+commits a mix of escrow deposits -- a balance update plus a ledger row --
+and message inserts against a shared database file. Every profile gets a
+fresh file, because WAL mode is persistent. A transaction that fails with
+"database is locked" is counted, not retried.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+USERS = 50
+
+
+def _worker(url, pragmas, options, worker_id, transactions, barrier, results):
+    from sqlalchemy import create_engine, insert, update
+    from sqlalchemy.exc import OperationalError
+
+    from app.models import EscrowTransaction, Message, User
+    from app.utils.sqlite_tuning import tune
+
+    engine = create_engine(url, **options)
+    tune(engine, pragmas)
+    latencies, locked = [], 0
+    barrier.wait()
+    for i in range(transactions):
+        user_id = 1 + (worker_id * transactions + i) % USERS
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if i % 2:
+                    conn.execute(insert(Message.__table__).values(
+                        sender_id=user_id, receiver_id=1 + user_id % USERS, content=f"w{worker_id} m{i}",
+                        is_read=False, timestamp=datetime.now(timezone.utc),
+                    ))
+                else:
+                    conn.execute(
+                        update(User.__table__)
+                        .where(User.id == user_id)
+                        .values(escrow_balance=User.escrow_balance + 1)
+                    )
+                    conn.execute(insert(EscrowTransaction.__table__).values(
+                        user_id=user_id, transaction_type="deposit", amount=1.0, status="completed",
+                        created_at=datetime.now(timezone.utc),
+                    ))
+        except OperationalError:
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    engine.dispose()
+    results.put((latencies, locked))
+
+
+def run_profile(profile, workers, transactions, directory):
+    from sqlalchemy import create_engine, insert
+
+    from app.extensions import db
+    from app.models import User
+    from app.utils.sqlite_tuning import engine_options, profile_pragmas, tune
+
+    path = os.path.join(directory, f"writes-{profile}.db")
+    url = f"sqlite:///{path}"
+    pragmas = profile_pragmas(profile)
+    options = engine_options(url, pool_size=1, max_overflow=0, pool_timeout=30)
+
+    engine = create_engine(url)
+    tune(engine, pragmas)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": i, "email": f"bench{i}@example.com", "password_hash": "x", "escrow_balance": 0.0}
+            for i in range(1, USERS + 1)
+        ])
+    engine.dispose()
+
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    barrier = ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(url, pragmas, options, w, transactions, barrier, results))
+        for w in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    barrier.wait()
+    start = time.perf_counter()
+    collected = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - start
+    for proc in procs:
+        proc.join()
+
+    latencies = sorted(sample for samples, _locked in collected for sample in samples)
+    locked = sum(n for _samples, n in collected)
+    committed = len(latencies)
+    p95_index = max(0, int(round(committed * 0.95)) - 1)
+    result = {
+        "committed": committed,
+        "locked_errors": locked,
+        "seconds": round(elapsed, 3),
+        "commits_per_s": round(committed / elapsed, 1) if elapsed else None,
+        "median_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "p95_ms": round(latencies[p95_index] * 1000, 3) if latencies else None,
+    }
+    print(
+        f"{profile:<12} {result['commits_per_s']:>9} commits/s  median {result['median_ms']} ms"
+        f"  p95 {result['p95_ms']} ms  locked {locked}"
+    )
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--transactions", type=int, default=200, help="per worker")
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    parser.add_argument("--dir", help="directory for the database files (default: a temporary one)")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    directory = args.dir
+    if not directory:
+        tmpdir = tempfile.TemporaryDirectory()
+        directory = tmpdir.name
+
+    results = {
+        profile: run_profile(profile, args.workers, args.transactions, directory) for profile in args.profiles
+    }
+    if {"default", "production"} <= set(results) and results["default"]["commits_per_s"]:
+        gain = results["production"]["commits_per_s"] / results["default"]["commits_per_s"]
+        print(f"production vs default: {gain:.1f}x commits/s")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "workers": args.workers,
+            "transactions": args.transactions,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+    if tmpdir:
+        tmpdir.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Route-level micro-benchmarks against a synthetic dataset.
+
+Usage::
+
+    python -m benchmarks.routes --scale 10 --output bench-results.json
+    python -m benchmarks.routes --db /tmp/bench.db --reuse --compare old.json
+
+Each case is timed ``--repeat`` times after a warm-up call; the JSON output
+records latency percentiles and SQL statement counts so runs from different
+commits can be diffed with ``--compare``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+def _git_revision():
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def _summarize(samples, queries):
+    samples = sorted(samples)
+    p95_index = max(0, int(round(len(samples) * 0.95)) - 1)
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0] * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[p95_index] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "sql_queries": queries,
+    }
+
+
+class Bench:
+    def __init__(self, app, repeat):
+        self.app = app
+        self.repeat = repeat
+        self.results = {}
+
+    def http(self, name, client, path, method="GET", **kwargs):
+        def call():
+            resp = client.open(path, method=method, **kwargs)
+            if resp.status_code >= 400:
+                raise RuntimeError(f"{name}: {method} {path} -> {resp.status_code}")
+            return int(resp.headers.get("X-SQL-Queries", 0))
+
+        self._run(name, call)
+
+    def func(self, name, fn):
+        from app.utils.sql_profiler import RequestQueryStats
+
+        def call():
+            # Function cases run inside a request context so the profiler
+            # counts their statements the same way as HTTP cases.
+            from flask import g
+
+            with self.app.test_request_context():
+                g._sql_stats = RequestQueryStats(detailed=False)
+                fn()
+                return g._sql_stats.count
+
+        self._run(name, call)
+
+    def custom(self, name, call):
+        """Time ``call``, which returns the SQL statement count it caused."""
+        self._run(name, call)
+
+    def _run(self, name, call):
+        queries = call()  # warm-up
+        samples = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            queries = call()
+            samples.append(time.perf_counter() - start)
+        self.results[name] = _summarize(samples, queries)
+        r = self.results[name]
+        print(f"{name:<40} median {r['median_ms']:>9.3f} ms  p95 {r['p95_ms']:>9.3f} ms  sql {queries}")
+
+
+def dataset_spec(scale, seed):
+    """Scale the generator's cardinalities; messages dominate, as in production."""
+    from app.utils.datagen import DataSpec
+
+    def n(base):
+        return max(2, int(base * scale))
+
+    return DataSpec(
+        users=n(50),
+        products=n(1000),
+        trades=n(500),
+        messages=n(5000),
+        attachments=n(100),
+        escrow_transactions=n(500),
+        seed=seed,
+    )
+
+
+def run_cases(app, bench, password):
+    from app.extensions import db
+    from app.models import Trade, User, EscrowTransaction
+    from app.routes import build_conversations
+
+    with app.app_context():
+        # The generator's skew makes the lowest user id the busiest account.
+        hot_user = User.query.order_by(User.id).first()
+        hot_user_id, hot_email = hot_user.id, hot_user.email
+        partner_id = (
+            db.session.query(Trade.seller_id).filter(Trade.buyer_id == hot_user_id).limit(1).scalar()
+        )
+        trade = Trade.query.filter_by(buyer_id=hot_user_id).first()
+        trade_id = trade.id
+        tx_id = db.session.query(EscrowTransaction.id).filter_by(trade_id=trade_id).limit(1).scalar()
+
+    anon = app.test_client()
+    bench.http("marketplace.page1", anon, "/marketplace")
+    bench.http("marketplace.page50", anon, "/marketplace?page=50")
+    bench.http("marketplace.search", anon, "/marketplace?search=plywood")
+    bench.http("marketplace.category", anon, "/marketplace?category=textile")
+    bench.http("marketplace.country_verified", anon, "/marketplace?country=India&verified=true")
+
+    client = app.test_client()
+    client.post("/login", data={"email": hot_email, "password": password})
+
+    bench.func("build_conversations.hot_user", lambda: build_conversations(hot_user_id))
+    bench.http("api_thread", client, f"/api/messages/thread/{partner_id}")
+    bench.http("api_thread.since", client, f"/api/messages/thread/{partner_id}?since_id=1&limit=50")
+    bench.http("api_escrow_suggestions", client, "/api/messages/escrow-suggestions")
+    bench.http("dashboard", client, "/dashboard")
+    bench.http("trades", client, "/trades")
+    bench.http("messages", client, f"/messages?user_id={partner_id}")
+
+    def escrow_cycle():
+        with app.app_context():
+            t = db.session.get(Trade, trade_id)
+            t.status, t.escrow_amount = "pending", 0
+            db.session.commit()
+        queries = 0
+        for action in ("deposit", "refund"):
+            payload = {"action": action, "amount": 1.0}
+            resp = client.post(f"/api/trade/{trade_id}/escrow", json=payload)
+            if resp.status_code != 200:
+                raise RuntimeError(f"escrow {action} -> {resp.status_code} {resp.get_data(as_text=True)}")
+            queries += int(resp.headers.get("X-SQL-Queries", 0))
+        return queries
+
+    bench.custom("escrow.deposit_refund_cycle", escrow_cycle)
+
+    def pdf():
+        from app.utils.pdf_report import create_trade_pdf
+
+        t = db.session.get(Trade, trade_id)
+        tx = db.session.get(EscrowTransaction, tx_id) if tx_id else None
+        create_trade_pdf(t, tx)
+
+    try:
+        import reportlab  # noqa: F401
+
+        bench.func("create_trade_pdf", pdf)
+    except ImportError:
+        print("create_trade_pdf skipped: reportlab not installed")
+
+
+def compare(current, previous_path):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nvs {previous_path} ({previous['meta'].get('git_revision')}):")
+    for name, result in current["results"].items():
+        old = previous["results"].get(name)
+        if not old:
+            continue
+        delta = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0
+        print(
+            f"{name:<40} {old['median_ms']:>9.3f} -> {result['median_ms']:>9.3f} ms ({delta:+.1f}%)"
+            f"  sql {old['sql_queries']} -> {result['sql_queries']}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="dataset size multiplier")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="reuse an existing --db without reseeding")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    db_path = args.db
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    # Cases time the view and its SQL; with the page and suggestion caches
+    # on, every run after the warm-up would be a cache hit.
+    os.environ["PAGE_CACHE_TTL"] = "0"
+    os.environ["ESCROW_SUGGESTIONS_TTL"] = "0"
+
+    from app import create_app
+    from app.extensions import db
+    from app.utils.datagen import generate
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SQL_PROFILING=True)
+    app.logger.disabled = True
+
+    spec = dataset_spec(args.scale, args.seed)
+    counts = None
+    if not args.reuse:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            start = time.perf_counter()
+            counts = {table: n for table, (_first, n) in generate(db.engine, spec).items()}
+            print(f"seeded {counts} in {time.perf_counter() - start:.1f}s")
+
+    bench = Bench(app, args.repeat)
+    run_cases(app, bench, spec.password)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "counts": counts,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "page_cache": False,
+            "escrow_suggestions_cache": False,
+        },
+        "results": bench.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    if tmpdir:
+        tmpdir.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    main()
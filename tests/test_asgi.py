@@ -0,0 +1,281 @@
+import asyncio
+import base64
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.asgi import create_asgi_app
+from app.extensions import db
+from app.models import Message, User
+
+
+class ASGIClient:
+    """Drives the ASGI app in-process the way a server would."""
+
+    def __init__(self, application, cookie):
+        self.application = application
+        self.cookie = cookie
+
+    def open(self, path, query="", method="GET", body=b"", headers=(), chunks=None):
+        """Start a request; returns ``(task, sent messages, disconnect())``.
+
+        ``chunks`` sends the body in several ``http.request`` messages.
+        """
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [(b"host", b"localhost"), (b"cookie", self.cookie.encode()), *headers],
+            "server": ("localhost", 80),
+            "client": ("127.0.0.1", 5000),
+        }
+        sent = []
+        gone = asyncio.Event()
+        chunks = [body] if chunks is None else chunks
+        pending = [
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+            for i, chunk in enumerate(chunks)
+        ]
+
+        async def receive():
+            if pending:
+                return pending.pop(0)
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        task = asyncio.ensure_future(self.application(scope, receive, send))
+        task.pending = pending
+        return task, sent, gone.set
+
+    async def get(self, path, query=""):
+        task, sent, _ = self.open(path, query)
+        await task
+        status = sent[0]["status"]
+        body = b"".join(m.get("body", b"") for m in sent[1:])
+        return status, body
+
+
+class ASGIServingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "asgi-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "asgi-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True, ASGI_THREADS=4, PUSH_POLL_INTERVAL=0.05)
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            alice = User(email="alice@example.com")
+            alice.set_password("password123")
+            bob = User(email="bob@example.com")
+            bob.set_password("password123")
+            db.session.add_all([alice, bob])
+            db.session.commit()
+            cls.alice_id, cls.bob_id = alice.id, bob.id
+
+        browser = cls.app.test_client()
+        token = re.search(r'name="csrf-token" content="([^"]+)"', browser.get("/login").get_data(as_text=True)).group(1)
+        browser.post("/login", data={"email": "alice@example.com", "password": "password123", "csrf_token": token})
+        cls.cookie = f"session={browser.get_cookie('session').value}"
+        cls.application = create_asgi_app(cls.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.application.executor.shutdown()
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _send_message(self, sender_id, receiver_id, content):
+        with self.app.app_context():
+            msg = Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
+            db.session.add(msg)
+            db.session.commit()
+            return msg.id
+
+    def _later(self, delay, fn, *args):
+        timer = threading.Timer(delay, fn, args)
+        timer.start()
+        return timer
+
+    def test_html_and_json_routes_pass_through(self):
+        async def scenario():
+            client = ASGIClient(self.application, self.cookie)
+            status, body = await client.get("/dashboard")
+            self.assertEqual(status, 200)
+            self.assertIn(b"<html", body.lower())
+            status, body = await client.get(f"/api/messages/thread/{self.bob_id}")
+            self.assertEqual(status, 200)
+            self.assertIn("messages", json.loads(body))
+
+        asyncio.run(scenario())
+
+    def test_long_poll_wakes_on_new_message(self):
+        last_id = self._send_message(self.bob_id, self.alice_id, "first")
+
+        async def scenario():
+            client = ASGIClient(self.application, self.cookie)
+            started = time.perf_counter()
+            timer = self._later(0.2, self._send_message, self.bob_id, self.alice_id, "second")
+            status, body = await client.get(f"/api/messages/thread/{self.bob_id}", f"since_id={last_id}&wait=5")
+            timer.join()
+            self.assertEqual(status, 200)
+            self.assertEqual([m["content"] for m in json.loads(body)["messages"]], ["second"])
+            self.assertLess(time.perf_counter() - started, 3)
+
+            # Nothing new: answers with an empty list once the wait is up.
+            newest = json.loads(body)["messages"][-1]["id"]
+            status, body = await client.get(f"/api/messages/thread/{self.bob_id}", f"since_id={newest}&wait=0.2")
+            self.assertEqual(json.loads(body)["messages"], [])
+
+        asyncio.run(scenario())
+
+    def test_signed_long_poll_is_verified_before_parking(self):
+        from nacl.signing import SigningKey
+
+        from app.auth.signed_requests import KEY_HEADER, key_id_for, sign_request
+        from app.models import ApiClient
+
+        signing_key = SigningKey.generate()
+        public_key = bytes(signing_key.verify_key)
+        key_id = key_id_for(public_key)
+        with self.app.app_context():
+            db.session.add(
+                ApiClient(user_id=self.alice_id, name="poller", key_id=key_id, public_key=base64.b64encode(public_key).decode())
+            )
+            db.session.commit()
+        last_id = self._send_message(self.bob_id, self.alice_id, "before")
+        path = f"/api/messages/thread/{self.bob_id}"
+
+        async def scenario():
+            client = ASGIClient(self.application, "")
+            hub = self.application.hub
+            # A bare key id is answered without being parked on its owner's queue.
+            with mock.patch.object(hub, "subscribe", wraps=hub.subscribe) as subscribe:
+                task, sent, _ = client.open(path, f"since_id={last_id}&wait=5", headers=[(KEY_HEADER.encode(), key_id.encode())])
+                await task
+            self.assertEqual(sent[0]["status"], 401)
+            subscribe.assert_not_called()
+
+            # A properly signed request is checked without spending its nonce,
+            # so the view that answers it still accepts the signature.
+            self._send_message(self.bob_id, self.alice_id, "after")
+            query = f"since_id={last_id}&wait=5"
+            headers = sign_request(signing_key, key_id, "GET", f"{path}?{query}")
+            with mock.patch.object(hub, "subscribe", wraps=hub.subscribe) as subscribe:
+                task, sent, _ = client.open(path, query, headers=[(k.encode(), v.encode()) for k, v in headers.items()])
+                await task
+            subscribe.assert_called_once_with(self.alice_id)
+            self.assertEqual(sent[0]["status"], 200, sent[1].get("body"))
+            self.assertEqual([m["content"] for m in json.loads(sent[1]["body"])["messages"]], ["after"])
+
+        asyncio.run(scenario())
+
+    def test_idle_connections_do_not_hold_threads(self):
+        async def scenario():
+            client = ASGIClient(self.application, self.cookie)
+            with self.app.app_context():
+                since = db.session.query(db.func.max(Message.id)).scalar() or 0
+            requests = [
+                client.open(f"/api/messages/thread/{self.bob_id}", f"since_id={since}&wait=10")
+                for _ in range(500)
+            ]
+            for _ in range(200):
+                if self.application.hub.subscriber_count == 500:
+                    break
+                await asyncio.sleep(0.05)
+            # 500 parked long-polls on a 4-thread pool, and HTML still renders.
+            self.assertEqual(self.application.hub.subscriber_count, 500)
+            status, _ = await client.get("/marketplace")
+            self.assertEqual(status, 200)
+
+            self._send_message(self.bob_id, self.alice_id, "wake up")
+            await asyncio.wait_for(asyncio.gather(*(task for task, _, _ in requests)), 5)
+            for _, sent, _ in requests:
+                self.assertEqual(json.loads(sent[1]["body"])["messages"][0]["content"], "wake up")
+            self.assertEqual(self.application.hub.subscriber_count, 0)
+
+        asyncio.run(scenario())
+
+    def test_event_stream(self):
+        async def scenario():
+            client = ASGIClient(self.application, self.cookie)
+            task, sent, disconnect = client.open("/api/events")
+            await asyncio.sleep(0.2)
+            self.assertEqual(sent[0]["status"], 200)
+            self.assertIn((b"content-type", b"text/event-stream"), sent[0]["headers"])
+
+            with self.app.app_context():
+                from app.escrow.simulator import EscrowSimulator
+
+                EscrowSimulator().deposit_to_wallet(db.session.get(User, self.alice_id), 250)
+            self._send_message(self.alice_id, self.bob_id, "hello")
+            for _ in range(100):
+                if len(sent) >= 4:
+                    break
+                await asyncio.sleep(0.05)
+            events = [m["body"].decode().split("\n") for m in sent[2:]]
+            self.assertEqual(sorted(lines[1] for lines in events), ["event: message", "event: wallet"])
+            wallet = next(json.loads(lines[2][6:]) for lines in events if lines[1] == "event: wallet")
+            self.assertEqual((wallet["transaction_type"], wallet["amount"]), ("deposit", 250))
+
+            disconnect()
+            await asyncio.wait_for(task, 2)
+            self.assertEqual(self.application.hub.subscriber_count, 0)
+
+            anonymous = ASGIClient(self.application, "")
+            status, _ = await anonymous.get("/api/events")
+            self.assertEqual(status, 401)
+
+        asyncio.run(scenario())
+
+    def test_request_bodies_are_capped(self):
+        async def scenario():
+            client = ASGIClient(self.application, self.cookie)
+
+            # A declared Content-Length over the limit is refused unread.
+            task, sent, _ = client.open("/login", method="POST", headers=[(b"content-length", b"%d" % (64 << 20))])
+            await task
+            self.assertEqual(sent[0]["status"], 413)
+            self.assertEqual(len(task.pending), 1)
+
+            self.app.config["MAX_CONTENT_LENGTH"] = 1024
+            try:
+                # Without a Content-Length the body is counted as it arrives.
+                task, sent, _ = client.open("/login", method="POST", chunks=[b"x" * 600] * 10)
+                await task
+                self.assertEqual(sent[0]["status"], 413)
+                self.assertEqual(len(task.pending), 8)
+
+                # A view with its own limit may take more than MAX_CONTENT_LENGTH.
+                task, sent, _ = client.open(
+                    "/api/products/import", method="POST", chunks=[b"x" * 600] * 10,
+                    headers=[(b"content-type", b"text/csv")],
+                )
+                await task
+                self.assertNotEqual(sent[0]["status"], 413)
+            finally:
+                self.app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from flask import url_for
+
+from app import create_app
+from app.extensions import db
+from app.utils.assets import build_manifest, load_manifest
+
+
+class AssetAndCompressionTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "assets-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "assets-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True)
+        manifest_path = os.path.join(cls.tempdir.name, "manifest.json")
+        build_manifest(cls.app.static_folder, manifest_path)
+        load_manifest(cls.app, manifest_path)
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_static_urls_are_fingerprinted_and_immutable(self):
+        with self.app.test_request_context():
+            url = url_for("static", filename="css/index.css")
+        self.assertRegex(url, r"^/static/css/index\.[0-9a-f]{12}\.css$")
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+        resp.close()
+
+        page = self.client.get("/").get_data(as_text=True)
+        self.assertIn(url, page)
+
+    def test_html_is_gzipped_when_accepted(self):
+        resp = self.client.get("/marketplace", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertIn(b"marketplace", gzip.decompress(resp.data).lower())
+
+        plain = self.client.get("/marketplace")
+        self.assertNotIn("Content-Encoding", plain.headers)
+
+    def test_small_responses_are_not_compressed(self):
+        resp = self.client.get("/wallet/challenge", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,293 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from app.extensions import db
+from app.models import Product, User
+
+
+class CatalogImportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "catalog-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "catalog-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True)
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            seller = User(email="seller@example.com", first_name="Seller")
+            seller.set_password("password123")
+            db.session.add(seller)
+            db.session.commit()
+            cls.seller_id = seller.id
+
+        page = cls.client.get("/login")
+        cls.token = re.search(
+            r'name="csrf-token" content="([^"]+)"', page.get_data(as_text=True)
+        ).group(1)
+        cls.client.post(
+            "/login",
+            data={"email": "seller@example.com", "password": "password123", "csrf_token": cls.token},
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        with self.app.app_context():
+            Product.query.delete()
+            db.session.commit()
+
+    def test_csv_import_creates_then_updates_by_sku(self):
+        csv_body = (
+            "sku,title,price_per_unit,unit,min_order_quantity,quantity,hs_code\n"
+            "PLY-1,Marine plywood,2500,sheet,10,500,4412.31\n"
+            "PLY-2,Birch plywood,-5,sheet,,,\n"
+            "PLY-3,Pine plywood,900,sheet,1000,10,\n"
+            "PLY-4,Oak plywood,1200,sheet,,,44AB\n"
+        )
+        resp = self.client.post(
+            "/api/products/import",
+            data={"file": (io.BytesIO(csv_body.encode()), "catalogue.csv")},
+            content_type="multipart/form-data",
+            headers={"X-CSRFToken": self.token},
+        )
+        self.assertEqual(resp.status_code, 207)
+        report = resp.get_json()
+        self.assertEqual((report["rows"], report["created"], report["error_count"]), (4, 1, 3))
+        self.assertEqual([e["line"] for e in report["errors"]], [3, 4, 5])
+        self.assertIn("price_per_unit", report["errors"][0]["error"])
+        self.assertIn("min_order_quantity", report["errors"][1]["error"])
+        self.assertIn("hs_code", report["errors"][2]["error"])
+
+        update = "sku,title,price_per_unit,unit\nPLY-1,Marine plywood BWP,2600,sheet\n"
+        resp = self.client.post(
+            "/api/products/import",
+            data={"file": (io.BytesIO(update.encode()), "catalogue.csv")},
+            content_type="multipart/form-data",
+            headers={"X-CSRFToken": self.token},
+        )
+        self.assertEqual(resp.get_json()["updated"], 1)
+        with self.app.app_context():
+            products = Product.query.filter_by(seller_id=self.seller_id).all()
+            self.assertEqual(len(products), 1)
+            self.assertEqual(products[0].price_per_unit, 2600)
+            self.assertEqual(products[0].hs_code, "4412.31")
+
+    def test_streamed_jsonl_body_is_not_bound_by_max_content_length(self):
+        lines = [
+            json.dumps({"sku": f"SKU-{i}", "title": f"Item {i}", "price_per_unit": 10 + i, "unit": "kg"})
+            for i in range(2500)
+        ]
+        body = ("\n".join(lines) + "\n").encode()
+        self.app.config["MAX_CONTENT_LENGTH"] = 1024
+        try:
+            resp = self.client.post(
+                "/api/products/import",
+                data=body,
+                content_type="application/x-ndjson",
+                headers={"X-CSRFToken": self.token},
+            )
+        finally:
+            self.app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+        self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+        self.assertEqual(resp.get_json()["created"], 2500)
+        with self.app.app_context():
+            self.assertEqual(Product.query.filter_by(seller_id=self.seller_id).count(), 2500)
+
+    def test_database_errors_are_reported_per_row(self):
+        from app.catalog import importer
+        from app.catalog.importer import import_products
+
+        def rows(*skus):
+            return [(i + 2, {"sku": sku, "title": sku, "price_per_unit": 1, "unit": "kg"}) for i, sku in enumerate(skus)]
+
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "CREATE TRIGGER reject_sku BEFORE INSERT ON product WHEN NEW.sku = 'BAD' "
+                    "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+                )
+            try:
+                # A constraint failure costs only the offending row.
+                result = import_products(self.seller_id, rows("A-1", "BAD", "A-2"), batch_size=10)
+                self.assertEqual((result.created, result.error_count, result.aborted), (2, 1, False))
+                self.assertEqual((result.errors[0].line, result.errors[0].sku), (3, "BAD"))
+
+                # Any other database error stops the import after the last good batch.
+                write_batch = importer._write_batch
+
+                def locked_on_boom(seller_id, batch, result):
+                    if "BOOM" in batch:
+                        raise OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+                    write_batch(seller_id, batch, result)
+
+                with mock.patch.object(importer, "_write_batch", locked_on_boom):
+                    result = import_products(self.seller_id, rows("B-1", "B-2", "BOOM", "B-3", "B-4"), batch_size=2)
+                self.assertTrue(result.aborted)
+                self.assertEqual(result.created, 2)
+                self.assertEqual([(e.line, e.sku) for e in result.errors], [(4, "BOOM"), (5, "B-3")])
+                skus = {p.sku for p in Product.query.filter_by(seller_id=self.seller_id)}
+                self.assertEqual(skus, {"A-1", "A-2", "B-1", "B-2"})
+            finally:
+                with db.engine.begin() as conn:
+                    conn.exec_driver_sql("DROP TRIGGER reject_sku")
+
+    def test_unreadable_csv_stops_the_import(self):
+        from app.catalog.importer import import_products, iter_rows
+
+        resp = self.client.post(
+            "/api/products/import?format=csv",
+            data="sku,title,price_per_unit,unit\nA-1,Caf\xe9,1,kg\n".encode("latin-1"),
+            content_type="text/csv",
+            headers={"X-CSRFToken": self.token},
+        )
+        self.assertEqual(resp.status_code, 400)
+        report = resp.get_json()
+        self.assertTrue(report["aborted"])
+        self.assertIn("UTF-8", report["errors"][0]["error"])
+
+        # Rows read before the bad bytes are reported; the pending batch is dropped.
+        good = "".join(f"G-{i},Good item {i},1,kg\n" for i in range(400))
+        body = ("sku,title,price_per_unit,unit\n" + good).encode() + "B-1,Caf\xe9,1,kg\n".encode("latin-1")
+        with self.app.app_context():
+            result = import_products(self.seller_id, iter_rows(io.BytesIO(body), "csv"), batch_size=150)
+            self.assertTrue(result.aborted)
+            self.assertEqual(result.error_count, 1)
+            self.assertGreater(result.rows, 0)
+            self.assertEqual(result.created, 300)
+            self.assertEqual(Product.query.filter_by(seller_id=self.seller_id).count(), 300)
+
+    def test_jsonl_values_must_be_scalars_of_the_right_type(self):
+        lines = [
+            {"sku": "J-1", "title": ["t"], "price_per_unit": 1, "unit": "kg"},
+            {"sku": "J-2", "title": "Ok", "price_per_unit": True, "unit": "kg"},
+            {"sku": "J-3", "title": "Ok", "price_per_unit": 2, "unit": "kg", "category": {"a": 1}},
+            {"sku": "J-4", "title": "Ok", "price_per_unit": 2, "unit": "kg", "hs_code": 441231},
+        ]
+        resp = self.client.post(
+            "/api/products/import",
+            data="".join(json.dumps(line) + "\n" for line in lines),
+            content_type="application/x-ndjson",
+            headers={"X-CSRFToken": self.token},
+        )
+        self.assertEqual(resp.status_code, 207)
+        report = resp.get_json()
+        self.assertEqual((report["created"], report["error_count"]), (1, 3))
+        self.assertIn("title must be text", report["errors"][0]["error"])
+        self.assertIn("price_per_unit must be a number", report["errors"][1]["error"])
+        self.assertIn("category must be text", report["errors"][2]["error"])
+
+    def _seed(self):
+        body = (
+            "sku,title,price_per_unit,unit,category\n"
+            "A-1,Plywood A,100,sheet,plywood\n"
+            "A-2,Plywood B,250,sheet,plywood\n"
+            "G-1,Glue,40,kg,adhesive\n"
+        )
+        resp = self.client.post(
+            "/api/products/import?format=csv",
+            data=body,
+            content_type="text/csv",
+            headers={"X-CSRFToken": self.token},
+        )
+        self.assertEqual(resp.get_json()["created"], 3)
+
+    def _bulk(self, payload):
+        return self.client.post(
+            "/api/products/bulk-update", json=payload, headers={"X-CSRFToken": self.token}
+        )
+
+    def test_export_streams_filtered_listings(self):
+        self._seed()
+        resp = self.client.get("/api/products/export?category=plywood")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        today = datetime.now(timezone.utc).strftime("%Y%m%d")
+        self.assertIn(f"products-{today}.csv", resp.headers["Content-Disposition"])
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertTrue(lines[0].startswith("id,sku,title"))
+        self.assertEqual([line.split(",")[1] for line in lines[1:]], ["A-1", "A-2"])
+
+        resp = self.client.get("/api/products/export?format=jsonl")
+        records = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual({r["sku"] for r in records}, {"A-1", "A-2", "G-1"})
+        self.assertEqual(self.client.get("/api/products/export?colour=red").status_code, 400)
+
+    def test_bulk_update_is_set_based_and_invalidates_facets(self):
+        self._seed()
+        listing_cache = self.app.extensions["listing_cache"]
+        self.client.get("/marketplace")
+        self.assertEqual(len(listing_cache), 1)
+        with self.app.app_context():
+            before = {p.sku: p.updated_at for p in Product.query.all()}
+
+        resp = self._bulk({"filter": {"category": "plywood"}, "price_percent": -10})
+        self.assertEqual(resp.get_json()["updated"], 2)
+        resp = self._bulk({"filter": {"skus": ["A-1", "G-1"]}, "price_delta": -50})
+        # G-1 would drop below zero and is skipped.
+        self.assertEqual(resp.get_json()["updated"], 1)
+        self.assertEqual(self._bulk({"filter": {}, "price_percent": -100}).status_code, 400)
+        self.assertEqual(self._bulk({"filter": {"colour": "red"}, "is_active": False}).status_code, 400)
+
+        self.assertEqual(self._bulk({"filter": {"category": "plywood"}, "is_active": False}).get_json()["updated"], 2)
+        with self.app.app_context():
+            prices = {p.sku: (p.price_per_unit, p.is_active) for p in Product.query.all()}
+            after = {p.sku: p.updated_at for p in Product.query.all()}
+        self.assertEqual(prices, {"A-1": (40.0, False), "A-2": (225.0, False), "G-1": (40.0, True)})
+        self.assertGreater(after["A-1"], before["A-1"])
+        self.assertEqual(after["G-1"], before["G-1"])
+        self.assertEqual(len(listing_cache), 0)
+
+
+    def test_bulk_update_skips_prices_that_round_to_zero(self):
+        body = "sku,title,price_per_unit,unit\nC-1,Chip,0.01,piece\nC-2,Bolt,10,piece\n"
+        self.client.post(
+            "/api/products/import?format=csv",
+            data=body,
+            content_type="text/csv",
+            headers={"X-CSRFToken": self.token},
+        )
+        # 0.01 at -60% is 0.004, which rounds to 0.00.
+        self.assertEqual(self._bulk({"filter": {}, "price_percent": -60}).get_json()["updated"], 1)
+        # 0.01 - 0.006 is still positive before rounding.
+        self.assertEqual(self._bulk({"filter": {}, "price_delta": -0.006}).get_json()["updated"], 1)
+        with self.app.app_context():
+            prices = {p.sku: p.price_per_unit for p in Product.query.all()}
+        self.assertEqual(prices, {"C-1": 0.01, "C-2": 3.99})
+
+    def test_bulk_update_reserves_one_change_seq_per_row(self):
+        from app.utils import change_seq
+
+        self._seed()
+        with self.app.app_context():
+            before = change_seq.current(db.session.connection())
+            db.session.rollback()
+        self.assertEqual(self._bulk({"filter": {"skus": ["A-1", "G-1"]}, "is_active": False}).get_json()["updated"], 2)
+        with self.app.app_context():
+            self.assertEqual(change_seq.current(db.session.connection()), before + 2)
+            rows = Product.query.filter(Product.sku.in_(["A-1", "G-1"])).order_by(Product.id).all()
+            self.assertEqual([p.change_seq for p in rows], [before + 1, before + 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from app import create_app
+from app.extensions import db
+from app.models import Trade, User
+from app.trades.listing import list_trades
+from app.trades.stats import recent_trades, trade_stats
+
+
+class DashboardStatsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "dashboard-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "dashboard-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            alice = User(email="alice@example.com", company_name="Alice Exports")
+            bob = User(email="bob@example.com", company_name="Bob Imports")
+            alice.set_password("password123")
+            bob.set_password("password123")
+            db.session.add_all([alice, bob])
+            db.session.flush()
+
+            start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+            statuses = ["pending", "completed", "in_progress", "completed", "cancelled",
+                        "escrow_deposited", "completed", "disputed"]
+            for i, status in enumerate(statuses):
+                # Alternate sides so both halves of the query are exercised.
+                buyer, seller = (alice, bob) if i % 2 == 0 else (bob, alice)
+                db.session.add(Trade(
+                    buyer_id=buyer.id, seller_id=seller.id, quantity=1, price_per_unit=100.0 * (i + 1),
+                    total_amount=100.0 * (i + 1), status=status, created_at=start + timedelta(days=i),
+                ))
+            db.session.commit()
+            cls.alice_id = alice.id
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_stats_count_every_trade(self):
+        with self.app.app_context():
+            stats = trade_stats(self.alice_id)
+            self.assertEqual(stats.total_deals, 8)
+            self.assertEqual(stats.active_trades, 3)
+            self.assertEqual(stats.completed_trades, 3)
+            # Everything except the cancelled 500.00 trade.
+            self.assertEqual(stats.gmv, {"INR": 3600.0 - 500.0})
+
+            recent = recent_trades(self.alice_id)
+            self.assertEqual([t.status for t in recent],
+                             ["disputed", "completed", "escrow_deposited", "cancelled", "completed"])
+
+    def test_dashboard_renders_exact_totals(self):
+        client = self.app.test_client()
+        client.post("/login", data={"email": "alice@example.com", "password": "password123"})
+        html = client.get("/dashboard").get_data(as_text=True)
+        self.assertIn("<h4>Total Deals</h4>\n                <p>8</p>", html)
+        self.assertIn("&#8377;3100.00", html)
+        self.assertEqual(html.count("#CP"), 5)
+
+    def test_volume_is_reported_per_currency(self):
+        with self.app.app_context():
+            fay = User(email="fay@example.com", company_name="Fay Metals")
+            gus = User(email="gus@example.com", company_name="Gus Steel")
+            for u in (fay, gus):
+                u.set_password("password123")
+            db.session.add_all([fay, gus])
+            db.session.flush()
+            for amount, currency, status in [(250.0, "USD", "completed"), (1000.0, "INR", "completed"),
+                                             (75.5, "USD", "pending"), (900.0, "USD", "cancelled")]:
+                db.session.add(Trade(buyer_id=fay.id, seller_id=gus.id, quantity=1, price_per_unit=amount,
+                                     total_amount=amount, currency=currency, status=status))
+            db.session.commit()
+            self.assertEqual(trade_stats(fay.id).gmv, {"INR": 1000.0, "USD": 325.5})
+            self.assertEqual(trade_stats(gus.id).gmv, {"INR": 1000.0, "USD": 325.5})
+
+        client = self.app.test_client()
+        client.post("/login", data={"email": "fay@example.com", "password": "password123"})
+        html = client.get("/dashboard").get_data(as_text=True)
+        self.assertIn("&#8377;1000.00", html)
+        self.assertIn("USD 325.50", html)
+        self.assertNotIn("1325.50", html)
+
+    def test_trade_list_walks_pages_newest_first(self):
+        with self.app.app_context():
+            seen, cursor = [], None
+            while True:
+                page = list_trades(self.alice_id, cursor=cursor, page_size=3)
+                seen.extend(t.id for t in page.trades)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            self.assertEqual(len(seen), 8)
+            self.assertEqual(seen, sorted(seen, reverse=True))
+
+            sold = list_trades(self.alice_id, role="seller")
+            self.assertTrue(all(t.seller_id == self.alice_id for t in sold.trades))
+            self.assertEqual(len(sold.trades), 4)
+            completed = list_trades(self.alice_id, status="completed")
+            self.assertEqual(len(completed.trades), 3)
+            self.assertIsNone(completed.next_cursor)
+            with self.assertRaises(ValueError):
+                list_trades(self.alice_id, cursor="not-a-cursor")
+
+    def test_trades_page_filters_by_counterparty_and_status(self):
+        client = self.app.test_client()
+        client.post("/login", data={"email": "alice@example.com", "password": "password123"})
+        with self.app.app_context():
+            bob_id = User.query.filter_by(email="bob@example.com").one().id
+        html = client.get(f"/trades?counterparty={bob_id}&status=completed&per_page=2").get_data(as_text=True)
+        self.assertEqual(html.count("View Details"), 2)
+        self.assertIn("Older &raquo;", html)
+        self.assertIn("With Bob Imports", html)
+        self.assertEqual(client.get("/trades?role=broker").status_code, 302)
+
+    def test_escrow_suggestions_cached_until_new_trade(self):
+        with self.app.app_context():
+            carol = User(email="carol@example.com", first_name="Carol", last_name="Ng")
+            dave = User(email="dave@example.com", company_name="Dave Metals")
+            erin = User(email="erin@example.com")
+            for u in (carol, dave, erin):
+                u.set_password("password123")
+            db.session.add_all([carol, dave, erin])
+            db.session.flush()
+            db.session.add(Trade(buyer_id=carol.id, seller_id=dave.id, quantity=1,
+                                 price_per_unit=1, total_amount=1))
+            db.session.commit()
+            carol_id, erin_id = carol.id, erin.id
+
+        client = self.app.test_client()
+        client.post("/login", data={"email": "carol@example.com", "password": "password123"})
+        users = client.get("/api/messages/escrow-suggestions").get_json()["users"]
+        self.assertEqual([u["name"] for u in users], ["Dave Metals"])
+        self.assertIn(carol_id, self.app.extensions["escrow_suggestions"])
+
+        with self.app.app_context():
+            db.session.add(Trade(buyer_id=erin_id, seller_id=carol_id, quantity=1,
+                                 price_per_unit=1, total_amount=1))
+            db.session.commit()
+        self.assertNotIn(carol_id, self.app.extensions["escrow_suggestions"])
+        users = client.get("/api/messages/escrow-suggestions").get_json()["users"]
+        self.assertEqual([u["name"] for u in users], ["Dave Metals", "erin@example.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, func, select
+
+from app import create_app
+from app.extensions import db
+from app.models import EscrowTransaction, Message, Trade
+from app.utils.datagen import DataSpec, generate
+
+
+class DataGeneratorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(cls.tempdir.name, 'datagen.db')}"
+        os.environ["SECRET_KEY"] = "datagen-test-secret"
+        cls.app = create_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _generate(self, name, spec):
+        engine = create_engine(f"sqlite:///{os.path.join(self.tempdir.name, name)}")
+        db.metadata.create_all(engine)
+        report = generate(engine, spec)
+        return engine, report
+
+    def test_same_seed_yields_identical_rows(self):
+        spec = DataSpec(users=20, products=50, trades=40, messages=200, attachments=10, escrow_transactions=30, chunk_size=7)
+        first, report = self._generate("a.db", spec)
+        second, _ = self._generate("b.db", spec)
+        self.assertEqual(report["message"], (1, 200))
+
+        query = select(Message.sender_id, Message.receiver_id, Message.timestamp).order_by(Message.id)
+        with first.connect() as a, second.connect() as b:
+            self.assertEqual(a.execute(query).all(), b.execute(query).all())
+        first.dispose()
+        second.dispose()
+
+    def test_skew_and_escrow_parties(self):
+        spec = DataSpec(users=50, products=10, trades=300, messages=0, attachments=0, escrow_transactions=200, skew=1.5)
+        engine, _ = self._generate("c.db", spec)
+        with engine.connect() as conn:
+            hottest = conn.execute(
+                select(func.count()).select_from(Trade).where((Trade.buyer_id == 1) | (Trade.seller_id == 1))
+            ).scalar()
+            self.assertGreater(hottest, 300 / 50 * 5)
+
+            outsiders = conn.execute(
+                select(func.count())
+                .select_from(EscrowTransaction)
+                .join(Trade, Trade.id == EscrowTransaction.trade_id)
+                .where(
+                    (EscrowTransaction.user_id != Trade.buyer_id)
+                    & (EscrowTransaction.user_id != Trade.seller_id)
+                )
+            ).scalar()
+            self.assertEqual(outsiders, 0)
+        engine.dispose()
+
+    def test_pooled_connection_keeps_its_durability_setting(self):
+        engine = create_engine(f"sqlite:///{os.path.join(self.tempdir.name, 'd.db')}", pool_size=1, max_overflow=0)
+        db.metadata.create_all(engine)
+        with engine.connect() as conn:
+            before = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        generate(engine, DataSpec(users=5, products=5, trades=5, messages=5, attachments=0, escrow_transactions=5))
+        # The pool's only connection is the one generate() used.
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA synchronous").scalar(), before)
+        self.assertNotEqual(before, 0)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
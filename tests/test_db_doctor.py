@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from app import create_app
+from app.extensions import db
+from app.models import EscrowTransaction, User
+from app.utils.db_doctor import (
+    HOT_QUERIES,
+    check_queries,
+    database_stats,
+    maintain,
+    maintenance_log,
+    table_sizes,
+)
+
+
+class DbDoctorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "doctor-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "doctor-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        users = [User(email=f"user{i}@example.com", password_hash="x") for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+        db.session.add_all(
+            EscrowTransaction(user_id=users[i % 3].id, transaction_type="deposit", amount=1.0, status="completed")
+            for i in range(30)
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_hot_queries_have_no_unexpected_scans_or_sorts(self):
+        reports = check_queries(db.engine)
+        self.assertEqual(len(reports), len(HOT_QUERIES))
+        flagged = {r.name: r.plan for r in reports if r.flagged}
+        self.assertEqual(flagged, {})
+
+    def test_missing_index_is_flagged_with_a_suggestion(self):
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_escrow_transaction_user_created")
+        query = [q for q in HOT_QUERIES if q.name == "escrow.history"]
+        (report,) = check_queries(db.engine, query)
+        self.assertTrue(report.flagged)
+        self.assertEqual(report.temp_btrees, ["ORDER BY"])
+        self.assertEqual(
+            report.suggestions,
+            ['CREATE INDEX ix_escrow_transaction_user_id_created_at ON "escrow_transaction" (user_id, created_at)'],
+        )
+
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_kyc_document_user_id")
+        (report,) = check_queries(db.engine, [q for q in HOT_QUERIES if q.name == "kyc.documents"])
+        self.assertEqual(report.full_scans, ["kyc_document"])
+        self.assertEqual(report.suggestions, ['CREATE INDEX ix_kyc_document_user_id ON "kyc_document" (user_id)'])
+
+    def test_table_sizes_include_indexes(self):
+        sizes = {name: (kind, table, size) for name, kind, table, size, _rows in table_sizes(db.engine)}
+        self.assertEqual(sizes["escrow_transaction"][0], "table")
+        self.assertEqual(sizes["ix_escrow_transaction_user_created"][:2], ("index", "escrow_transaction"))
+        if sizes["escrow_transaction"][2] is not None:  # SQLite built with dbstat
+            self.assertGreater(sizes["escrow_transaction"][2], 0)
+
+    def test_maintenance_runs_each_task_when_due(self):
+        first = maintain()["main"]
+        self.assertIn("analyze", first)
+        runs = dict(db.session.execute(select(maintenance_log.c.task, maintenance_log.c.last_run_at)).all())
+        self.assertIn("analyze", runs)
+        rows = {name: rows for name, _kind, _table, _size, rows in table_sizes(db.engine)}
+        self.assertEqual(rows["escrow_transaction"], 30)
+
+        # Not due again until DB_ANALYZE_INTERVAL has passed.
+        self.assertNotIn("analyze", maintain(now=runs["analyze"] + timedelta(hours=1))["main"])
+        self.assertIn("analyze", maintain(now=runs["analyze"] + timedelta(days=1))["main"])
+
+        self.assertEqual(database_stats(db.engine)["auto_vacuum"], "none")
+        self.assertIn("vacuum", maintain(force=("vacuum",))["main"])
+        self.assertEqual(database_stats(db.engine)["auto_vacuum"], "incremental")
+
+        db.session.add_all(
+            EscrowTransaction(user_id=1, transaction_type="deposit", amount=1.0, status="completed")
+            for _ in range(2000)
+        )
+        db.session.commit()
+        db.session.query(EscrowTransaction).delete()
+        db.session.commit()
+        self.assertGreater(database_stats(db.engine)["freelist_count"], 0)
+        self.app.config["DB_VACUUM_FREE_RATIO"] = 1.1  # never a full VACUUM
+        try:
+            ran = maintain()["main"]
+        finally:
+            self.app.config["DB_VACUUM_FREE_RATIO"] = 0.2
+        self.assertIn("incremental_vacuum", ran)
+        self.assertEqual(database_stats(db.engine)["freelist_count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
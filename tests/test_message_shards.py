@@ -0,0 +1,228 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import func, select
+
+from app import create_app
+from app.extensions import db
+from app.models import Message, MessageAttachment, User
+from app.utils import message_shards
+from app.utils.db_doctor import check_all
+from app.utils.schema import schema_stamp
+from app.utils.storage import create_storage
+from app.utils.storage_migrate import migrate_legacy_uploads
+from app.utils.message_shards import EPOCH_SHIFT, SHARD_SHIFT, reshard, shard_index
+
+
+class MessageShardTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "shards-test.db")
+        cls.shard_dir = os.path.join(cls.tempdir.name, "shards")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "shards-test-secret"
+        os.environ["MESSAGE_SHARD_DIR"] = cls.shard_dir
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True, STORAGE_ROOT=os.path.join(cls.tempdir.name, "files"))
+        os.environ.pop("MESSAGE_SHARD_DIR")
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            cls.app.extensions["message_shards"].dispose()
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        shards = self.app.extensions["message_shards"]
+        shards.dispose()
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        shards.load()
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            users = [User(email=f"user{i}@example.com", first_name=f"User{i}") for i in range(6)]
+            for user in users:
+                user.set_password("password123")
+            db.session.add_all(users)
+            db.session.commit()
+            self.user_ids = [u.id for u in users]
+            me = self.user_ids[0]
+            for other in self.user_ids[1:]:
+                db.session.add(Message(sender_id=other, receiver_id=me, content=f"hello from {other}"))
+                db.session.add(Message(sender_id=me, receiver_id=other, content=f"reply to {other}"))
+            db.session.commit()
+
+        self.client = self.app.test_client()
+        self.token = re.search(
+            r'name="csrf-token" content="([^"]+)"', self.client.get("/login").get_data(as_text=True)
+        ).group(1)
+        self.client.post("/login", data={"email": "user0@example.com", "password": "password123", "csrf_token": self.token})
+
+    def _shard_rows(self):
+        """``{shard index: [(id, sender, receiver)]}`` read straight from the files."""
+        shards = self.app.extensions["message_shards"]
+        rows = {}
+        for index, engine in enumerate(shards.engines):
+            with engine.connect() as conn:
+                rows[index] = conn.execute(
+                    select(Message.id, Message.sender_id, Message.receiver_id).order_by(Message.id)
+                ).all()
+        return rows
+
+    def _thread(self, other, since_id=None):
+        url = f"/api/messages/thread/{other}" + (f"?since_id={since_id}" if since_id else "")
+        return self.client.get(url).get_json()["messages"]
+
+    def test_reshard_moves_each_conversation_into_one_shard(self):
+        with self.app.app_context():
+            before = {m.id: m.content for m in Message.query}
+            self.assertEqual(reshard(self.app, 3), 10)
+            self.assertEqual(Message.query.count(), 0)
+
+        rows = self._shard_rows()
+        self.assertEqual(sum(len(r) for r in rows.values()), 10)
+        for index, shard in rows.items():
+            for _id, sender, receiver in shard:
+                self.assertEqual(shard_index(sender, receiver, 3), index)
+
+        page = self.client.get("/messages").get_data(as_text=True)
+        for other in self.user_ids[1:]:
+            self.assertIn(f"reply to {other}", page)
+        # Ids survive the move, so existing clients' since_id still works.
+        thread = self._thread(self.user_ids[2])
+        self.assertEqual([m["content"] for m in thread], [f"hello from {self.user_ids[2]}", f"reply to {self.user_ids[2]}"])
+        self.assertTrue(set(m["id"] for m in thread) <= set(before))
+
+    def test_send_message_writes_to_the_conversation_shard(self):
+        with self.app.app_context():
+            reshard(self.app, 2)
+        other = self.user_ids[3]
+        old_ids = [m["id"] for m in self._thread(other)]
+
+        resp = self.client.post(
+            "/send-message",
+            data={
+                "csrf_token": self.token,
+                "receiver_id": str(other),
+                "content": "sharded hello",
+                "attachments": [(io.BytesIO(b"%PDF-1.4 test"), "spec.pdf")],
+            },
+        )
+        self.assertEqual(resp.status_code, 302)
+
+        new = self._thread(other, since_id=max(old_ids))
+        self.assertEqual([m["content"] for m in new], ["sharded hello"])
+        message_id = new[0]["id"]
+        expected_shard = shard_index(self.user_ids[0], other, 2)
+        self.assertEqual(message_id >> EPOCH_SHIFT, 1)
+        self.assertEqual((message_id >> SHARD_SHIFT) & 0xFF, expected_shard)
+        self.assertGreater(message_id, max(old_ids))
+        self.assertIn(message_id, [row.id for row in self._shard_rows()[expected_shard]])
+
+        download = self.client.get(new[0]["attachments"][0]["url"])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download.data, b"%PDF-1.4 test")
+        with self.app.app_context():
+            self.assertEqual(Message.query.count(), 0)
+            self.assertEqual(MessageAttachment.query.count(), 0)
+
+    def test_ids_stay_unique_and_increasing_across_reshards(self):
+        other = self.user_ids[1]
+        with self.app.app_context():
+            reshard(self.app, 3)
+            first = message_shards.thread(db.session.get(User, self.user_ids[0]), db.session.get(User, other))
+            reshard(self.app, 2)
+            me = db.session.get(User, self.user_ids[0])
+            with message_shards.session_for(me.id, other) as session:
+                session.add(Message(sender_id=other, receiver_id=me.id, content="after reshard"))
+                session.commit()
+            thread = message_shards.thread(me, db.session.get(User, other))
+            self.assertEqual([m.content for m in thread[:-1]], [m.content for m in first])
+            self.assertEqual(thread[-1].id >> EPOCH_SHIFT, 2)
+            self.assertGreater(thread[-1].id, max(m.id for m in first))
+            self.assertEqual(thread[-1].sender.email, f"user{other - self.user_ids[0]}@example.com")
+
+            all_ids = [row.id for shard in self._shard_rows().values() for row in shard]
+            self.assertEqual(len(all_ids), len(set(all_ids)))
+
+            # And back into the main database, ids intact.
+            self.assertEqual(reshard(self.app, 0), 11)
+            self.assertFalse(message_shards.is_sharded())
+            self.assertEqual(db.session.scalar(select(func.count(Message.id))), 11)
+            self.assertIn(thread[-1].id, [m.id for m in Message.query])
+            self.assertEqual(os.listdir(self.shard_dir), ["layout.json"])
+
+    def test_unread_flags_and_sync_cursor_per_shard(self):
+        with self.app.app_context():
+            reshard(self.app, 3)
+        self.client.get(f"/messages?user_id={self.user_ids[4]}")
+        read = [m for m in self._thread(self.user_ids[4]) if m["sender_id"] == self.user_ids[4]]
+        self.assertTrue(all(m["is_read"] for m in read))
+
+        seen, cursor = [], None
+        while True:
+            query = "/api/sync?limit=3" + (f"&message_cursor={cursor}" if cursor else "")
+            body = self.client.get(query).get_json()
+            seen.extend(m["id"] for m in body["messages"])
+            cursor = body["message_cursor"]
+            if not body["more"]:
+                break
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+        self.assertTrue(cursor.startswith("1:"))
+
+        # A cursor from another layout starts over rather than skipping rows.
+        body = self.client.get("/api/sync?limit=1000&message_cursor=0:5").get_json()
+        self.assertEqual(len(body["messages"]), 10)
+
+    def test_shard_files_get_schema_upgrades_and_maintenance(self):
+        legacy_path = os.path.join(self.tempdir.name, "legacy-quote.pdf")
+        with open(legacy_path, "wb") as f:
+            f.write(b"quote")
+        with self.app.app_context():
+            message = Message.query.first()
+            db.session.add(MessageAttachment(message_id=message.id, filename="quote.pdf", original_filename="quote.pdf",
+                                             file_path=legacy_path, content_type="application/pdf"))
+            db.session.commit()
+            reshard(self.app, 2)
+
+        # A shard file from before the model gained a column and an index.
+        shards = self.app.extensions["message_shards"]
+        with shards.engines[0].begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_message_trade_time")
+            conn.exec_driver_sql("ALTER TABLE message_attachment DROP COLUMN sha256")
+            conn.execute(schema_stamp.update().values(fingerprint="old"))
+        shards.load()
+        with shards.engines[0].connect() as conn:
+            self.assertIn("ix_message_trade_time", {row[1] for row in conn.exec_driver_sql("PRAGMA index_list(message)")})
+            self.assertIn("sha256", {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(message_attachment)")})
+
+        with self.app.app_context():
+            # db-doctor explains the message queries against each shard too.
+            results = dict(check_all(self.app))
+            self.assertEqual(set(results), {"main", "message shard 0", "message shard 1"})
+            shard_reports = results["message shard 0"]
+            self.assertIn("messages.trade", [r.name for r in shard_reports])
+            self.assertTrue(all(r.name.startswith(("messages.", "sync.messages")) for r in shard_reports))
+            self.assertEqual([r.name for r in shard_reports if r.flagged], [])
+
+            # Legacy attachment paths are migrated in whichever shard holds them.
+            report = migrate_legacy_uploads(create_storage(self.app), os.path.join(self.tempdir.name, "no-images"))
+            self.assertEqual((report["moved"], report["missing"]), (1, []))
+            self.assertFalse(os.path.exists(legacy_path))
+            with message_shards.each_session() as sessions:
+                keys = [a.file_path for session in sessions for a in session.scalars(select(MessageAttachment))]
+            self.assertEqual(len(keys), 1)
+            self.assertTrue(keys[0].startswith("messages/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
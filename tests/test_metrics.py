@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from app import create_app
+from app.escrow.simulator import EscrowSimulator
+from app.extensions import db
+from app.models import User
+from app.utils.metrics import MetricsRegistry
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "metrics-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "metrics-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, METRICS_TOKEN="scrape-me")
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(email="wallet@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.commit()
+            cls.user_id = user.id
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_route_and_escrow_metrics_are_exposed(self):
+        self.assertEqual(self.client.get("/marketplace").status_code, 200)
+        with self.app.app_context():
+            user = db.session.get(User, self.user_id)
+            EscrowSimulator().deposit_to_wallet(user, 25)
+
+        body = self.client.get("/metrics", headers=self.auth).get_data(as_text=True)
+        self.assertIn(
+            'chainport_http_requests_total{endpoint="main.marketplace",method="GET",status="200"} 1',
+            body,
+        )
+        self.assertIn(
+            'chainport_http_request_duration_seconds_bucket{endpoint="main.marketplace",method="GET",le="+Inf"} 1',
+            body,
+        )
+        self.assertIn('chainport_http_db_time_seconds_count{endpoint="main.marketplace"} 1', body)
+        self.assertIn('chainport_escrow_operations_total{transaction_type="deposit"} 1', body)
+
+    auth = {"Authorization": "Bearer scrape-me"}
+
+    def test_metrics_token_is_enforced(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers=self.auth).status_code, 200)
+
+    def test_metrics_are_not_served_without_a_token(self):
+        self.app.config["METRICS_TOKEN"] = None
+        try:
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+        finally:
+            self.app.config["METRICS_TOKEN"] = "scrape-me"
+
+
+class MultiprocessRegistryTests(unittest.TestCase):
+    def test_scrape_merges_all_worker_files(self):
+        with tempfile.TemporaryDirectory() as shared:
+            other = MetricsRegistry()
+            other.inc("chainport_http_requests_total", {"endpoint": "main.index"}, 3)
+            other.observe("chainport_http_request_duration_seconds", 0.02, {"endpoint": "main.index"})
+            # A live worker (our parent stands in for it) and one that exited.
+            with open(os.path.join(shared, f"metrics-{os.getppid()}.json"), "w") as f:
+                json.dump(other.snapshot(), f)
+            exited = subprocess.Popen([sys.executable, "-c", "pass"])
+            exited.wait()
+            with open(os.path.join(shared, f"metrics-{exited.pid}.json"), "w") as f:
+                json.dump(other.snapshot(), f)
+
+            registry = MetricsRegistry(shared)
+            registry.inc("chainport_http_requests_total", {"endpoint": "main.index"}, 2)
+            registry.observe("chainport_http_request_duration_seconds", 3.0, {"endpoint": "main.index"})
+
+            # The exited worker's totals are kept, once, across scrapes.
+            for _ in range(2):
+                body = registry.render()
+                self.assertIn('chainport_http_requests_total{endpoint="main.index"} 8', body)
+                self.assertIn(
+                    'chainport_http_request_duration_seconds_bucket{endpoint="main.index",le="0.025"} 2',
+                    body,
+                )
+                self.assertIn('chainport_http_request_duration_seconds_count{endpoint="main.index"} 3', body)
+            self.assertTrue(os.path.exists(os.path.join(shared, f"metrics-{os.getpid()}.json")))
+            self.assertFalse(os.path.exists(os.path.join(shared, f"metrics-{exited.pid}.json")))
+            self.assertTrue(os.path.exists(os.path.join(shared, MetricsRegistry.ARCHIVE_FILE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import io
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from app import create_app
+from app.extensions import db
+from app.models import Product, User
+from app.utils.page_cache import CSRF_PLACEHOLDER, CachedPage, DiskBackend
+
+
+class PageCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "page-cache-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "page-cache-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True, STORAGE_ROOT=os.path.join(cls.tempdir.name, "files"))
+        cls.cache = cls.app.extensions["page_cache"]
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        self.cache.clear()
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            seller = User(email="seller@example.com", first_name="Seller")
+            seller.set_password("password123")
+            db.session.add(seller)
+            db.session.commit()
+            product = Product(seller_id=seller.id, title="Marine plywood", price_per_unit=10, unit="sheet")
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+
+    def _add_product_quietly(self, title):
+        # A write that does not send catalog_changed, like one made elsewhere.
+        with self.app.app_context():
+            db.session.add(Product(seller_id=1, title=title, price_per_unit=5, unit="kg"))
+            db.session.commit()
+
+    def _login(self, client):
+        token = re.search(r'name="csrf-token" content="([^"]+)"', client.get("/login").get_data(as_text=True)).group(1)
+        client.post("/login", data={"email": "seller@example.com", "password": "password123", "csrf_token": token})
+        return token
+
+    def test_anonymous_pages_are_cached_per_normalized_query(self):
+        client = self.app.test_client()
+        first = client.get("/marketplace?search=plywood&category=&utm_source=mail")
+        self.assertEqual(first.headers["X-Page-Cache"], "MISS")
+        self._add_product_quietly("Steel plywood")
+
+        again = client.get("/marketplace?utm_campaign=x&search=plywood")
+        self.assertEqual(again.headers["X-Page-Cache"], "FRESH")
+        self.assertNotIn("Steel plywood", again.get_data(as_text=True))
+        self.assertEqual(client.get("/marketplace?search=steel").headers["X-Page-Cache"], "MISS")
+
+        # Parameters a view does not read never make a new entry.
+        entries = len(self.cache.backend)
+        for i in range(5):
+            self.assertEqual(client.get(f"/marketplace?search=plywood&x{i}=1").headers["X-Page-Cache"], "FRESH")
+        self.assertEqual(client.get("/?page=7").headers["X-Page-Cache"], "MISS")
+        self.assertEqual(client.get("/?page=8").headers["X-Page-Cache"], "FRESH")
+        self.assertEqual(len(self.cache.backend), entries + 1)
+
+        # Logged-in visitors are never served from the cache.
+        member = self.app.test_client()
+        self._login(member)
+        page = member.get("/marketplace?search=plywood")
+        self.assertNotIn("X-Page-Cache", page.headers)
+        self.assertIn("Steel plywood", page.get_data(as_text=True))
+        self.assertNotIn("X-Page-Cache", member.get("/dashboard").headers)
+
+    def test_each_visitor_gets_their_own_csrf_token(self):
+        tokens = []
+        for _ in range(2):
+            client = self.app.test_client()
+            page = client.get("/").get_data(as_text=True)
+            token = re.search(r'name="csrf-token" content="([^"]+)"', page).group(1)
+            tokens.append(token)
+            # The token is valid for this visitor's session.
+            resp = client.post("/login", data={"email": "seller@example.com", "password": "password123", "csrf_token": token})
+            self.assertEqual(resp.status_code, 302)
+        self.assertNotEqual(tokens[0], tokens[1])
+        self.assertIn(CSRF_PLACEHOLDER, self.cache.backend.get("/").body)
+
+    def test_stale_page_is_served_while_it_re_renders(self):
+        client = self.app.test_client()
+        client.get("/marketplace")
+        self._add_product_quietly("Steel coil")
+        self.cache.ttl = 0
+        try:
+            stale = client.get("/marketplace")
+            self.assertEqual(stale.headers["X-Page-Cache"], "STALE")
+            self.assertNotIn("Steel coil", stale.get_data(as_text=True))
+            for thread in list(self.cache.revalidating.values()):
+                thread.join(5)
+        finally:
+            self.cache.ttl = self.app.config["PAGE_CACHE_TTL"]
+        fresh = client.get("/marketplace")
+        self.assertEqual(fresh.headers["X-Page-Cache"], "FRESH")
+        self.assertIn("Steel coil", fresh.get_data(as_text=True))
+
+    def test_revalidation_threads_are_capped(self):
+        client = self.app.test_client()
+        client.get("/marketplace")
+        client.get("/marketplace?page=2")
+        self.cache.ttl = 0
+        busy = self.cache.revalidating["/elsewhere"] = object()
+        self.cache.max_revalidations = 2
+        try:
+            self.assertEqual(client.get("/marketplace").headers["X-Page-Cache"], "STALE")
+            self.assertEqual(client.get("/marketplace?page=2").headers["X-Page-Cache"], "STALE")
+            self.assertEqual(len(self.cache.revalidating), 2)
+            for thread in list(self.cache.revalidating.values()):
+                if thread is not busy:
+                    thread.join(5)
+        finally:
+            self.cache.revalidating.pop("/elsewhere", None)
+            self.cache.ttl = self.app.config["PAGE_CACHE_TTL"]
+            self.cache.max_revalidations = self.app.config["PAGE_CACHE_MAX_REVALIDATIONS"]
+        self.assertEqual(len(self.cache.revalidating), 0)
+
+    def test_product_image_upload_invalidates_pages(self):
+        client = self.app.test_client()
+        client.get("/marketplace")
+        self.assertEqual(len(self.cache.backend), 1)
+        token = self._login(client)
+        resp = client.post(
+            f"/product/{self.product_id}/upload-image",
+            data={"csrf_token": token, "image": (io.BytesIO(b"<svg xmlns='http://www.w3.org/2000/svg'/>"), "p.svg")},
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(len(self.cache.backend), 0)
+
+    def test_disk_backend_is_bounded_and_shared(self):
+        directory = os.path.join(self.tempdir.name, "pages")
+        a = DiskBackend(directory, max_entries=2, lifetime=60)
+        b = DiskBackend(directory, max_entries=2, lifetime=60)
+        for i, key in enumerate(["/a", "/b", "/c"]):
+            a.set(key, CachedPage(200, "text/html", f"page {key}".encode(), time.time(), a.generation()))
+            os.utime(a._path(key), (time.time() + i, time.time() + i))
+        self.assertEqual(len(b), 2)
+        self.assertIsNone(b.get("/a"))
+        self.assertEqual(b.get("/c").body, b"page /c")
+
+        # A page rendered before an invalidation is not kept after it.
+        generation = b.generation()
+        a.clear()
+        b.set("/c", CachedPage(200, "text/html", b"old", time.time(), generation))
+        self.assertIsNone(a.get("/c"))
+        self.assertEqual(len(a), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import re
+import tempfile
+import unittest
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.auth import passwords
+from app.extensions import db
+from app.models import User
+
+
+class PasswordPolicyTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "passwords-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "passwords-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True)
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _login(self, email, password):
+        client = self.app.test_client()
+        token = re.search(r'name="csrf-token" content="([^"]+)"', client.get("/login").get_data(as_text=True)).group(1)
+        return client.post("/login", data={"email": email, "password": password, "csrf_token": token})
+
+    def test_normalize_and_needs_rehash(self):
+        self.assertEqual(passwords.normalize_method("scrypt"), "scrypt:32768:8:1")
+        self.assertEqual(passwords.normalize_method("pbkdf2"), "pbkdf2:sha256:600000")
+        with self.assertRaises(ValueError):
+            passwords.normalize_method("scrypt:1000:8:1")
+        with self.assertRaises(ValueError):
+            passwords.normalize_method("md5")
+
+        stored = generate_password_hash("pw", method="pbkdf2:sha256:1000")
+        self.assertEqual(passwords.hash_method(stored), "pbkdf2:sha256:1000")
+        self.assertTrue(passwords.needs_rehash(stored, "scrypt:32768:8:1"))
+        self.assertFalse(passwords.needs_rehash(stored, "pbkdf2:sha256:1000"))
+        self.assertTrue(passwords.needs_rehash("not-a-hash", "scrypt:32768:8:1"))
+
+    def test_login_upgrades_outdated_hash(self):
+        with self.app.app_context():
+            user = User(email="legacy@example.com")
+            user.password_hash = generate_password_hash("password123", method="pbkdf2:sha256:1000")
+            db.session.add(user)
+            db.session.commit()
+
+        # A wrong password never touches the stored hash.
+        self._login("legacy@example.com", "wrong")
+        with self.app.app_context():
+            user = User.query.filter_by(email="legacy@example.com").one()
+            self.assertTrue(user.password_hash.startswith("pbkdf2:sha256:1000$"))
+
+        resp = self._login("legacy@example.com", "password123")
+        self.assertEqual(resp.status_code, 302)
+        with self.app.app_context():
+            user = User.query.filter_by(email="legacy@example.com").one()
+            self.assertTrue(user.password_hash.startswith("scrypt:32768:8:1$"))
+            self.assertFalse(user.password_needs_rehash())
+            upgraded = user.password_hash
+
+        resp = self._login("legacy@example.com", "password123")
+        self.assertEqual(resp.status_code, 302)
+        with self.app.app_context():
+            user = User.query.filter_by(email="legacy@example.com").one()
+            self.assertEqual(user.password_hash, upgraded)
+
+    def test_configured_policy_applies_to_new_hashes(self):
+        with self.app.app_context():
+            self.app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+            try:
+                user = User(email="policy@example.com")
+                user.set_password("secret")
+                self.assertTrue(user.password_hash.startswith("pbkdf2:sha256:2000$"))
+                self.assertTrue(user.check_password("secret"))
+                self.assertFalse(user.check_password("other"))
+            finally:
+                self.app.config["PASSWORD_HASH_METHOD"] = passwords.DEFAULT_METHOD
+
+    @unittest.skipIf(passwords.bcrypt is None, "bcrypt not installed")
+    def test_bcrypt_policy(self):
+        stored = passwords.hash_password("secret", "bcrypt:4")
+        self.assertEqual(passwords.hash_method(stored), "bcrypt:4")
+        self.assertTrue(passwords.verify_password(stored, "secret"))
+        self.assertTrue(passwords.needs_rehash(stored, "bcrypt:12"))
+
+    def test_calibrate_never_goes_below_default(self):
+        seen = []
+        method, seconds = passwords.calibrate("pbkdf2", 0.001, samples=1, progress=lambda m, s: seen.append(m))
+        self.assertEqual(method, "pbkdf2:sha256:600000")
+        self.assertEqual(seen[0], "pbkdf2:sha256:600000")
+        self.assertGreater(seconds, 0)
+
+        result = self.app.test_cli_runner().invoke(args=["calibrate-password-hash", "--algorithm", "pbkdf2", "--target-ms", "1", "--samples", "1"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("PASSWORD_HASH_METHOD=pbkdf2:sha256:600000", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
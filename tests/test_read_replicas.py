@@ -0,0 +1,131 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, select, update
+
+from app import create_app
+from app.extensions import db
+from app.models import Product, User
+from app.utils.read_replicas import STICKY_KEY
+
+
+class ReadReplicaTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        cls.primary_path = os.path.join(cls.tempdir.name, "primary.db")
+        cls.replica_path = os.path.join(cls.tempdir.name, "replica.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{cls.primary_path}"
+        os.environ["SECRET_KEY"] = "replica-test-secret"
+        os.environ["DATABASE_REPLICA_URLS"] = f"sqlite:///{cls.replica_path}"
+
+        cls.app = create_app()
+        # Registering a webhook serves as the POST; its URL is never called.
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True, WEBHOOK_ALLOW_PRIVATE=True)
+        os.environ.pop("DATABASE_REPLICA_URLS")
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        for engine in cls.app.extensions["db_replicas"]:
+            engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(email="alice@example.com", escrow_balance=100)
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+            db.session.remove()
+            db.engine.dispose()
+        for engine in self.app.extensions["db_replicas"]:
+            engine.dispose()
+        # The replica is a snapshot of the primary as it is now.
+        shutil.copyfile(self.primary_path, self.replica_path)
+
+        self.client = self.app.test_client()
+        self.token = re.search(
+            r'name="csrf-token" content="([^"]+)"', self.client.get("/login").get_data(as_text=True)
+        ).group(1)
+        self.client.post("/login", data={"email": "alice@example.com", "password": "password123", "csrf_token": self.token})
+
+        # A write the replica has not caught up with.
+        with self.app.app_context():
+            db.session.execute(update(User).where(User.id == self.user_id).values(escrow_balance=250))
+            db.session.commit()
+
+    def _balance(self):
+        return self.client.get("/api/escrow/wallet").get_json()["balance"]
+
+    def _forget_stickiness(self):
+        with self.client.session_transaction() as sess:
+            sess.pop(STICKY_KEY, None)
+
+    def test_reads_follow_the_users_own_post(self):
+        # Just logged in: reads stick to the primary.
+        self.assertEqual(self._balance(), 250)
+
+        self._forget_stickiness()
+        self.assertEqual(self._balance(), 100)
+
+        resp = self.client.post("/api/webhooks", json={"url": "http://127.0.0.1:9/hook"}, headers={"X-CSRFToken": self.token})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self._balance(), 250)
+
+    def test_user_cache_is_filled_from_the_primary(self):
+        with self.app.app_context():
+            db.session.execute(update(User).where(User.id == self.user_id).values(first_name="Alicia"))
+            db.session.commit()
+        self._forget_stickiness()
+        cache = self.app.extensions["user_cache"]
+        cache.clear()
+
+        # This GET reads the replica, which still has no first name.
+        self.assertEqual(self._balance(), 100)
+        self.assertEqual(cache.get(self.user_id)["first_name"], "Alicia")
+
+    def test_stickiness_expires(self):
+        self.app.config["REPLICA_STICKY_SECONDS"] = 0
+        try:
+            self.client.post("/api/webhooks", json={"url": "http://127.0.0.1:9/hook"}, headers={"X-CSRFToken": self.token})
+            self._forget_stickiness()
+            self.client.post("/api/webhooks", json={"url": "http://127.0.0.1:9/hook2"}, headers={"X-CSRFToken": self.token})
+            self.assertEqual(self._balance(), 100)
+        finally:
+            self.app.config["REPLICA_STICKY_SECONDS"] = 10
+
+    def test_routing_by_request_method_and_writes(self):
+        with self.app.app_context():
+            primary, replica = db.engine, self.app.extensions["db_replicas"][0]
+            self.assertIs(db.session.get_bind(), primary)
+
+        with self.app.test_request_context("/dashboard", method="POST"):
+            self.assertIs(db.session.get_bind(), primary)
+
+        with self.app.test_request_context("/dashboard", method="GET"):
+            self.assertIs(db.session.get_bind(), replica)
+            self.assertEqual(db.session.get(User, self.user_id).escrow_balance, 100)
+            # A GET that writes sends the write, and everything after it, to the primary.
+            db.session.add(Product(seller_id=self.user_id, sku="P-1", title="Pipe", price_per_unit=3, unit="m"))
+            db.session.commit()
+            self.assertIs(db.session.get_bind(), primary)
+            self.assertEqual(db.session.scalar(select(User.escrow_balance).where(User.id == self.user_id)), 250)
+
+        for path, expected in ((self.primary_path, ["P-1"]), (self.replica_path, [])):
+            engine = create_engine(f"sqlite:///{path}")
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(select(Product.sku)).scalars().all(), expected)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import MetaData, create_engine, inspect, text
+
+from app import create_app
+from app.extensions import db
+from app.utils.schema import (
+    SchemaUpgradeError,
+    column_ddl,
+    ensure_schema,
+    read_stamp,
+    schema_fingerprint,
+    upgrade_schema,
+)
+
+
+class SchemaStampTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "schema-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "schema-test-secret"
+        cls.app = create_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_current_stamp_skips_ddl(self):
+        self.assertTrue(self.app.extensions["schema_upgraded"])
+        with self.app.app_context():
+            self.assertEqual(read_stamp(db.engine), schema_fingerprint())
+            self.assertFalse(ensure_schema(db.engine))
+
+    def test_stale_stamp_adds_missing_columns(self):
+        with self.app.app_context():
+            db.session.execute(db.text('ALTER TABLE "product" DROP COLUMN "payment_terms"'))
+            db.session.execute(db.text("UPDATE chainport_schema SET fingerprint = 'old'"))
+            db.session.commit()
+
+            self.assertTrue(ensure_schema(db.engine))
+            columns = {c["name"] for c in inspect(db.engine).get_columns("product")}
+            self.assertIn("payment_terms", columns)
+            self.assertFalse(ensure_schema(db.engine))
+
+    def test_added_columns_keep_not_null_default_and_foreign_key(self):
+        metadata = MetaData()
+        db.Table("user", metadata, db.Column("id", db.Integer, primary_key=True))
+        table = db.Table(
+            "gadget",
+            metadata,
+            db.Column("id", db.Integer, primary_key=True),
+            db.Column("status", db.String(10), nullable=False, server_default="new"),
+            db.Column("owner_id", db.Integer, db.ForeignKey("user.id")),
+            db.Column("code", db.String(10), unique=True),
+        )
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TABLE "user" (id INTEGER PRIMARY KEY)')
+            conn.exec_driver_sql("CREATE TABLE gadget (id INTEGER PRIMARY KEY)")
+            conn.exec_driver_sql("INSERT INTO gadget (id) VALUES (1)")
+            upgrade_schema(conn, [table])
+            columns = {c["name"]: c for c in inspect(conn).get_columns("gadget")}
+            self.assertFalse(columns["status"]["nullable"])
+            self.assertEqual(conn.scalar(text("SELECT status FROM gadget")), "new")
+            self.assertEqual(inspect(conn).get_foreign_keys("gadget")[0]["referred_table"], "user")
+            conn.exec_driver_sql("INSERT INTO gadget (id, code) VALUES (2, 'x')")
+            with self.assertRaises(Exception):
+                conn.exec_driver_sql("INSERT INTO gadget (id, code) VALUES (3, 'x')")
+
+        column = db.Column("required", db.String(10), nullable=False)
+        db.Table("widget", MetaData(), db.Column("id", db.Integer, primary_key=True), column)
+        with self.assertRaises(SchemaUpgradeError):
+            column_ddl(column, engine.dialect)
+
+    def test_concurrent_upgrades_run_once(self):
+        with self.app.app_context():
+            engine = db.engine
+            with engine.begin() as conn:
+                conn.exec_driver_sql('ALTER TABLE "product" DROP COLUMN "payment_terms"')
+                conn.exec_driver_sql("UPDATE chainport_schema SET fingerprint = 'old'")
+
+        results, errors = [], []
+
+        def boot():
+            try:
+                results.append(ensure_schema(engine))
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+
+        workers = [threading.Thread(target=boot) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [False, False, False, True])
+        self.assertIn("payment_terms", {c["name"] for c in inspect(engine).get_columns("product")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
-﻿import io
+﻿import hashlib
+import io
 import os
 import re
 import tempfile
@@ -172,8 +173,46 @@ class SecurityAndEscrowTests(unittest.TestCase):
             self.assertEqual(len(docs), 2)
             for doc in docs:
                 self.assertNotEqual(doc.filename, doc.original_filename)
-                self.assertTrue(doc.file_path.startswith(self.upload_dir))
-                self.assertTrue(os.path.exists(doc.file_path))
+                # Stored as a relative, hash-sharded key under the upload root.
+                self.assertFalse(os.path.isabs(doc.file_path))
+                self.assertTrue(doc.file_path.startswith("kyc/"))
+                self.assertTrue(os.path.exists(os.path.join(self.upload_dir, *doc.file_path.split("/"))))
+
+    def test_kyc_upload_is_streamed_hashed_and_size_limited(self):
+        tmp_dir = os.path.join(self.tempdir.name, "upload-tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.app.config.update(UPLOAD_TMP_FOLDER=tmp_dir, KYC_DOCUMENT_MAX_BYTES=1024)
+        self.login(email="buyer@example.com", password="password123")
+        token = self._extract_csrf(self.client.get("/kyc").get_data(as_text=True))
+
+        try:
+            r = self.client.post(
+                "/kyc",
+                data={"csrf_token": token, "document_type": "licence",
+                      "documents": [(io.BytesIO(b"x" * 4096), "big.pdf")]},
+                content_type="multipart/form-data",
+            )
+            self.assertEqual(r.status_code, 302)
+            with self.client.session_transaction() as sess:
+                self.assertIn("big.pdf exceeds", sess["_flashes"][-1][1])
+
+            body = b"%PDF-1.4 licence"
+            self.client.post(
+                "/kyc",
+                data={"csrf_token": token, "document_type": "licence",
+                      "documents": [(io.BytesIO(body), "licence.pdf")]},
+                content_type="multipart/form-data",
+            )
+        finally:
+            self.app.config["KYC_DOCUMENT_MAX_BYTES"] = 10 * 1024 * 1024
+
+        with self.app.app_context():
+            docs = KYCDocument.query.filter_by(document_type="licence").all()
+            self.assertEqual(len(docs), 1)
+            self.assertEqual(docs[0].file_size, len(body))
+            self.assertEqual(docs[0].sha256, hashlib.sha256(body).hexdigest())
+        # Rejected and saved uploads alike leave nothing behind in the temp folder.
+        self.assertEqual(os.listdir(tmp_dir), [])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import base64
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from nacl.signing import SigningKey
+
+from app import create_app
+from app.auth.signed_requests import sign_request
+from app.extensions import db
+from app.models import ApiClient, ApiNonce, Product, User
+
+
+class SignedRequestTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "signed-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "signed-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True)
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            seller = User(email="erp@example.com")
+            seller.set_password("password123")
+            db.session.add(seller)
+            db.session.flush()
+            db.session.add(Product(seller_id=seller.id, sku="P-1", title="Ply", price_per_unit=100, unit="sheet"))
+            db.session.commit()
+
+        cls.signing_key = SigningKey.generate()
+        browser = cls.app.test_client()
+        token = re.search(r'name="csrf-token" content="([^"]+)"', browser.get("/login").get_data(as_text=True)).group(1)
+        browser.post("/login", data={"email": "erp@example.com", "password": "password123", "csrf_token": token})
+        resp = browser.post(
+            "/api/clients",
+            json={"name": "ERP", "public_key": base64.b64encode(bytes(cls.signing_key.verify_key)).decode()},
+            headers={"X-CSRFToken": token},
+        )
+        assert resp.status_code == 201, resp.get_data(as_text=True)
+        cls.key_id = resp.get_json()["key_id"]
+        cls.browser, cls.token = browser, token
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _signed(self, method, path, payload=None, **sign_kwargs):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        headers = sign_request(self.signing_key, self.key_id, method, path, body, **sign_kwargs)
+        client = self.app.test_client()
+        resp = client.open(path, method=method, data=body, headers=headers, content_type="application/json")
+        return resp, headers, body
+
+    def test_signed_requests_skip_session_and_csrf(self):
+        resp, _, _ = self._signed("GET", "/api/products/export?format=jsonl")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('"sku": "P-1"', resp.get_data(as_text=True))
+        self.assertNotIn("Set-Cookie", resp.headers)
+
+        resp, headers, body = self._signed("POST", "/api/products/bulk-update",
+                                           {"filter": {"skus": ["P-1"]}, "price_percent": 10})
+        self.assertEqual(resp.get_json(), {"success": True, "updated": 1})
+
+        # Replaying the exact request is refused.
+        replay = self.app.test_client().post("/api/products/bulk-update", data=body, headers=headers,
+                                             content_type="application/json")
+        self.assertEqual(replay.status_code, 401)
+        self.assertIn("nonce", replay.get_json()["error"])
+        with self.app.app_context():
+            self.assertEqual(Product.query.one().price_per_unit, 110)
+
+    def test_tampered_stale_and_revoked_requests_are_rejected(self):
+        headers = sign_request(self.signing_key, self.key_id, "POST", "/api/products/bulk-update", b'{"is_active": true}')
+        resp = self.app.test_client().post("/api/products/bulk-update", data=b'{"is_active": false}',
+                                           headers=headers, content_type="application/json")
+        self.assertEqual(resp.status_code, 401)
+
+        resp, _, _ = self._signed("GET", "/api/products/export", timestamp=int(time.time()) - 3600)
+        self.assertEqual(resp.status_code, 401)
+
+        # Unsigned requests still need a session.
+        self.assertEqual(self.app.test_client().get("/api/products/export").status_code, 302)
+
+        # Keys cannot register further keys.
+        resp, _, _ = self._signed("POST", "/api/clients", {"name": "x", "public_key": "AA=="})
+        self.assertEqual(resp.status_code, 403)
+
+        self.browser.delete(f"/api/clients/{self.key_id}", headers={"X-CSRFToken": self.token})
+        try:
+            resp, _, _ = self._signed("GET", "/api/products/export")
+            self.assertEqual(resp.status_code, 401)
+        finally:
+            with self.app.app_context():
+                ApiClient.query.update({"is_active": True})
+                db.session.commit()
+
+    def test_nonces_and_revocation_are_shared_between_workers(self):
+        # A second app on the same database stands in for another worker.
+        other = create_app()
+        other.config.update(TESTING=True)
+
+        path = "/api/products/export?format=jsonl"
+        headers = sign_request(self.signing_key, self.key_id, "GET", path)
+        self.assertEqual(self.app.test_client().get(path, headers=headers).status_code, 200)
+        replay = other.test_client().get(path, headers=headers)
+        self.assertEqual(replay.status_code, 401)
+        self.assertIn("nonce", replay.get_json()["error"])
+
+        # The other worker has the key cached; revoking it here still locks it out there.
+        headers = sign_request(self.signing_key, self.key_id, "GET", path)
+        self.assertEqual(other.test_client().get(path, headers=headers).status_code, 200)
+        self.browser.delete(f"/api/clients/{self.key_id}", headers={"X-CSRFToken": self.token})
+        try:
+            headers = sign_request(self.signing_key, self.key_id, "GET", path)
+            resp = other.test_client().get(path, headers=headers)
+            self.assertEqual(resp.status_code, 401)
+            self.assertIn("revoked", resp.get_json()["error"])
+        finally:
+            with self.app.app_context():
+                ApiClient.query.update({"is_active": True})
+                db.session.commit()
+
+        # Nonces older than the timestamp window are pruned.
+        with self.app.app_context():
+            ApiNonce.query.update({"seen_at": int(time.time()) - 3600})
+            db.session.commit()
+        other.config["API_NONCE_PRUNE_INTERVAL"] = 0
+        headers = sign_request(self.signing_key, self.key_id, "GET", path)
+        self.assertEqual(other.test_client().get(path, headers=headers).status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(ApiNonce.query.count(), 1)
+        with other.app_context():
+            db.engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import re
+import tempfile
+import unittest
+
+from app import create_app
+from app.extensions import db
+from app.models import Message, User
+
+
+class SQLProfilerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "profiler-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "profiler-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(
+            TESTING=True,
+            SQL_PROFILING=True,
+            SQL_PROFILING_N_PLUS_ONE_THRESHOLD=3,
+            SQL_PROFILING_TOKEN="perf-token",
+        )
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            me = User(email="me@example.com", first_name="Me")
+            me.set_password("password123")
+            db.session.add(me)
+            db.session.commit()
+            for i in range(4):
+                other = User(email=f"other{i}@example.com", first_name=f"Other{i}")
+                other.set_password("x")
+                db.session.add(other)
+                db.session.commit()
+                db.session.add(Message(sender_id=other.id, receiver_id=me.id, content="hi"))
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def tearDown(self):
+        self.app.config["SQL_PROFILING"] = True
+
+    def login(self):
+        page = self.client.get("/login")
+        token = re.search(r'name="csrf-token" content="([^"]+)"', page.get_data(as_text=True)).group(1)
+        self.client.post(
+            "/login",
+            data={"email": "me@example.com", "password": "password123", "csrf_token": token},
+        )
+
+    def test_headers_report_queries_and_n_plus_one(self):
+        self.login()
+        resp = self.client.get("/messages")
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(int(resp.headers["X-SQL-Queries"]), 4)
+        self.assertIn("X-SQL-Time-ms", resp.headers)
+        self.assertGreaterEqual(int(resp.headers["X-SQL-N-Plus-One"]), 1)
+
+        page = self.client.get("/debug/perf", headers={"Authorization": "Bearer perf-token"})
+        self.assertEqual(page.status_code, 200)
+        body = page.get_data(as_text=True)
+        self.assertIn("/messages", body)
+        self.assertIn("N+1", body)
+
+    def test_perf_page_requires_token_outside_debug_mode(self):
+        self.assertEqual(self.client.get("/debug/perf").status_code, 401)
+        self.assertEqual(
+            self.client.get("/debug/perf", headers={"Authorization": "Bearer wrong"}).status_code, 401
+        )
+        self.app.config["SQL_PROFILING_TOKEN"] = None
+        try:
+            self.assertEqual(self.client.get("/debug/perf").status_code, 404)
+            self.app.debug = True
+            self.assertEqual(self.client.get("/debug/perf").status_code, 200)
+        finally:
+            self.app.debug = False
+            self.app.config["SQL_PROFILING_TOKEN"] = "perf-token"
+
+    def test_disabled_profiling_is_inert(self):
+        self.app.config["SQL_PROFILING"] = False
+        resp = self.client.get("/marketplace")
+        self.assertNotIn("X-SQL-Queries", resp.headers)
+        self.assertEqual(self.client.get("/debug/perf").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
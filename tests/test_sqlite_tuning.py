@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from app import create_app
+from app.extensions import db
+from app.utils.sqlite_tuning import engine_options, profile_pragmas, tune
+
+
+def _pragmas(engine):
+    with engine.connect() as conn:
+        return {
+            name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size", "temp_store")
+        }
+
+
+class SQLiteTuningTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tempdir.name, 'tuning-test.db')}"
+        os.environ["SECRET_KEY"] = "tuning-test-secret"
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _app(self, profile):
+        os.environ["SQLITE_PROFILE"] = profile
+        try:
+            app = create_app()
+        finally:
+            os.environ.pop("SQLITE_PROFILE")
+        self.addCleanup(self._dispose, app)
+        return app
+
+    @staticmethod
+    def _dispose(app):
+        with app.app_context():
+            db.engine.dispose()
+
+    def test_production_profile_applies_to_every_connection(self):
+        app = self._app("production")
+        with app.app_context():
+            self.assertEqual(
+                _pragmas(db.engine),
+                {
+                    "journal_mode": "wal",
+                    "synchronous": 1,
+                    "busy_timeout": 5000,
+                    "mmap_size": 256 * 1024 * 1024,
+                    "cache_size": -64 * 1024,
+                    "temp_store": 2,
+                },
+            )
+            options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+            self.assertEqual((options["pool_size"], options["max_overflow"]), (16, 16))
+            self.assertEqual(db.engine.pool.size(), 16)
+
+    def test_default_profile_leaves_sqlite_alone(self):
+        app = self._app("default")
+        with app.app_context():
+            pragmas = _pragmas(db.engine)
+        self.assertEqual(pragmas["journal_mode"], "delete")
+        self.assertEqual(pragmas["synchronous"], 2)
+
+    def test_overrides_and_validation(self):
+        pragmas = profile_pragmas("production", {"busy_timeout": 250, "foreign_keys": "ON"})
+        self.assertEqual((pragmas["busy_timeout"], pragmas["foreign_keys"]), (250, "ON"))
+        with self.assertRaises(ValueError):
+            profile_pragmas("turbo")
+        with self.assertRaises(ValueError):
+            profile_pragmas("default", {"cache_size": "1; DROP TABLE user"})
+
+        self.assertEqual(engine_options("sqlite://", 4, 4, 5), {})
+        engine = create_engine("sqlite://")
+        tune(engine, {"temp_store": "MEMORY"})
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA temp_store").scalar(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import io
+import os
+import tempfile
+import unittest
+
+from app import create_app
+from app.extensions import db
+from app.models import KYCDocument, Message, MessageAttachment, Product, User
+from app.utils.storage import LocalStorage, ObjectStorage, Storage, create_storage, make_key
+from app.utils.storage_migrate import copy_storage, migrate_legacy_uploads
+
+
+class StorageTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "storage-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "storage-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(
+            TESTING=True,
+            WTF_CSRF_ENABLED=False,
+            UPLOAD_FOLDER=os.path.join(cls.tempdir.name, "uploads"),
+            UPLOAD_TMP_FOLDER=os.path.join(cls.tempdir.name, "tmp"),
+        )
+        os.makedirs(cls.app.config["UPLOAD_TMP_FOLDER"])
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            alice = User(email="alice@example.com")
+            bob = User(email="bob@example.com")
+            alice.set_password("password123")
+            bob.set_password("password123")
+            db.session.add_all([alice, bob])
+            db.session.commit()
+            cls.alice_id, cls.bob_id = alice.id, bob.id
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_keys_are_sharded_and_validated(self):
+        key = make_key("messages", "invoice-abc.pdf")
+        self.assertRegex(key, r"^messages/[0-9a-f]{2}/[0-9a-f]{2}/invoice-abc\.pdf$")
+        with self.assertRaises(ValueError):
+            make_key("tmp", "x.pdf")
+
+        storage = LocalStorage(self.tempdir.name)
+        self.assertFalse(storage.exists("kyc/../../storage-test.db"))
+        with self.assertRaises(ValueError):
+            storage.save_stream(io.BytesIO(b"x"), "../escape.txt")
+
+    def test_incomplete_backend_cannot_be_instantiated(self):
+        class PathOnly(Storage):
+            def path_for(self, key):
+                return key
+
+        with self.assertRaises(TypeError):
+            PathOnly(self.tempdir.name)
+
+    def test_legacy_paths_migrate_and_backends_are_interchangeable(self):
+        legacy_dir = os.path.join(self.tempdir.name, "legacy")
+        images_dir = os.path.join(legacy_dir, "products")
+        os.makedirs(images_dir)
+        kyc_path = os.path.join(legacy_dir, "passport-1.pdf")
+        attachment_path = os.path.join(legacy_dir, "quote-1.pdf")
+        for path, body in ((kyc_path, b"passport"), (attachment_path, b"quote")):
+            with open(path, "wb") as f:
+                f.write(body)
+        for name in ("1.png", "1_thumb.jpg"):
+            with open(os.path.join(images_dir, name), "wb") as f:
+                f.write(name.encode())
+
+        with self.app.app_context():
+            product = Product(seller_id=self.alice_id, title="Ply", price_per_unit=1, unit="kg")
+            message = Message(sender_id=self.alice_id, receiver_id=self.bob_id, content="quote")
+            db.session.add_all([product, message])
+            db.session.flush()
+            self.assertEqual(product.id, 1)
+            db.session.add_all([
+                KYCDocument(user_id=self.alice_id, document_type="passport", filename="passport-1.pdf",
+                            original_filename="passport.pdf", file_path=kyc_path),
+                MessageAttachment(message_id=message.id, filename="quote-1.pdf", original_filename="quote.pdf",
+                                  file_path=attachment_path, content_type="application/pdf"),
+            ])
+            db.session.commit()
+
+            storage = create_storage(self.app)
+            report = migrate_legacy_uploads(storage, images_dir)
+            self.assertEqual((report["moved"], report["missing"]), (3, []))
+            self.assertEqual(os.listdir(images_dir), [])
+            self.assertFalse(os.path.exists(kyc_path))
+
+            attachment = MessageAttachment.query.one()
+            self.assertTrue(attachment.file_path.startswith("messages/"))
+            self.assertEqual(attachment.file_size, 5)
+            image_key = db.session.get(Product, 1).image_key
+            with storage.open(image_key) as f:
+                self.assertEqual(f.read(), b"1_thumb.jpg")
+
+            object_store = ObjectStorage(os.path.join(self.tempdir.name, "objects"))
+            self.assertEqual(copy_storage(storage, object_store), (3, 0))
+            self.assertEqual(copy_storage(storage, object_store), (0, 3))
+            attachment_key = attachment.file_path
+
+        # Same keys, different backend: downloads and images still resolve.
+        self.app.extensions["storage"] = object_store
+        try:
+            client = self.app.test_client()
+            client.post("/login", data={"email": "bob@example.com", "password": "password123"})
+            with self.app.app_context():
+                attachment_id = MessageAttachment.query.one().id
+            resp = client.get(f"/messages/attachment/{attachment_id}")
+            self.assertEqual(resp.get_data(), b"quote")
+            self.assertEqual(resp.mimetype, "application/pdf")
+            resp.close()
+            resp = client.get(f"/media/{image_key}")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("immutable", resp.headers["Cache-Control"])
+            resp.close()
+            self.assertEqual(client.get(f"/media/{attachment_key}").status_code, 404)
+        finally:
+            self.app.extensions.pop("storage")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import re
+import tempfile
+import unittest
+
+from sqlalchemy import update
+
+from app import create_app
+from app.catalog.bulk import bulk_update_products
+from app.catalog.importer import import_products
+from app.escrow.simulator import EscrowSimulator
+from app.extensions import db
+from app.models import EscrowTransaction, Message, Product, Trade, User
+from app.utils import change_seq
+
+
+class DeltaSyncTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "sync-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "sync-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            users = [User(email=f"{name}@example.com", escrow_balance=500) for name in ("alice", "bob", "carol")]
+            for user in users:
+                user.set_password("password123")
+            db.session.add_all(users)
+            db.session.commit()
+            self.alice, self.bob, self.carol = (u.id for u in users)
+
+            db.session.add_all([
+                Product(seller_id=self.bob, sku="B-1", title="Bolts", price_per_unit=2, unit="kg"),
+                Product(seller_id=self.carol, sku="C-1", title="Cable", price_per_unit=5, unit="m"),
+                Trade(buyer_id=self.alice, seller_id=self.bob, quantity=1, price_per_unit=10, total_amount=10),
+                Trade(buyer_id=self.bob, seller_id=self.carol, quantity=1, price_per_unit=10, total_amount=10),
+                Message(sender_id=self.bob, receiver_id=self.alice, content="hi alice"),
+                Message(sender_id=self.bob, receiver_id=self.carol, content="hi carol"),
+            ])
+            db.session.commit()
+            EscrowSimulator().deposit_to_wallet(db.session.get(User, self.alice), 50)
+
+        self.client = self.app.test_client()
+        token = re.search(r'name="csrf-token" content="([^"]+)"', self.client.get("/login").get_data(as_text=True)).group(1)
+        self.client.post("/login", data={"email": "alice@example.com", "password": "password123", "csrf_token": token})
+
+    def _sync(self, since=0, limit=None):
+        query = f"/api/sync?since={since}" + (f"&limit={limit}" if limit else "")
+        resp = self.client.get(query)
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()
+
+    def test_writes_are_stamped_with_increasing_sequence(self):
+        with self.app.app_context():
+            stamps = [
+                row.change_seq
+                for model in (Product, Trade, Message, EscrowTransaction)
+                for row in model.query.all()
+            ]
+            self.assertNotIn(None, stamps)
+            self.assertEqual(len(set(stamps)), len(stamps))
+
+            trade = Trade.query.filter_by(buyer_id=self.alice).one()
+            before = trade.change_seq
+            trade.status = "in_progress"
+            db.session.commit()
+            self.assertGreater(trade.change_seq, max(stamps))
+            self.assertGreater(trade.change_seq, before)
+
+    def test_sync_returns_only_visible_changes(self):
+        page = self._sync()
+        self.assertFalse(page["more"])
+        self.assertEqual(len(page["trades"]), 1)
+        self.assertEqual([m["content"] for m in page["messages"]], ["hi alice"])
+        self.assertEqual([tx["transaction_type"] for tx in page["escrow_transactions"]], ["deposit"])
+        self.assertEqual({p["sku"] for p in page["products"]}, {"B-1", "C-1"})
+
+        # Nothing new since the cursor.
+        empty = self._sync(page["next"])
+        self.assertEqual(empty["next"], page["next"])
+        self.assertFalse(any(empty[name] for name in ("trades", "messages", "escrow_transactions", "products")))
+
+        with self.app.app_context():
+            message = Message.query.filter_by(content="hi alice").one()
+            message.is_read = True
+            Product.query.filter_by(sku="C-1").one().is_active = False
+            db.session.commit()
+        delta = self._sync(page["next"])
+        self.assertEqual([(m["content"], m["is_read"]) for m in delta["messages"]], [("hi alice", True)])
+        # Someone else's withdrawn listing comes back as a bare tombstone.
+        self.assertEqual(delta["products"], [{"id": delta["products"][0]["id"], "change_seq": delta["products"][0]["change_seq"], "is_active": False}])
+
+    def test_paging_never_skips_or_repeats(self):
+        with self.app.app_context():
+            for i in range(7):
+                db.session.add(Message(sender_id=self.bob, receiver_id=self.alice, content=f"m{i}"))
+                db.session.add(Trade(buyer_id=self.alice, seller_id=self.carol, quantity=1, price_per_unit=i + 1, total_amount=i + 1))
+            db.session.commit()
+
+        full = self._sync(limit=1000)
+        seen, since, pages = [], 0, 0
+        while True:
+            page = self._sync(since, limit=3)
+            pages += 1
+            for name in ("trades", "messages", "escrow_transactions", "products"):
+                seen.extend((name, row["id"]) for row in page[name])
+            since = page["next"]
+            if not page["more"]:
+                break
+        expected = [(name, row["id"]) for name in ("trades", "messages", "escrow_transactions", "products") for row in full[name]]
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertGreater(pages, 3)
+
+    def test_bulk_writes_and_backfill_are_stamped(self):
+        with self.app.app_context():
+            start = change_seq.current(db.session.connection())
+            db.session.commit()
+            self.assertEqual(bulk_update_products(self.bob, {}, {"price_percent": 10}), 1)
+            import_products(self.carol, iter([(2, {"sku": "C-2", "title": "Clamp", "price_per_unit": "3", "unit": "pcs"})]))
+            stamps = sorted(p.change_seq for p in Product.query.filter(Product.sku.in_(["B-1", "C-2"])))
+            self.assertGreater(stamps[0], start)
+            self.assertEqual(len(set(stamps)), 2)
+
+            # Rows from before sequencing existed are picked up by the backfill.
+            db.session.execute(update(Message).values(change_seq=None))
+            db.session.commit()
+            with db.engine.begin() as conn:
+                self.assertEqual(change_seq.backfill(conn), 2)
+            self.assertEqual(Message.query.filter(Message.change_seq.is_(None)).count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from app import create_app
+from app.extensions import db
+
+
+class TemplateBytecodeCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "template-cache-test.db")
+        cls.cache_dir = os.path.join(cls.tempdir.name, "jinja_cache")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "template-cache-test-secret"
+        os.environ["TEMPLATE_CACHE_DIR"] = cls.cache_dir
+        try:
+            cls.builder = create_app()
+            cls.worker = create_app()
+        finally:
+            os.environ.pop("TEMPLATE_CACHE_DIR")
+
+    @classmethod
+    def tearDownClass(cls):
+        for app in (cls.builder, cls.worker):
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def test_precompiled_bytecode_is_loaded_by_another_app(self):
+        with self.builder.app_context():
+            result = self.builder.test_cli_runner().invoke(args=["precompile-templates"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        files = [name for name in os.listdir(self.cache_dir) if name.startswith("__jinja2_")]
+        self.assertGreater(len(files), 5)
+        self.assertIn(f"into {self.cache_dir}", result.output)
+
+        env = self.worker.jinja_env
+        compiled = []
+        cache = env.bytecode_cache
+        original_dump = cache.dump_bytecode
+        cache.dump_bytecode = lambda bucket: (compiled.append(bucket.key), original_dump(bucket))
+        try:
+            source, filename, _uptodate = env.loader.get_source(env, "index.html")
+            self.assertIsNotNone(cache.get_bucket(env, "index.html", filename, source).code)
+            env.get_template("index.html")
+        finally:
+            cache.dump_bytecode = original_dump
+        self.assertEqual(compiled, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import socket
+import threading
+import unittest
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from app import create_app
+from app.escrow.simulator import EscrowSimulator
+from app.extensions import db
+from app.models import Trade, TradeEvent, User, WebhookSubscription
+from app.trades import webhooks
+from app.trades.webhooks import _utcnow, deliver_due, post_batch
+
+
+class WebhookReceiver:
+    """A local HTTP endpoint that records posts and answers with queued statuses."""
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                receiver.requests.append((self.path, self.headers, body))
+                status = receiver.statuses.pop(0) if receiver.statuses else 200
+                # (302, "/elsewhere") answers with a redirect.
+                status, location = status if isinstance(status, tuple) else (status, None)
+                self.send_response(status)
+                if location:
+                    self.send_header("Location", location)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def batches(self):
+        return [json.loads(body)["events"] for _path, _headers, body in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TradeEventTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "events-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "events-test-secret"
+
+        cls.app = create_app()
+        # The test receiver listens on 127.0.0.1.
+        cls.app.config.update(TESTING=True, WTF_CSRF_ENABLED=True, WEBHOOK_TIMEOUT=2, WEBHOOK_ALLOW_PRIVATE=True)
+        cls.receiver = WebhookReceiver()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.receiver.close()
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        self.receiver.requests.clear()
+        self.receiver.statuses.clear()
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            buyer = User(email="buyer@example.com", escrow_balance=1000)
+            buyer.set_password("password123")
+            seller = User(email="seller@example.com")
+            seller.set_password("password123")
+            db.session.add_all([buyer, seller])
+            db.session.commit()
+            self.buyer_id, self.seller_id = buyer.id, seller.id
+
+    def _trade(self):
+        trade = Trade(
+            buyer_id=self.buyer_id,
+            seller_id=self.seller_id,
+            quantity=10,
+            unit="pcs",
+            price_per_unit=10,
+            total_amount=100,
+        )
+        db.session.add(trade)
+        db.session.commit()
+        return trade
+
+    def _login(self, email):
+        client = self.app.test_client()
+        token = re.search(r'name="csrf-token" content="([^"]+)"', client.get("/login").get_data(as_text=True)).group(1)
+        client.post("/login", data={"email": email, "password": "password123", "csrf_token": token})
+        return client, token
+
+    def _subscribe(self, client, token):
+        resp = client.post("/api/webhooks", json={"url": self.receiver.url}, headers={"X-CSRFToken": token})
+        self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+        return resp.get_json()
+
+    def test_changes_are_logged_in_the_same_transaction(self):
+        client, token = self._login("seller@example.com")
+        with self.app.app_context():
+            trade = self._trade()
+            EscrowSimulator().deposit_to_trade(db.session.get(User, self.buyer_id), trade, 40)
+            trade_id = trade.id
+
+            # A change that is rolled back leaves no event behind.
+            trade.status = "disputed"
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(TradeEvent.query.count(), 2)
+
+        resp = client.post(f"/api/trade/{trade_id}/status", json={"status": "in_progress"}, headers={"X-CSRFToken": token})
+        self.assertEqual(resp.status_code, 200)
+        # Setting the current status again is not a change.
+        client.post(f"/api/trade/{trade_id}/status", json={"status": "in_progress"}, headers={"X-CSRFToken": token})
+
+        events = client.get(f"/api/trade/{trade_id}/events").get_json()["events"]
+        self.assertEqual(
+            [(e["type"], e["old_status"], e["new_status"]) for e in events],
+            [
+                ("trade.created", None, "pending"),
+                ("trade.status_changed", "pending", "escrow_deposited"),
+                ("trade.status_changed", "escrow_deposited", "in_progress"),
+            ],
+        )
+        self.assertEqual(events[1]["trade"]["escrow_amount"], 40)
+        self.assertEqual(events[2]["actor_id"], self.seller_id)
+
+    def test_batched_delivery_with_signature(self):
+        client, token = self._login("seller@example.com")
+        secret = self._subscribe(client, token)["secret"]
+        with self.app.app_context():
+            self.app.config["WEBHOOK_BATCH_SIZE"] = 2
+            try:
+                trade = self._trade()
+                for status in ("in_progress", "disputed", "completed"):
+                    trade.status = status
+                    db.session.commit()
+                report = deliver_due()
+            finally:
+                self.app.config["WEBHOOK_BATCH_SIZE"] = 100
+            self.assertEqual((report["events"], report["batches"]), (4, 2))
+            self.assertEqual(deliver_due()["batches"], 0)
+
+        batches = self.receiver.batches()
+        self.assertEqual([len(b) for b in batches], [2, 2])
+        self.assertEqual(
+            [e["new_status"] for b in batches for e in b], ["pending", "in_progress", "disputed", "completed"]
+        )
+        _path, headers, body = self.receiver.requests[0]
+        expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        self.assertEqual(headers["X-ChainPort-Signature"], expected)
+
+    def test_failed_delivery_backs_off_and_retries(self):
+        client, token = self._login("buyer@example.com")
+        self._subscribe(client, token)
+        self.receiver.statuses[:] = [500, 503]
+        with self.app.app_context():
+            self._trade()
+            now = _utcnow()
+            self.assertEqual(deliver_due(now)["failed"], 1)
+            subscription = WebhookSubscription.query.one()
+            self.assertEqual(subscription.failures, 1)
+            self.assertEqual(subscription.next_attempt_at, now + timedelta(seconds=10))
+
+            # Not due yet: nothing is attempted.
+            self.assertEqual(deliver_due(now + timedelta(seconds=5))["subscriptions"], 0)
+            later = now + timedelta(seconds=10)
+            deliver_due(later)
+            subscription = WebhookSubscription.query.one()
+            self.assertEqual(subscription.failures, 2)
+            self.assertEqual(subscription.next_attempt_at, later + timedelta(seconds=20))
+
+            report = deliver_due(later + timedelta(seconds=20))
+            self.assertEqual((report["events"], report["failed"]), (1, 0))
+            subscription = WebhookSubscription.query.one()
+            self.assertEqual((subscription.failures, subscription.next_attempt_at), (0, None))
+
+        # Every attempt carried the same, still-undelivered event.
+        self.assertEqual(len({body for _path, _headers, body in self.receiver.requests}), 1)
+        self.assertEqual(len(self.receiver.requests), 3)
+
+    def test_private_addresses_and_redirects_are_refused(self):
+        client, token = self._login("seller@example.com")
+        self._subscribe(client, token)
+        self.app.config["WEBHOOK_ALLOW_PRIVATE"] = False
+        try:
+            for url in ("http://127.0.0.1/", "http://localhost:8080/hook", "http://169.254.169.254/latest/meta-data",
+                        "http://[::1]/", "http://10.1.2.3/"):
+                resp = client.post("/api/webhooks", json={"url": url}, headers={"X-CSRFToken": token})
+                self.assertEqual(resp.status_code, 400, url)
+                self.assertIn("non-public", resp.get_json()["error"])
+
+            # A subscription whose host now resolves privately is not called.
+            with self.app.app_context():
+                self._trade()
+                self.assertEqual(deliver_due()["failed"], 1)
+                self.assertIn("non-public", WebhookSubscription.query.one().last_error)
+            self.assertEqual(self.receiver.requests, [])
+        finally:
+            self.app.config["WEBHOOK_ALLOW_PRIVATE"] = True
+
+        # Redirects are not followed, even to an allowed host.
+        self.receiver.statuses[:] = [(302, "/internal")]
+        with self.app.app_context():
+            report = deliver_due(_utcnow() + timedelta(hours=1))
+            self.assertEqual(report["failed"], 1)
+            self.assertIn("302", WebhookSubscription.query.one().last_error)
+        self.assertEqual([path for path, _headers, _body in self.receiver.requests], ["/hook"])
+
+    def test_delivery_connects_to_the_vetted_address(self):
+        port = self.receiver.server.server_address[1]
+        url = f"http://hooks.example.test:{port}/hook"
+
+        def answers(*hosts):
+            calls = iter(hosts)
+
+            def getaddrinfo(host, port, *args, **kwargs):
+                return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(calls), port))]
+
+            return getaddrinfo
+
+        # Public when vetted, loopback on a second lookup: the second lookup never happens.
+        with mock.patch.object(socket, "getaddrinfo", answers("93.184.216.34", "127.0.0.1")), \
+                mock.patch.object(webhooks, "_connect", side_effect=ConnectionRefusedError) as connect:
+            with self.assertRaises(OSError):
+                post_batch(url, b"{}", {}, timeout=2)
+        self.assertEqual(connect.call_args[0][0], [(socket.AF_INET, ("93.184.216.34", port))])
+        self.assertEqual(self.receiver.requests, [])
+
+        # The connection goes to the address that was checked, with the hostname as Host.
+        with mock.patch.object(socket, "getaddrinfo", answers("127.0.0.1", "10.255.255.1")):
+            self.assertEqual(post_batch(url, b"{}", {}, timeout=2, allow_private=True), 200)
+        self.assertEqual(self.receiver.requests[0][1]["Host"], f"hooks.example.test:{port}")
+
+
+if __name__ == "__main__":
+    unittest.main()
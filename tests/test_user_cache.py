@@ -0,0 +1,149 @@
+import os
+import re
+import tempfile
+import unittest
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+
+class UserCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "user-cache-test.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "user-cache-test-secret"
+
+        cls.app = create_app()
+        cls.app.config.update(TESTING=True, SQL_PROFILING=True, SQL_PROFILING_SLOWEST=50)
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(email="cached@example.com", first_name="Cached", escrow_balance=0)
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.commit()
+            cls.user_id = user.id
+
+        page = cls.client.get("/login")
+        cls.token = re.search(
+            r'name="csrf-token" content="([^"]+)"', page.get_data(as_text=True)
+        ).group(1)
+        cls.client.post(
+            "/login",
+            data={"email": "cached@example.com", "password": "password123", "csrf_token": cls.token},
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _user_selects(self):
+        stats = self.app.extensions["sql_profiler"][0]
+        return [s for s in stats["slowest"] if "FROM user" in s["statement"]]
+
+    def test_repeat_requests_skip_user_lookup(self):
+        self.client.get("/api/messages/escrow-suggestions")
+        resp = self.client.get("/api/messages/escrow-suggestions")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._user_selects(), [])
+
+    def test_writes_through_cached_user_persist_and_evict(self):
+        self.client.get("/profile")
+        resp = self.client.post(
+            "/escrow/deposit", data={"amount": "40", "csrf_token": self.token}
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.client.post(
+            "/settings",
+            data={
+                "action": "update_profile",
+                "first_name": "Renamed",
+                "csrf_token": self.token,
+            },
+        )
+        with self.app.app_context():
+            user = db.session.get(User, self.user_id)
+            self.assertEqual(user.escrow_balance, 40)
+            self.assertEqual(user.first_name, "Renamed")
+
+        page = self.client.get("/settings").get_data(as_text=True)
+        self.assertIn("Renamed", page)
+
+
+class UserCacheAcrossWorkersTests(unittest.TestCase):
+    """Two app instances on one database stand in for two workers."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tempdir.name, "user-cache-workers.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["SECRET_KEY"] = "user-cache-workers-secret"
+        cls.apps = [create_app(), create_app()]
+        for app in cls.apps:
+            app.config.update(TESTING=True)
+
+        with cls.apps[0].app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(email="wallet@example.com", first_name="Wallet", escrow_balance=0)
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.commit()
+            cls.user_id = user.id
+
+        cls.clients = []
+        for app in cls.apps:
+            client = app.test_client()
+            token = re.search(
+                r'name="csrf-token" content="([^"]+)"', client.get("/login").get_data(as_text=True)
+            ).group(1)
+            client.post("/login", data={"email": "wallet@example.com", "password": "password123", "csrf_token": token})
+            cls.clients.append((client, token))
+
+    @classmethod
+    def tearDownClass(cls):
+        for app in cls.apps:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def _post(self, worker, path, amount):
+        client, token = self.clients[worker]
+        return client.post(path, data={"amount": str(amount), "csrf_token": token})
+
+    def _balance(self):
+        with self.apps[0].app_context():
+            return db.session.scalar(db.select(User.escrow_balance).where(User.id == self.user_id))
+
+    def test_balance_writes_are_not_lost_through_another_workers_cache(self):
+        # Both workers have the user cached with a zero balance.
+        for client, _token in self.clients:
+            self.assertEqual(client.get("/escrow").status_code, 200)
+
+        self._post(0, "/escrow/deposit", 40)
+        self._post(1, "/escrow/deposit", 10)
+        self.assertEqual(self._balance(), 50)
+
+        self._post(0, "/escrow/withdraw", 30)
+        # Worker 1 last saw 50; only 20 is left, so this must not overdraw.
+        self._post(1, "/escrow/withdraw", 40)
+        self.assertEqual(self._balance(), 20)
+        self.assertIn("20.00", self.clients[1][0].get("/escrow").get_data(as_text=True))
+
+        for app in self.apps:
+            snapshot = app.extensions["user_cache"].get(self.user_id)
+            self.assertNotIn("escrow_balance", snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()